@@ -6,9 +6,15 @@ import time
 
 from config.settings import (
     ANTHROPIC_API_KEY, OPENAI_API_KEY,
-    ANALYSIS_MODEL, ANALYSIS_PROVIDER, EXPANSO_CONTEXT, PROBLEM_CATEGORIES
+    ANALYSIS_MODEL, OPENAI_MODEL, EXPANSO_CONTEXT, PROBLEM_CATEGORIES,
+    PRODUCT_PROFILES,
+    GATE_ENABLED, GATE_MODEL_PATH, ANALYSIS_BODY_TOKEN_BUDGET, PROMPT_CACHE_MIN_TOKENS,
+    ANALYSIS_MIN_CONTENT_CHARS, ANALYSIS_MAX_ATTEMPTS,
 )
-from db import get_unanalyzed_posts, insert_analysis
+from db import get_unanalyzed_posts, insert_analysis, record_analysis_failure
+from analysis import cache as response_cache
+from analysis import telemetry
+from analysis.compact import compact_body, estimate_tokens, COMPACT_VERSION
 
 # Lazy imports for API clients
 _anthropic_client = None
@@ -28,30 +34,32 @@ def get_openai():
         _openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
     return _openai_client
 
-ANALYSIS_PROMPT = f"""You are an expert at identifying sales opportunities for Expanso/Bacalhau.
+# Positioning profiles scored alongside the main analysis, in the same call
+PROFILES_SECTION = """
 
-{EXPANSO_CONTEXT}
+Positioning Profiles (also score the post against each of these; fit/urgency mean the same as above, but for that positioning only):
+""" + "\n".join(f"- {name}: {description}" for name, description in PRODUCT_PROFILES.items())
 
-Problem Categories:
-{json.dumps(PROBLEM_CATEGORIES, indent=2)}
+# Prompt pieces shared by the single-post and batched prompts
+PROMPT_HEADER = f"""You are an expert at identifying sales opportunities for Expanso/Bacalhau.
 
-Analyze the following post/comment and determine if the author is experiencing a problem that Expanso/Bacalhau could solve.
+{EXPANSO_CONTEXT}
 
-POST TITLE: {{title}}
-POST BODY: {{body}}
-SOURCE: {{source}}
-URL: {{url}}
+Problem Categories:
+{json.dumps(PROBLEM_CATEGORIES, indent=2)}{PROFILES_SECTION if PRODUCT_PROFILES else ""}"""
 
-Respond in JSON format:
-{{
-  "fit_score": <0-10, how well does this problem match Bacalhau's capabilities?>,
+RESULT_FIELDS = """  "fit_score": <0-10, how well does this problem match Bacalhau's capabilities?>,
   "urgency_score": <0-10, how urgently does this person seem to need a solution?>,
   "use_case": "<category from the list above, e.g. 'ml_inference', 'data_pipelines', etc. Use 'other' if none fit>",
   "problem_summary": "<1-2 sentence summary of the problem they're experiencing>",
-  "reasoning": "<brief explanation of your scoring>"
-}}
+  "reasoning": "<brief explanation of your scoring>\""""
+if PRODUCT_PROFILES:
+    RESULT_FIELDS += """,
+  "profiles": {""" + ", ".join(
+        f'"{name}": {{"fit_score": <0-10>, "urgency_score": <0-10>, "use_case": "<category>"}}'
+        for name in PRODUCT_PROFILES) + "}"
 
-Scoring guidance:
+SCORING_GUIDANCE = """Scoring guidance:
 - 0-3: Not relevant (general tech discussion, different problem domain)
 - 4-6: Potentially relevant (mentions related concepts but unclear fit)
 - 7-8: Good fit (clear problem that Bacalhau could solve)
@@ -61,107 +69,547 @@ For urgency:
 - 0-3: Just exploring/learning
 - 4-6: Has a real need but not pressing
 - 7-8: Active project, needs solution soon
-- 9-10: Production pain point, urgent need
+- 9-10: Production pain point, urgent need"""
+
+POST_TEMPLATE = """POST TITLE: {title}
+POST BODY: {body}
+SOURCE: {source}
+URL: {url}"""
+
+# Static instructions sent as the system prompt. They're identical on every
+# call, so providers can cache them; only the short per-post message varies.
+ANALYSIS_SYSTEM_PROMPT = f"""{PROMPT_HEADER}
+
+You will be given a post/comment. Determine if the author is experiencing a problem that Expanso/Bacalhau could solve.
+
+Respond in JSON format:
+{{
+{RESULT_FIELDS}
+}}
+
+{SCORING_GUIDANCE}
 
 Respond ONLY with the JSON object, no other text."""
 
-def analyze_post_anthropic(title: str, body: str, source: str, url: str) -> Optional[dict]:
-    """Analyze a post using Anthropic Claude"""
-    client = get_anthropic()
-    
-    prompt = ANALYSIS_PROMPT.format(
+ANALYSIS_PROMPT = """Analyze the following post/comment:
+
+{post}"""
+
+def object_schema(properties: dict) -> dict:
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+# Structured output schema for one result (Anthropic tool input / OpenAI json_schema).
+# Range limits are in the descriptions and enforced by validate_result(), since
+# not every provider accepts numeric bounds in strict schemas.
+RESULT_PROPERTIES = {
+    "fit_score": {"type": "integer", "description": "0-10, how well the problem matches Bacalhau's capabilities"},
+    "urgency_score": {"type": "integer", "description": "0-10, how urgently the author needs a solution"},
+    "use_case": {"type": "string", "enum": [*PROBLEM_CATEGORIES, "other"]},
+    "problem_summary": {"type": "string", "description": "1-2 sentence summary of the problem"},
+    "reasoning": {"type": "string", "description": "Brief explanation of the scoring"},
+}
+
+# Per-profile scores, without summary/reasoning to keep output short
+PROFILE_PROPERTIES = {
+    "fit_score": RESULT_PROPERTIES["fit_score"],
+    "urgency_score": RESULT_PROPERTIES["urgency_score"],
+    "use_case": RESULT_PROPERTIES["use_case"],
+}
+if PRODUCT_PROFILES:
+    RESULT_PROPERTIES["profiles"] = object_schema(
+        {name: object_schema(PROFILE_PROPERTIES) for name in PRODUCT_PROFILES}
+    )
+
+ANALYSIS_SCHEMA = object_schema(RESULT_PROPERTIES)
+
+# Tool the model is forced to call, so its input is the structured result
+RESULT_TOOL = "record_analysis"
+
+# Identifies the single-post prompt (including body compaction) in the response cache
+PROMPT_VERSION = response_cache.prompt_version(
+    ANALYSIS_SYSTEM_PROMPT, ANALYSIS_PROMPT, POST_TEMPLATE, json.dumps(ANALYSIS_SCHEMA),
+    f"{COMPACT_VERSION}:{ANALYSIS_BODY_TOKEN_BUDGET}",
+)
+
+def format_post(title: str, body: str, source: str, url: str) -> str:
+    """Fill POST_TEMPLATE for one post"""
+    return POST_TEMPLATE.format(
         title=title or "(no title)",
-        body=body[:3000] if body else "(no body)",  # Limit body length
+        body=compact_body(body, ANALYSIS_BODY_TOKEN_BUDGET) if body else "(no body)",
         source=source,
         url=url,
     )
+
+def format_prompt(title: str, body: str, source: str, url: str) -> str:
+    """Build the per-post user message (sent after ANALYSIS_SYSTEM_PROMPT)"""
+    return ANALYSIS_PROMPT.format(post=format_post(title, body, source, url))
+
+class AnalysisError(ValueError):
+    """A model response that can't be turned into an analysis"""
+
+class StopAnalysis(RuntimeError):
+    """Stops the run rather than failing the post at hand"""
+
+class NotConfiguredError(StopAnalysis):
+    """No provider to analyze with"""
+
+class BudgetExhausted(StopAnalysis):
+    """Today's budget can't cover another request (analysis.budget)"""
+
+_decoder = json.JSONDecoder()
+
+def parse_analysis_json(response_text: str):
+    """Extract the first JSON value from a model response
+
+    Structured output is plain JSON; otherwise the first complete object
+    in the text is used, ignoring any prose around it.
+    """
+    response_text = (response_text or "").strip()
+    try:
+        return json.loads(response_text)
+    except ValueError:
+        pass
+    start = response_text.find("{")
+    while start != -1:
+        try:
+            return _decoder.raw_decode(response_text, start)[0]
+        except ValueError:
+            start = response_text.find("{", start + 1)
+    raise AnalysisError(f"Could not parse JSON from response: {response_text[:200]}")
+
+def coerce_score(value) -> int:
+    """Clamp a score to an int in 0-10, accepting "7", "7/10", 7.5 etc."""
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:\.\d+)?", value)
+        if not match:
+            raise AnalysisError(f"Score is not a number: {value!r}")
+        value = float(match.group())
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise AnalysisError(f"Score is not a number: {value!r}")
+    return int(min(10, max(0, round(value))))
+
+def validate_result(data) -> dict:
+    """Check a parsed result against the schema, coercing what can be fixed"""
+    if not isinstance(data, dict):
+        raise AnalysisError(f"Expected a JSON object, got {type(data).__name__}")
+    if "fit_score" not in data:
+        raise AnalysisError("Response has no fit_score")
+
+    return {
+        "fit_score": coerce_score(data["fit_score"]),
+        "urgency_score": coerce_score(data.get("urgency_score", 0)),
+        "use_case": coerce_use_case(data.get("use_case")),
+        "problem_summary": str(data.get("problem_summary") or ""),
+        "reasoning": str(data.get("reasoning") or ""),
+        "profiles": validate_profiles(data.get("profiles")),
+    }
+
+def coerce_use_case(value) -> str:
+    use_case = str(value or "other").strip().lower().replace("-", "_").replace(" ", "_")
+    return use_case if use_case in PROBLEM_CATEGORIES else "other"
+
+def validate_profiles(data) -> dict:
+    """Per-profile scores for configured profiles; bad or missing entries are dropped
+
+    A broken profile score never fails the main analysis.
+    """
+    if not isinstance(data, dict):
+        return {}
+    profiles = {}
+    for name in PRODUCT_PROFILES:
+        scores = data.get(name)
+        if not isinstance(scores, dict) or "fit_score" not in scores:
+            continue
+        try:
+            profiles[name] = {
+                "fit_score": coerce_score(scores["fit_score"]),
+                "urgency_score": coerce_score(scores.get("urgency_score", 0)),
+                "use_case": coerce_use_case(scores.get("use_case")),
+            }
+        except AnalysisError:
+            continue
+    return profiles
+
+def parse_result(response_text: str) -> dict:
+    """Parse and validate a single-post response, raising AnalysisError"""
+    return validate_result(parse_analysis_json(response_text))
+
+def has_enough_content(post) -> bool:
+    """Posts with very little content aren't worth an LLM call"""
+    content = (post.title or "") + " " + (post.body or "")
+    # Same test as the queue query in db.get_unanalyzed_posts
+    return len(content.strip(" \t\n\r")) >= ANALYSIS_MIN_CONTENT_CHARS
+
+# Token usage since the last reset_usage(), including prompt cache hits.
+# input_tokens counts uncached input only, for both providers.
+TOKEN_USAGE = {
+    "requests": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_tokens": 0,
+    "cache_write_tokens": 0,
+    "cache_hits": 0,
+}
+
+def reset_usage():
+    for key in TOKEN_USAGE:
+        TOKEN_USAGE[key] = 0
+
+def usage_anthropic(usage) -> dict:
+    """Normalize an Anthropic ``message.usage``"""
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+    }
+
+def usage_openai(usage) -> dict:
+    """Normalize an OpenAI ``response.usage`` (cached tokens are part of prompt_tokens)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    return {
+        "input_tokens": (getattr(usage, "prompt_tokens", 0) or 0) - cached,
+        "output_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cache_read_tokens": cached,
+        "cache_write_tokens": 0,
+    }
+
+def record_usage(usage: dict):
+    TOKEN_USAGE["requests"] += 1
+    for key, value in usage.items():
+        TOKEN_USAGE[key] += value
+    if usage.get("cache_read_tokens"):
+        TOKEN_USAGE["cache_hits"] += 1
+
+def prompt_cache_min_tokens(model: str) -> int:
+    """Shortest prefix ``model`` caches (longest matching PROMPT_CACHE_MIN_TOKENS key)"""
+    key = max((k for k in PROMPT_CACHE_MIN_TOKENS if model.startswith(k)), key=len, default=None)
+    return PROMPT_CACHE_MIN_TOKENS[key] if key is not None else 0
+
+def cache_prefix_tokens(system: str, schema: dict) -> int:
+    """Estimated tokens of the static prefix: the result tool's definition, then the system prompt"""
+    return estimate_tokens(system) + estimate_tokens(json.dumps(schema))
+
+def prompt_cacheable(system: str, schema: dict, model: str) -> bool:
+    return cache_prefix_tokens(system, schema) >= prompt_cache_min_tokens(model)
+
+def prompt_cache_status(model: str = None) -> dict:
+    """Whether the single-post prefix is long enough for ``model`` (default: the active one) to cache"""
+    model = model or active_model()
+    return {
+        "model": model,
+        "prefix_tokens": cache_prefix_tokens(ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA),
+        "min_tokens": prompt_cache_min_tokens(model),
+        "active": prompt_cacheable(ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA, model),
+    }
+
+def anthropic_request(system: str, prompt: str, max_tokens: int,
+                      schema: dict = ANALYSIS_SCHEMA, model: str = ANALYSIS_MODEL) -> dict:
+    """Messages API arguments with the static system prompt marked for caching
+
+    The model must answer by calling a tool whose input schema is ``schema``.
+    The cache breakpoint is only set when the prefix reaches the model's
+    minimum (e.g. 2048 tokens for Claude 3 Haiku).
+    """
+    block = {"type": "text", "text": system}
+    if prompt_cacheable(system, schema, model):
+        block["cache_control"] = {"type": "ephemeral"}
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": [block],
+        "tools": [{
+            "name": RESULT_TOOL,
+            "description": "Record the analysis result",
+            "input_schema": schema,
+        }],
+        "tool_choice": {"type": "tool", "name": RESULT_TOOL},
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+def openai_request(system: str, prompt: str, max_tokens: int,
+                   schema: dict = ANALYSIS_SCHEMA, model: str = OPENAI_MODEL) -> dict:
+    """Chat Completions arguments with strict JSON-schema output
+
+    OpenAI caches the shared system prefix automatically.
+    """
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": max_tokens,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "analysis", "strict": True, "schema": schema},
+        },
+    }
+
+def anthropic_text(message) -> str:
+    """Response as JSON text: the forced tool call's input, else the text block"""
+    for block in message.content:
+        if block.type == "tool_use":
+            return json.dumps(block.input)
+    return "".join(block.text for block in message.content if block.type == "text")
+
+def active_model() -> str:
+    """Model that ``complete`` will call (the primary one when routing)"""
+    from analysis.providers import default_provider
+    provider = default_provider()
+    return provider.model if provider else ANALYSIS_MODEL
+
+def get_router():
+    """The provider router (analysis.router), or None with a single endpoint"""
+    from analysis.providers import pinned
+    if pinned() is not None:
+        return None
+    from analysis.router import get_router as router
+    routed = router()
+    return routed if len(routed.endpoints) > 1 else None
+
+def cache_models() -> list:
+    """Models whose cached responses are valid answers, preferred first"""
+    router = get_router()
+    return router.models() if router else [active_model()]
+
+def cached_result(title: str, body: str, version: str):
+    """``(result, model)`` from the response cache under any usable model, else None"""
+    for model in cache_models():
+        result = response_cache.get(title, body, version, model)
+        if result is not None:
+            return result, model
+    return None
+
+def complete_anthropic(prompt: str, max_tokens: int = 500,
+                       system: str = ANALYSIS_SYSTEM_PROMPT, schema: dict = ANALYSIS_SCHEMA) -> str:
+    """Send a prompt to Anthropic, return the structured response as JSON text"""
+    from analysis.providers import get_provider
+    return get_provider("anthropic").complete(prompt, max_tokens, system, schema)
+
+def complete_openai(prompt: str, max_tokens: int = 500,
+                    system: str = ANALYSIS_SYSTEM_PROMPT, schema: dict = ANALYSIS_SCHEMA) -> str:
+    """Send a prompt to OpenAI with a JSON schema, return the response text"""
+    from analysis.providers import get_provider
+    return get_provider("openai").complete(prompt, max_tokens, system, schema)
+
+def complete_routed(prompt: str, max_tokens: int = 500, system: str = ANALYSIS_SYSTEM_PROMPT,
+                    schema: dict = ANALYSIS_SCHEMA) -> tuple:
+    """Send a prompt, return ``(response text, model that answered)``
+
+    With several endpoints configured the request goes through the router
+    (load balancing, hedging, failover), otherwise to the configured provider
+    (analysis.providers).
+    """
+    router = get_router()
+    if router:
+        from analysis.router import run_sync
+        return run_sync(router.complete(prompt, max_tokens, system, schema))
+    from analysis.providers import default_provider
+    provider = default_provider()
+    if provider is None:
+        raise NotConfiguredError("No API key configured for analysis")
+    return provider.complete(prompt, max_tokens, system, schema), provider.model
+
+def complete(prompt: str, max_tokens: int = 500, system: str = ANALYSIS_SYSTEM_PROMPT,
+             schema: dict = ANALYSIS_SCHEMA) -> str:
+    """Send a prompt to the configured provider(s), return the response text"""
+    return complete_routed(prompt, max_tokens, system, schema)[0]
+
+def analyze_post_anthropic(title: str, body: str, source: str, url: str) -> Optional[dict]:
+    """Analyze a post using Anthropic Claude"""
+    prompt = format_prompt(title, body, source, url)
     
     try:
-        message = client.messages.create(
-            model=ANALYSIS_MODEL,
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        response_text = message.content[0].text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
-            print(f"Could not parse JSON from response: {response_text[:200]}")
-            return None
-            
+        return parse_result(complete_anthropic(prompt))
     except Exception as e:
         print(f"Anthropic API error: {e}")
         return None
 
 def analyze_post_openai(title: str, body: str, source: str, url: str) -> Optional[dict]:
     """Analyze a post using OpenAI"""
-    client = get_openai()
-    
-    prompt = ANALYSIS_PROMPT.format(
-        title=title or "(no title)",
-        body=body[:3000] if body else "(no body)",
-        source=source,
-        url=url,
-    )
+    prompt = format_prompt(title, body, source, url)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            response_format={"type": "json_object"}
-        )
-        
-        return json.loads(response.choices[0].message.content)
-        
+        return parse_result(complete_openai(prompt))
     except Exception as e:
         print(f"OpenAI API error: {e}")
         return None
 
+def request_analysis(title: str, body: str, source: str, url: str) -> dict:
+    """Analyze a post with the configured provider(s), reusing cached responses
+
+    The result's ``model_used`` is the model that answered. Raises on API
+    errors and on responses that fail validation.
+    """
+    cached = cached_result(title, body, PROMPT_VERSION)
+    if cached is not None:
+        result, model = cached
+        return {**result, "model_used": model, "prompt_version": PROMPT_VERSION}
+
+    text, model = complete_routed(format_prompt(title, body, source, url))
+    result = parse_result(text)
+    response_cache.put(title, body, PROMPT_VERSION, model, result)
+    return {**result, "model_used": model, "prompt_version": PROMPT_VERSION}
+
 def analyze_post(title: str, body: str, source: str, url: str) -> Optional[dict]:
-    """Analyze a post using configured provider"""
-    if ANALYSIS_PROVIDER == "anthropic" and ANTHROPIC_API_KEY:
-        return analyze_post_anthropic(title, body, source, url)
-    elif OPENAI_API_KEY:
-        return analyze_post_openai(title, body, source, url)
-    else:
-        raise RuntimeError("No API key configured for analysis")
-
-def run_analysis(batch_size: int = 100, delay: float = 0.5) -> dict:
-    """Run analysis on unanalyzed posts"""
+    """Analyze a post using configured provider, None on failure"""
+    try:
+        return request_analysis(title, body, source, url)
+    except StopAnalysis:
+        raise
+    except Exception as e:
+        print(f"Analysis error: {e}")
+        return None
+
+# Status codes that mean "slow down" rather than "this request is bad"
+OVERLOAD_STATUSES = {429, 503, 529}
+
+# Pause used when an overload response carries no retry-after header
+DEFAULT_BACKOFF = 2.0
+
+def overload_delay(error: Exception) -> Optional[float]:
+    """Seconds to back off if ``error`` is a rate-limit/overload response"""
+    status = getattr(error, "status_code", None)
+    if status not in OVERLOAD_STATUSES and "overloaded" not in str(error).lower():
+        return None
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return DEFAULT_BACKOFF
+
+def analysis_row(post_id: str, result: dict, model_used: str = ANALYSIS_MODEL,
+                 prompt_version: str = PROMPT_VERSION) -> dict:
+    """Map a parsed model response onto ``insert_analysis`` arguments
+
+    A ``model_used`` or ``prompt_version`` in the result (set by
+    ``request_analysis``) wins over the argument.
+    """
+    return {
+        "post_id": post_id,
+        "fit_score": result.get("fit_score", 0),
+        "urgency_score": result.get("urgency_score", 0),
+        "use_case": result.get("use_case", "other"),
+        "reasoning": result.get("reasoning", ""),
+        "problem_summary": result.get("problem_summary", ""),
+        "model_used": result.get("model_used", model_used),
+        "profiles": result.get("profiles") or {},
+        "prompt_version": result.get("prompt_version", prompt_version),
+    }
+
+def run_gate() -> dict:
+    """Apply the local pre-filter (analysis.gate) to pending posts, once trained"""
+    if not (GATE_ENABLED and GATE_MODEL_PATH.exists()):
+        return {}
+    from analysis.gate import gate_pending
+    return gate_pending()
+
+def with_usage(stats: dict, gate: dict = None, governor: dict = None) -> dict:
+    """Attach token, prompt-cache, response-cache, gate, budget and router counters to run stats
+
+    Also writes any buffered ``llm_calls`` rows.
+    """
+    telemetry.flush()
+    stats["tokens"] = dict(TOKEN_USAGE)
+    stats["prompt_cache"] = prompt_cache_status()
+    stats["response_cache"] = dict(response_cache.CACHE_STATS)
+    if gate:
+        stats["gate"] = gate
+    if governor:
+        stats["budget"] = governor
+    router = get_router()
+    if router:
+        stats["providers"] = router.summary()
+    return stats
+
+def request_with_backoff(post, delay: float, stats: dict) -> Optional[dict]:
+    """``request_analysis`` for one post, waiting out and retrying overloads
+
+    Returns None once the post has failed (recorded in ``analysis_failures``)
+    or stayed overloaded for ``ANALYSIS_MAX_ATTEMPTS`` tries (left queued).
+    """
+    for _ in range(ANALYSIS_MAX_ATTEMPTS):
+        try:
+            return request_analysis(title=post.title, body=post.body, source=post.source, url=post.url)
+        except StopAnalysis:
+            raise
+        except Exception as e:
+            backoff = overload_delay(e)
+            if backoff is None:
+                print(f"Analysis error for {post.id}: {e}")
+                stats["errors"] += 1
+                record_analysis_failure(post.id, str(e))
+                stats["failed"] += 1
+                return None
+            # Rate limits are the provider's problem, not the post's
+            stats["rate_limited"] += 1
+            time.sleep(max(backoff, delay))
+    print(f"Giving up on {post.id} after {ANALYSIS_MAX_ATTEMPTS} rate-limited attempts")
+    stats["errors"] += 1
+    return None
+
+def run_analysis(batch_size: int = 100, delay: float = 0.5,
+                 concurrent: bool = False, batched: bool = False,
+                 threads: bool = False) -> dict:
+    """Run analysis on unanalyzed posts
+    
+    ``concurrent=True`` uses the async engine in analysis.concurrent, which
+    adapts parallelism to the provider's rate limits. ``batched=True`` packs
+    several posts into each request (analysis.batched). ``threads=True``
+    scores each discussion thread in one request (analysis.threads). In
+    every mode, posts the local pre-filter rejects are not sent to the LLM,
+    the rest are taken highest prior first and the daily budget caps how
+    many are admitted (analysis.priority).
+    """
+    reset_usage()
+    response_cache.reset_stats()
+    router = get_router()
+    if router:
+        router.reset_stats()
+    gate = run_gate()
+    from analysis.priority import prepare_queue
+    batch_size, governor = prepare_queue(batch_size)
+    if concurrent:
+        from analysis.concurrent import run_analysis_concurrent
+        return with_usage(run_analysis_concurrent(batch_size=batch_size), gate, governor)
+    if batched:
+        from analysis.batched import run_batched_analysis
+        return with_usage(run_batched_analysis(batch_size=batch_size, delay=delay), gate, governor)
+    if threads:
+        from analysis.threads import run_thread_analysis
+        return with_usage(run_thread_analysis(batch_size=batch_size, delay=delay), gate, governor)
+    
     posts = get_unanalyzed_posts(limit=batch_size)
     
-    stats = {"analyzed": 0, "skipped": 0, "errors": 0, "high_fit": 0}
+    stats = {"analyzed": 0, "skipped": 0, "errors": 0, "high_fit": 0, "failed": 0, "rate_limited": 0}
     
     for post in posts:
         # Skip posts with very little content
-        content = (post.get("title") or "") + " " + (post.get("body") or "")
-        if len(content.strip()) < 50:
+        if not has_enough_content(post):
             stats["skipped"] += 1
             continue
         
-        result = analyze_post(
-            title=post.get("title"),
-            body=post.get("body"),
-            source=post.get("source"),
-            url=post.get("url"),
-        )
+        hits = response_cache.CACHE_STATS["hits"]
+        try:
+            result = request_with_backoff(post, delay, stats)
+        except BudgetExhausted as e:
+            # Keep what was analyzed; the rest waits for tomorrow's budget
+            print(f"Stopping: {e}")
+            stats["budget_exhausted"] = True
+            break
         
         if result:
             try:
-                insert_analysis(
-                    post_id=post["id"],
-                    fit_score=result.get("fit_score", 0),
-                    urgency_score=result.get("urgency_score", 0),
-                    use_case=result.get("use_case", "other"),
-                    reasoning=result.get("reasoning", ""),
-                    problem_summary=result.get("problem_summary", ""),
-                    model_used=ANALYSIS_MODEL,
-                )
+                insert_analysis(**analysis_row(post.id, result))
                 stats["analyzed"] += 1
                 
                 if result.get("fit_score", 0) >= 7:
@@ -170,12 +618,11 @@ def run_analysis(batch_size: int = 100, delay: float = 0.5) -> dict:
             except Exception as e:
                 print(f"Error inserting analysis: {e}")
                 stats["errors"] += 1
-        else:
-            stats["errors"] += 1
         
-        time.sleep(delay)  # Rate limiting
+        if response_cache.CACHE_STATS["hits"] == hits:
+            time.sleep(delay)  # Rate limiting (cache hits made no API call)
     
-    return stats
+    return with_usage(stats, gate, governor)
 
 if __name__ == "__main__":
     from db import init_db
@@ -0,0 +1,455 @@
+"""Offline bulk analysis through provider batch APIs
+
+``python main.py analyze --batch`` submits unanalyzed posts as an Anthropic
+Message Batch or OpenAI Batch job instead of making interactive calls, and
+records the job in ``analysis_batches``/``analysis_batch_items``. Later runs
+poll open jobs and ingest finished results into ``analysis``.
+
+Nothing is lost if the process dies part way:
+- the job row and its posts are written before submitting, and the remote
+  id right after, so a submitted job is always found again by the next poll
+- each job gets an idempotency key, stored before submitting and sent
+  with the job (prefix of every request's ``custom_id``, and OpenAI batch
+  metadata). A job left in ``submitting`` (crash before the remote id was
+  saved) is looked up on the provider by that key on the next run: if the
+  provider has it, the job resumes as submitted; only if it surely doesn't
+  is the job failed, releasing its posts for re-submission. While the
+  provider can't tell yet, the job and its posts stay put
+- a finished job's analyses, failures and ``ingested`` status are written
+  in one transaction
+
+With a daily budget set, a job only takes the posts whose worst-case cost
+fits what's left of today's budget, held until its results are in and
+then settled to what they actually cost (analysis.budget).
+
+The ``local`` backend implements the same three endpoints (submit, status,
+results) against job files on disk with a deterministic keyword scorer, so
+the whole flow can be run and tested offline.
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config.settings import (
+    ANTHROPIC_API_KEY, OPENAI_API_KEY, ANALYSIS_MODEL, OPENAI_MODEL, ANALYSIS_PROVIDER,
+    ANALYSIS_BATCH_BACKEND, LOCAL_BATCH_DIR,
+)
+from db import get_connection, get_unanalyzed_posts, insert_analyses, complete_batch
+from analysis import (
+    ANALYSIS_SYSTEM_PROMPT, format_prompt, parse_result, has_enough_content, AnalysisError,
+    analysis_row, anthropic_request, openai_request, anthropic_text, usage_anthropic, usage_openai,
+    record_usage, get_anthropic, get_openai, PROMPT_VERSION, response_cache, run_gate, telemetry,
+    NotConfiguredError, BudgetExhausted, ANALYSIS_SCHEMA,
+)
+from analysis import budget
+from analysis.offline import local_score
+
+# Provider jobs created this long before our submission started still count
+# as candidates when looking one up by key (clock skew)
+LOOKUP_SKEW_SECONDS = 300
+
+class LookupPending(Exception):
+    """The provider can't tell yet whether it has a job with this key"""
+
+def custom_id(key: str, post_id: str) -> str:
+    return f"{key}-{post_id}" if key else post_id
+
+def post_id_of(key: str, request_id: str):
+    """Post ID from a request's custom_id, None if it belongs to another job"""
+    if not key:
+        return request_id
+    prefix = f"{key}-"
+    return request_id[len(prefix):] if request_id.startswith(prefix) else None
+
+class AnthropicBatchBackend:
+    """Anthropic Message Batches API"""
+    name = "anthropic"
+    model = ANALYSIS_MODEL
+    billed = True
+
+    def submit(self, requests: list, key: str) -> str:
+        batch = get_anthropic().messages.batches.create(requests=[
+            {"custom_id": custom_id(key, post_id),
+             "params": anthropic_request(ANALYSIS_SYSTEM_PROMPT, prompt, 500)}
+            for post_id, prompt in requests
+        ])
+        return batch.id
+
+    def find(self, key: str, since: float, request_count: int):
+        """Remote id of the job submitted with ``key``, None if there is none
+
+        Message Batches carry no metadata, so candidates (created since,
+        same size) are checked by the custom_id of their first result,
+        which is only readable once they've ended.
+        """
+        client = get_anthropic()
+        undecided = False
+        for batch in client.messages.batches.list(limit=100):
+            if batch.created_at.timestamp() < since - LOOKUP_SKEW_SECONDS:
+                break
+            counts = batch.request_counts
+            if sum((counts.processing, counts.succeeded, counts.errored,
+                    counts.canceled, counts.expired)) != request_count:
+                continue
+            if batch.processing_status != "ended":
+                undecided = True
+                continue
+            first = next(iter(client.messages.batches.results(batch.id)), None)
+            if first is not None and post_id_of(key, first.custom_id) is not None:
+                return batch.id
+        if undecided:
+            raise LookupPending("a batch of the same size is still processing")
+        return None
+
+    def is_done(self, remote_id: str) -> bool:
+        return get_anthropic().messages.batches.retrieve(remote_id).processing_status == "ended"
+
+    def results(self, remote_id: str):
+        """Yield (custom_id, response text or None, error, usage or None)"""
+        for entry in get_anthropic().messages.batches.results(remote_id):
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                usage = usage_anthropic(message.usage)
+                record_usage(usage)
+                telemetry.record_call("batch", self.name, self.model, "ok", usage=usage)
+                yield entry.custom_id, anthropic_text(message), None, usage
+            else:
+                telemetry.record_call("batch", self.name, self.model, "error", error=entry.result.type)
+                yield entry.custom_id, None, entry.result.type, None
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API over /v1/chat/completions"""
+    name = "openai"
+    model = OPENAI_MODEL
+    billed = True
+
+    def submit(self, requests: list, key: str) -> str:
+        lines = "\n".join(json.dumps({
+            "custom_id": custom_id(key, post_id),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": openai_request(ANALYSIS_SYSTEM_PROMPT, prompt, 500),
+        }) for post_id, prompt in requests)
+        client = get_openai()
+        upload = client.files.create(file=("analysis.jsonl", lines.encode()), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata={"idempotency_key": key},
+        )
+        return batch.id
+
+    def find(self, key: str, since: float, request_count: int):
+        """Remote id of the job submitted with ``key`` (from its metadata), None if there is none"""
+        for batch in get_openai().batches.list(limit=100):
+            if batch.created_at < since - LOOKUP_SKEW_SECONDS:
+                break
+            if (batch.metadata or {}).get("idempotency_key") == key:
+                return batch.id
+        return None
+
+    def is_done(self, remote_id: str) -> bool:
+        status = get_openai().batches.retrieve(remote_id).status
+        return status in ("completed", "failed", "expired", "cancelled")
+
+    def results(self, remote_id: str):
+        client = get_openai()
+        batch = client.batches.retrieve(remote_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    body = response["body"]
+                    usage = usage_openai(_Attrs(body.get("usage") or {}))
+                    record_usage(usage)
+                    telemetry.record_call("batch", self.name, self.model, "ok", usage=usage)
+                    yield entry["custom_id"], body["choices"][0]["message"]["content"], None, usage
+                else:
+                    telemetry.record_call("batch", self.name, self.model, "error",
+                                          error=json.dumps(entry.get("error") or response))
+                    yield entry["custom_id"], None, json.dumps(entry.get("error") or response), None
+
+class _Attrs:
+    """Attribute access over a usage dict, for usage_openai()"""
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getattr__(self, name):
+        value = self._data.get(name)
+        return _Attrs(value) if isinstance(value, dict) else value
+
+class LocalBatchBackend:
+    """Offline stand-in for the provider batch endpoints
+
+    Jobs are JSON files under LOCAL_BATCH_DIR. A job is done once
+    ``delay`` seconds have passed since submission, and each request is
+    answered by a deterministic keyword scorer.
+    """
+    name = "local"
+    model = "local-keyword-scorer"
+    billed = False
+
+    def __init__(self, delay: float = 0.0, directory=LOCAL_BATCH_DIR):
+        self.delay = delay
+        self.directory = directory
+
+    def _path(self, remote_id: str):
+        return self.directory / f"{remote_id}.json"
+
+    def submit(self, requests: list, key: str) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        remote_id = f"localbatch_{key}"
+        self._path(remote_id).write_text(json.dumps({
+            "created": time.time(),
+            "requests": [{"custom_id": custom_id(key, post_id), "prompt": p} for post_id, p in requests],
+        }))
+        return remote_id
+
+    def find(self, key: str, since: float, request_count: int):
+        remote_id = f"localbatch_{key}"
+        return remote_id if self._path(remote_id).exists() else None
+
+    def is_done(self, remote_id: str) -> bool:
+        job = json.loads(self._path(remote_id).read_text())
+        return time.time() - job["created"] >= self.delay
+
+    def results(self, remote_id: str):
+        job = json.loads(self._path(remote_id).read_text())
+        for request in job["requests"]:
+            yield request["custom_id"], local_score(request["prompt"]), None, None
+
+BACKENDS = {
+    "anthropic": AnthropicBatchBackend,
+    "openai": OpenAIBatchBackend,
+    "local": LocalBatchBackend,
+}
+
+def get_backend(name: str = None):
+    """Backend by name, defaulting to settings and then the interactive provider"""
+    name = name or ANALYSIS_BATCH_BACKEND
+    if not name:
+        if ANALYSIS_PROVIDER == "simulator":
+            name = "local"
+        elif ANALYSIS_PROVIDER == "anthropic" and ANTHROPIC_API_KEY:
+            name = "anthropic"
+        elif OPENAI_API_KEY:
+            name = "openai"
+        else:
+            raise NotConfiguredError("No API key configured for analysis (use the 'local' batch backend offline)")
+    return BACKENDS[name]()
+
+def recover_interrupted() -> dict:
+    """Resolve jobs that never got a remote id
+
+    Each is looked up on its provider by idempotency key: found jobs resume
+    as submitted, jobs the provider doesn't have are failed (releasing their
+    posts), and jobs it can't rule out yet are left for the next run.
+    """
+    stats = {"recovered": 0, "interrupted": 0, "unresolved": 0}
+    with get_connection() as conn:
+        jobs = conn.execute("""
+            SELECT id, backend, idempotency_key, request_count, submitted_at
+            FROM analysis_batches WHERE status = 'submitting'
+        """).fetchall()
+
+    for job in jobs:
+        remote_id = None
+        if job["idempotency_key"]:
+            since = datetime.fromisoformat(job["submitted_at"]).replace(tzinfo=timezone.utc).timestamp()
+            try:
+                remote_id = BACKENDS[job["backend"]]().find(
+                    job["idempotency_key"], since, job["request_count"])
+            except Exception as e:
+                print(f"Could not look up interrupted batch {job['id']}: {e}")
+                stats["unresolved"] += 1
+                continue
+        with get_connection() as conn:
+            if remote_id:
+                conn.execute(
+                    "UPDATE analysis_batches SET status = 'submitted', remote_id = ? WHERE id = ?",
+                    (remote_id, job["id"]),
+                )
+                stats["recovered"] += 1
+            else:
+                conn.execute("""
+                    UPDATE analysis_batches
+                    SET status = 'failed', error = 'interrupted before submission'
+                    WHERE id = ?
+                """, (job["id"],))
+                stats["interrupted"] += 1
+        if not remote_id:
+            budget.release_batch(job["id"])
+    return stats
+
+def submit_batch(backend, limit: int = 1000) -> dict:
+    """Submit unanalyzed posts as one batch job
+    
+    Posts with a cached response for this backend's model are inserted
+    directly instead of being submitted.
+    """
+    stats = {"submitted": 0, "skipped": 0, "cached": 0}
+    posts = []
+    cached_rows = []
+    for post in get_unanalyzed_posts(limit=limit):
+        if not has_enough_content(post):
+            stats["skipped"] += 1
+            continue
+        cached = response_cache.get(post.title, post.body, PROMPT_VERSION, backend.model)
+        if cached is not None:
+            cached_rows.append(analysis_row(post.id, cached, model_used=backend.model))
+        else:
+            posts.append(post)
+    if cached_rows:
+        stats["cached"] = insert_analyses(cached_rows)
+    if not posts:
+        return stats
+
+    requests = [(p.id, format_prompt(p.title, p.body, p.source, p.url)) for p in posts]
+    hold_id = None
+    if budget.configured() and backend.billed:
+        try:
+            amounts = [budget.worst_case(backend.model, ANALYSIS_SYSTEM_PROMPT, prompt, ANALYSIS_SCHEMA,
+                                         500, batch=True) for _, prompt in requests]
+        except BudgetExhausted as e:
+            print(f"Not submitting: {e}")
+            stats["budget_exhausted"] = True
+            return stats
+        fits, hold_id = budget.place_holds("batch", backend.model, amounts)
+        if fits < len(posts):
+            print(f"Daily analysis budget: submitting {fits} of {len(posts)} posts")
+            stats["budget_exhausted"] = True
+            posts, requests = posts[:fits], requests[:fits]
+        if not posts:
+            return stats
+
+    # Stored before submitting, so an interrupted submission can be found again
+    key = uuid.uuid4().hex[:16]
+    with get_connection() as conn:
+        batch_id = conn.execute("""
+            INSERT INTO analysis_batches (backend, model, request_count, idempotency_key)
+            VALUES (?, ?, ?, ?)
+        """, (backend.name, backend.model, len(posts), key)).lastrowid
+        conn.executemany(
+            "INSERT INTO analysis_batch_items (batch_id, post_id) VALUES (?, ?)",
+            [(batch_id, p.id) for p in posts],
+        )
+    if hold_id is not None:
+        budget.attach_batch(hold_id, batch_id)
+
+    try:
+        remote_id = backend.submit(requests, key)
+    except Exception as e:
+        print(f"Batch submission failed: {e}")
+        with get_connection() as conn:
+            conn.execute(
+                "UPDATE analysis_batches SET status = 'failed', error = ? WHERE id = ?",
+                (str(e), batch_id),
+            )
+        budget.release_batch(batch_id)
+        stats["errors"] = len(posts)
+        return stats
+
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE analysis_batches SET status = 'submitted', remote_id = ? WHERE id = ?",
+            (remote_id, batch_id),
+        )
+    stats["submitted"] = len(posts)
+    stats["batch_id"] = batch_id
+    return stats
+
+def poll_batches(backend) -> dict:
+    """Ingest results of finished jobs for this backend"""
+    stats = {"analyzed": 0, "errors": 0, "high_fit": 0, "pending_batches": 0}
+
+    with get_connection() as conn:
+        jobs = conn.execute("""
+            SELECT id, remote_id, model, idempotency_key FROM analysis_batches
+            WHERE status = 'submitted' AND backend = ?
+            ORDER BY id
+        """, (backend.name,)).fetchall()
+
+    for job in jobs:
+        try:
+            done = backend.is_done(job["remote_id"])
+        except Exception as e:
+            print(f"Could not poll batch {job['remote_id']}: {e}")
+            stats["pending_batches"] += 1
+            continue
+        if not done:
+            stats["pending_batches"] += 1
+            continue
+
+        with get_connection() as conn:
+            texts = {row["id"]: (row["title"], row["body"]) for row in conn.execute("""
+                SELECT p.id, p.title, p.body FROM analysis_batch_items bi
+                JOIN posts p ON p.id = bi.post_id
+                WHERE bi.batch_id = ?
+            """, (job["id"],))}
+
+        rows = []
+        failures = []
+        actual = {"tokens": 0, "cost": 0.0}
+        for request_id, text, error, usage in backend.results(job["remote_id"]):
+            post_id = post_id_of(job["idempotency_key"], request_id)
+            if post_id is None:
+                print(f"Batch {job['remote_id']} has a request from another job: {request_id}")
+                continue
+            if usage:
+                actual["tokens"] += sum(usage.get(key, 0) for key in telemetry.USAGE_KEYS)
+                actual["cost"] += telemetry.call_cost(job["model"], usage, batch=True) or 0
+            if text:
+                try:
+                    result = parse_result(text)
+                except AnalysisError as e:
+                    error = str(e)
+                else:
+                    if post_id in texts:
+                        response_cache.put(*texts[post_id], PROMPT_VERSION, job["model"], result)
+                    rows.append(analysis_row(post_id, result, model_used=job["model"]))
+                    continue
+            print(f"Batch request {post_id} failed: {error}")
+            failures.append((post_id, error or "empty response"))
+            stats["errors"] += 1
+
+        # Posts without a result are released for a later submission once their backoff ends
+        stats["analyzed"] += complete_batch(job["id"], rows, failures)
+        budget.settle_batch(job["id"], actual["tokens"], actual["cost"])
+        stats["high_fit"] += sum(1 for r in rows if (r["fit_score"] or 0) >= 7)
+
+    return stats
+
+def run_batch_analysis(batch_size: int = 1000, backend: str = None) -> dict:
+    """Ingest finished batch jobs, then submit a new one"""
+    backend = get_backend(backend)
+    stats = recover_interrupted()
+    stats.update(poll_batches(backend))
+    telemetry.flush()
+    stats["gate"] = run_gate()
+    from analysis.priority import prioritize_pending
+    prioritize_pending()
+    stats.update(submit_batch(backend, limit=batch_size))
+    return stats
+
+def list_batches(limit: int = 20) -> list:
+    """Recent batch jobs, newest first"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT id, backend, remote_id, status, request_count,
+                   submitted_at, completed_at, error
+            FROM analysis_batches
+            ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Batch analysis: {run_batch_analysis(backend='local')}")
@@ -0,0 +1,216 @@
+"""Batched analysis: score several posts per LLM request
+
+The single-post prompt repeats the whole header (Expanso context, problem
+categories, scoring guidance) for every post, and that header is longer
+than most comments. Here posts are packed into one request up to a token
+budget and the model returns one result per post ID. Posts whose ID is
+missing or malformed in the response go back in the queue.
+
+Rate-limit and overload errors are back-pressure, as in analysis.concurrent:
+the batch goes back in the queue after an exponential backoff, and it isn't
+counted against its posts. After ``ANALYSIS_MAX_ATTEMPTS`` overloads in a row
+the run stops and leaves the rest of the queue for the next one.
+"""
+import json
+import time
+from collections import deque
+
+from config.settings import (
+    ANALYSIS_BODY_TOKEN_BUDGET, ANALYSIS_BATCH_TOKEN_BUDGET, ANALYSIS_BATCH_MAX_POSTS,
+    ANALYSIS_BATCH_OUTPUT_TOKENS_PER_POST, ANALYSIS_MAX_ATTEMPTS,
+)
+from db import get_unanalyzed_posts, insert_analyses, record_analysis_failures
+from analysis import (
+    PROMPT_HEADER, RESULT_FIELDS, SCORING_GUIDANCE, POST_TEMPLATE, RESULT_PROPERTIES,
+    format_post, parse_analysis_json, validate_result, has_enough_content, analysis_row,
+    complete_routed, object_schema, cached_result, AnalysisError, response_cache,
+    overload_delay, StopAnalysis, BudgetExhausted,
+)
+from analysis.compact import estimate_tokens, COMPACT_VERSION
+
+# Ceiling on the backoff after repeated overloads, in seconds
+MAX_BACKOFF = 60.0
+
+_INDENTED_FIELDS = "\n".join("    " + line for line in RESULT_FIELDS.splitlines())
+
+# Static part of a batched request, sent as a cacheable system prompt
+BATCH_SYSTEM_PROMPT = f"""{PROMPT_HEADER}
+
+You will be given several posts/comments, each introduced by its POST ID. For each one, determine if the author is experiencing a problem that Expanso/Bacalhau could solve. Score every post independently.
+
+Respond in JSON format with exactly one entry per post, copying each POST ID exactly:
+{{
+  "results": [
+    {{
+      "id": "<POST ID>",
+{_INDENTED_FIELDS}
+    }}
+  ]
+}}
+
+{SCORING_GUIDANCE}
+
+Respond ONLY with the JSON object, no other text."""
+
+BATCH_PROMPT = """Analyze the following posts/comments:
+
+{posts}"""
+
+BATCH_SCHEMA = object_schema({
+    "results": {
+        "type": "array",
+        "items": object_schema({"id": {"type": "string"}, **RESULT_PROPERTIES}),
+    },
+})
+
+BATCH_PROMPT_VERSION = response_cache.prompt_version(
+    BATCH_SYSTEM_PROMPT, BATCH_PROMPT, POST_TEMPLATE, json.dumps(BATCH_SCHEMA),
+    f"{COMPACT_VERSION}:{ANALYSIS_BODY_TOKEN_BUDGET}",
+)
+
+def format_post_block(post) -> str:
+    return f"=== POST ID: {post.id} ===\n" + format_post(post.title, post.body, post.source, post.url)
+
+def format_batch_prompt(posts: list) -> str:
+    blocks = "\n\n".join(format_post_block(p) for p in posts)
+    return BATCH_PROMPT.format(posts=blocks)
+
+def take_batch(queue: deque, token_budget: int = ANALYSIS_BATCH_TOKEN_BUDGET,
+               max_posts: int = ANALYSIS_BATCH_MAX_POSTS) -> list:
+    """Pop posts off the queue until the prompt would exceed the budget
+
+    Always takes at least one post so an oversized post still gets analyzed.
+    """
+    used = estimate_tokens(BATCH_SYSTEM_PROMPT) + estimate_tokens(BATCH_PROMPT)
+    batch = []
+    while queue and len(batch) < max_posts:
+        cost = estimate_tokens(format_post_block(queue[0]))
+        if batch and used + cost > token_budget:
+            break
+        batch.append(queue.popleft())
+        used += cost
+    return batch
+
+def parse_batch_results(response_text: str) -> dict:
+    """Map post ID -> validated result from a batch response
+
+    Entries without an ID or that fail validation are left out, so their
+    posts are re-queued.
+    """
+    data = parse_analysis_json(response_text)
+    if isinstance(data, dict):
+        data = data.get("results", [])
+    if not isinstance(data, list):
+        return {}
+
+    results = {}
+    for item in data:
+        if not isinstance(item, dict) or "id" not in item:
+            continue
+        try:
+            results[str(item["id"])] = validate_result(item)
+        except AnalysisError:
+            continue
+    return results
+
+def run_batched_analysis(batch_size: int = 100, delay: float = 0.5,
+                         token_budget: int = ANALYSIS_BATCH_TOKEN_BUDGET,
+                         max_posts: int = ANALYSIS_BATCH_MAX_POSTS) -> dict:
+    """Analyze unanalyzed posts several at a time, return run stats"""
+    stats = {"analyzed": 0, "skipped": 0, "errors": 0, "high_fit": 0,
+             "requests": 0, "requeued": 0, "failed": 0, "rate_limited": 0}
+
+    queue = deque()
+    cached_rows = []
+    for post in get_unanalyzed_posts(limit=batch_size):
+        if not has_enough_content(post):
+            stats["skipped"] += 1
+            continue
+        cached = cached_result(post.title, post.body, BATCH_PROMPT_VERSION)
+        if cached is not None:
+            result, model = cached
+            cached_rows.append(analysis_row(post.id, result, model_used=model,
+                                            prompt_version=BATCH_PROMPT_VERSION))
+        else:
+            queue.append(post)
+    if cached_rows:
+        stats["analyzed"] += insert_analyses(cached_rows)
+        stats["high_fit"] += sum(1 for r in cached_rows if (r["fit_score"] or 0) >= 7)
+
+    attempts = {}
+    overloads = 0  # in a row
+    while queue:
+        batch = take_batch(queue, token_budget, max_posts)
+        prompt = format_batch_prompt(batch)
+        max_tokens = ANALYSIS_BATCH_OUTPUT_TOKENS_PER_POST * len(batch)
+
+        error, model = None, None
+        try:
+            response, model = complete_routed(prompt, max_tokens=max_tokens, system=BATCH_SYSTEM_PROMPT,
+                                schema=BATCH_SCHEMA)
+            results = parse_batch_results(response)
+        except BudgetExhausted as e:
+            print(f"Stopping: {e}; {len(batch) + len(queue)} posts left for the next run")
+            stats["budget_exhausted"] = True
+            break
+        except StopAnalysis:
+            raise
+        except Exception as e:
+            backoff = overload_delay(e)
+            stats["requests"] += 1
+            if backoff is not None:
+                # The provider is saturated; nothing is wrong with these posts
+                overloads += 1
+                stats["rate_limited"] += 1
+                if overloads >= ANALYSIS_MAX_ATTEMPTS:
+                    print(f"Stopping after {overloads} overloaded batch requests in a row; "
+                          f"{len(batch) + len(queue)} posts left for the next run")
+                    break
+                queue.extendleft(reversed(batch))
+                time.sleep(min(MAX_BACKOFF, max(backoff, delay * 2 ** overloads)))
+                continue
+            print(f"Batch analysis error ({len(batch)} posts): {e}")
+            results = {}
+            error = str(e)
+        else:
+            stats["requests"] += 1
+        overloads = 0
+
+        rows = []
+        failures = []
+        for post in batch:
+            result = results.get(post.id)
+            if result:
+                response_cache.put(post.title, post.body, BATCH_PROMPT_VERSION, model, result)
+                rows.append(analysis_row(post.id, result, model_used=model,
+                                         prompt_version=BATCH_PROMPT_VERSION))
+                continue
+            attempts[post.id] = attempts.get(post.id, 0) + 1
+            if attempts[post.id] < ANALYSIS_MAX_ATTEMPTS:
+                queue.append(post)
+                stats["requeued"] += 1
+            else:
+                stats["errors"] += 1
+                failures.append((post.id, error or "Missing or invalid in batch responses"))
+
+        if failures:
+            record_analysis_failures(failures)
+            stats["failed"] += len(failures)
+
+        if rows:
+            try:
+                stats["analyzed"] += insert_analyses(rows)
+                stats["high_fit"] += sum(1 for r in rows if (r["fit_score"] or 0) >= 7)
+            except Exception as e:
+                print(f"Error inserting analysis batch: {e}")
+                stats["errors"] += len(rows)
+
+        time.sleep(delay)  # Rate limiting
+
+    return stats
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    stats = run_batched_analysis(batch_size=50)
+    print(f"Analysis complete: {stats}")
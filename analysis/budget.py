@@ -0,0 +1,167 @@
+"""Daily LLM budget, enforced where requests are sent
+
+``analysis.priority`` plans how many posts a run can afford; this module
+makes the cap hold whatever the run then does. Every request (single,
+batched and thread prompts, router hedges, retries and failovers,
+re-scoring, eval replays, provider batch jobs) first places a hold for its
+worst case in ``budget_holds``: the estimated prefix and message billed at
+the dearer of the uncached and cache-write price, plus the full output
+allowance. Holds are placed in an IMMEDIATE transaction against today's
+spend (``llm_calls``) plus every open hold, so concurrent requests, even
+from several processes, can't both take the last of the budget. A request
+that doesn't fit raises ``BudgetExhausted`` instead of being sent.
+
+Once a call returns, its ``llm_calls`` row is written and the hold is
+dropped. A call that ended without an answer from the provider (cancelled
+hedge, dropped connection) may still be billed, so its hold stays for the
+day. Batch jobs keep their hold, settled to the actual cost at ingest, so
+their spend counts on the day they were submitted.
+
+With ``ANALYSIS_DAILY_COST_BUDGET`` set, models missing from
+``MODEL_PRICING`` are refused: their spend couldn't be measured.
+"""
+from config.settings import (
+    ANALYSIS_DAILY_TOKEN_BUDGET, ANALYSIS_DAILY_COST_BUDGET, MODEL_PRICING, BATCH_API_DISCOUNT,
+)
+from db import get_connection
+from analysis import telemetry, cache_prefix_tokens, BudgetExhausted
+from analysis.compact import estimate_tokens
+
+# llm_calls purposes counted from telemetry; batch spend is counted through its holds
+SPEND_PURPOSES = ("analysis", "eval", "check")
+
+# estimate_tokens assumes ~4 characters per token; code and non-English text run denser
+ESTIMATE_MARGIN = 1.25
+
+def configured() -> bool:
+    return ANALYSIS_DAILY_TOKEN_BUDGET is not None or ANALYSIS_DAILY_COST_BUDGET is not None
+
+def limits() -> list:
+    """(key in spent, daily cap) for each configured budget"""
+    caps = []
+    if ANALYSIS_DAILY_TOKEN_BUDGET is not None:
+        caps.append(("tokens", ANALYSIS_DAILY_TOKEN_BUDGET))
+    if ANALYSIS_DAILY_COST_BUDGET is not None:
+        caps.append(("cost", ANALYSIS_DAILY_COST_BUDGET))
+    return caps
+
+def worst_case(model: str, system: str, prompt: str, schema: dict, max_tokens: int,
+               batch: bool = False) -> dict:
+    """Most tokens and USD one request can be billed"""
+    input_tokens = int((cache_prefix_tokens(system, schema) + estimate_tokens(prompt)) * ESTIMATE_MARGIN)
+    prices = MODEL_PRICING.get(model)
+    if prices is None:
+        if ANALYSIS_DAILY_COST_BUDGET is not None:
+            raise BudgetExhausted(f"{model} has no MODEL_PRICING entry, so its cost can't be "
+                                  f"kept within ANALYSIS_DAILY_COST_BUDGET")
+        cost = 0.0
+    else:
+        input_price = max(prices["input"], prices.get("cache_write", 0))
+        cost = (input_tokens * input_price + max_tokens * prices["output"]) / 1_000_000
+        if batch:
+            cost *= BATCH_API_DISCOUNT
+    return {"tokens": input_tokens + max_tokens, "cost": cost}
+
+def _spent(conn) -> dict:
+    placeholders = ",".join("?" * len(SPEND_PURPOSES))
+    row = conn.execute(f"""
+        SELECT
+            (SELECT COALESCE(SUM(input_tokens + output_tokens + cache_read_tokens
+                                 + cache_write_tokens), 0)
+             FROM llm_calls WHERE purpose IN ({placeholders}) AND called_at >= date('now'))
+          + (SELECT COALESCE(SUM(tokens), 0) FROM budget_holds WHERE created_at >= date('now')),
+            (SELECT COALESCE(SUM(cost_usd), 0)
+             FROM llm_calls WHERE purpose IN ({placeholders}) AND called_at >= date('now'))
+          + (SELECT COALESCE(SUM(cost), 0) FROM budget_holds WHERE created_at >= date('now'))
+    """, SPEND_PURPOSES * 2).fetchone()
+    return {"tokens": row[0], "cost": row[1]}
+
+def spent_today() -> dict:
+    """Tokens and USD spent or held since midnight UTC"""
+    telemetry.flush()
+    with get_connection() as conn:
+        return _spent(conn)
+
+def place_holds(purpose: str, model: str, amounts: list) -> tuple:
+    """Hold as many of ``amounts`` (in order) as today's budget allows, as one hold
+
+    Returns ``(how many fit, hold id or None)``.
+    """
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM budget_holds WHERE created_at < date('now')")
+        used = _spent(conn)
+        caps = limits()
+        total = {"tokens": 0, "cost": 0.0}
+        fits = 0
+        for amount in amounts:
+            if any(used[key] + total[key] + amount[key] > cap for key, cap in caps):
+                break
+            for key in total:
+                total[key] += amount[key]
+            fits += 1
+        if not fits:
+            return 0, None
+        hold_id = conn.execute("""
+            INSERT INTO budget_holds (purpose, model, tokens, cost) VALUES (?, ?, ?, ?)
+        """, (purpose, model, total["tokens"], total["cost"])).lastrowid
+    return fits, hold_id
+
+def release(hold_id: int):
+    """Drop a hold once its call is in ``llm_calls`` (or was never billed)"""
+    # Write the call's own row first, so its spend is always counted by one or the other
+    telemetry.flush()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM budget_holds WHERE id = ?", (hold_id,))
+
+def attach_batch(hold_id: int, batch_id: int):
+    """Keep ``hold_id`` until the batch job's results are ingested"""
+    with get_connection() as conn:
+        conn.execute("UPDATE budget_holds SET batch_id = ? WHERE id = ?", (batch_id, hold_id))
+
+def settle_batch(batch_id: int, tokens: int, cost: float):
+    """Replace a batch job's hold with what its results actually cost"""
+    with get_connection() as conn:
+        conn.execute("""
+            UPDATE budget_holds SET tokens = ?, cost = ?, settled = 1 WHERE batch_id = ?
+        """, (tokens, cost, batch_id))
+
+def release_batch(batch_id: int):
+    """Drop the hold of a batch job the provider never got"""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM budget_holds WHERE batch_id = ?", (batch_id,))
+
+class reserve:
+    """Context manager holding one request's worst case while it's in flight
+
+    Raises ``BudgetExhausted`` on entry when today's budget can't cover it.
+    Nest the call's ``telemetry.track`` inside, so its row exists by the time
+    the hold is dropped.
+    """
+
+    def __init__(self, purpose: str, model: str, system: str, prompt: str, schema: dict,
+                 max_tokens: int):
+        self.purpose = purpose
+        self.model = model
+        self.request = (system, prompt, schema, max_tokens)
+        self.hold_id = None
+
+    def __enter__(self):
+        if not configured():
+            return self
+        amount = worst_case(self.model, *self.request)
+        fits, self.hold_id = place_holds(self.purpose, self.model, [amount])
+        if not fits:
+            raise BudgetExhausted(f"Daily analysis budget reached (spent or held: {spent_today()})")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # An error with a status code is the provider refusing the request, which isn't billed
+        if self.hold_id is not None and (exc is None or getattr(exc, "status_code", None) is not None):
+            release(self.hold_id)
+        return False
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Limits: {limits() or 'none'}, spent or held today: {spent_today()}")
@@ -0,0 +1,142 @@
+"""Persistent, content-addressed cache of LLM analysis responses
+
+A response is stored under (text hash, prompt version, model):
+- the text hash covers the normalized title and body only, so the same
+  text crawled under another ID (a re-fetched Reddit comment, a repost)
+  or re-analyzed after its ``analysis`` row was deleted is a hit
+- the prompt version is a hash of the prompt templates, so editing the
+  prompt or scoring guidance starts from a cold cache
+- the model name keeps providers and model upgrades apart
+
+Entries are evicted least recently used first once the table is over
+LLM_CACHE_MAX_ENTRIES rows or LLM_CACHE_MAX_BYTES of responses.
+"""
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from typing import Optional
+
+from config.settings import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES
+from db import get_connection
+
+# Hit/miss counters since the last reset_stats()
+CACHE_STATS = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+# Eviction scans the whole table, so it runs every EVICT_EVERY stores
+EVICT_EVERY = 100
+_stores_since_evict = 0
+
+def reset_stats():
+    for key in CACHE_STATS:
+        CACHE_STATS[key] = 0
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case, Unicode form and whitespace don't change the analysis"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def text_hash(title: Optional[str], body: Optional[str]) -> str:
+    content = normalize_text(title) + "\x00" + normalize_text(body)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def prompt_version(*templates: str) -> str:
+    """Short hash identifying a set of prompt templates"""
+    return hashlib.sha256("\x00".join(templates).encode()).hexdigest()[:16]
+
+def get(title: str, body: str, version: str, model: str) -> Optional[dict]:
+    """Cached result for this text, prompt and model, or None"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    key = (text_hash(title, body), version, model)
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT response FROM llm_cache
+            WHERE text_hash = ? AND prompt_version = ? AND model = ?
+        """, key).fetchone()
+        if row is None:
+            CACHE_STATS["misses"] += 1
+            return None
+        conn.execute("""
+            UPDATE llm_cache SET hits = hits + 1, last_used = ?
+            WHERE text_hash = ? AND prompt_version = ? AND model = ?
+        """, (time.time(), *key))
+    CACHE_STATS["hits"] += 1
+    return json.loads(row["response"])
+
+def put(title: str, body: str, version: str, model: str, result: dict):
+    """Store a parsed result"""
+    put_many([(title, body, version, model, result)])
+
+def put_many(entries: list):
+    """Store ``(title, body, version, model, result)`` entries in one transaction"""
+    global _stores_since_evict
+    rows = []
+    for title, body, version, model, result in entries:
+        if result:
+            response = json.dumps(result)
+            rows.append((text_hash(title, body), version, model, response, len(response), time.time()))
+    if not LLM_CACHE_ENABLED or not rows:
+        return
+    with get_connection() as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO llm_cache
+                (text_hash, prompt_version, model, response, size, last_used)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+    CACHE_STATS["stores"] += len(rows)
+
+    _stores_since_evict += len(rows)
+    if _stores_since_evict >= EVICT_EVERY:
+        _stores_since_evict = 0
+        evict()
+
+def evict(max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES) -> int:
+    """Drop least recently used entries beyond the size limits, return how many"""
+    with get_connection() as conn:
+        # Running totals from the most recently used entry down; everything
+        # past either limit goes
+        deleted = conn.execute("""
+            DELETE FROM llm_cache WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid,
+                           COUNT(*) OVER recent AS entries,
+                           SUM(size) OVER recent AS bytes
+                    FROM llm_cache
+                    WINDOW recent AS (ORDER BY last_used DESC ROWS UNBOUNDED PRECEDING)
+                )
+                WHERE entries > ? OR bytes > ?
+            )
+        """, (max_entries, max_bytes)).rowcount
+    CACHE_STATS["evicted"] += deleted
+    return deleted
+
+def clear(version: str = None) -> int:
+    """Delete all entries, or only those for one prompt version"""
+    with get_connection() as conn:
+        if version:
+            return conn.execute("DELETE FROM llm_cache WHERE prompt_version = ?", (version,)).rowcount
+        return conn.execute("DELETE FROM llm_cache").rowcount
+
+def cache_info() -> dict:
+    """Entry counts and sizes per prompt version and model"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT prompt_version, model, COUNT(*) AS entries,
+                   COALESCE(SUM(size), 0) AS bytes, COALESCE(SUM(hits), 0) AS hits
+            FROM llm_cache
+            GROUP BY prompt_version, model
+            ORDER BY entries DESC
+        """).fetchall()
+        return {
+            "entries": sum(r["entries"] for r in rows),
+            "bytes": sum(r["bytes"] for r in rows),
+            "hits": sum(r["hits"] for r in rows),
+            "versions": [dict(r) for r in rows],
+        }
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Response cache: {cache_info()}")
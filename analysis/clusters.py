@@ -0,0 +1,348 @@
+"""Incremental clustering of posts into problem categories
+
+``PROBLEM_CATEGORIES`` only covers the problems we already know about. This
+clusters every post's embedding (analysis.embeddings) online, in the spirit
+of mini-batch k-means: posts are read from the matrix past the last
+processed row in ``CLUSTER_CHUNK`` mini-batches, each joins its nearest
+centroid, and each centroid moves to the running mean of its posts. The
+seed categories start from their descriptions, weighted as
+``CLUSTER_SEED_WEIGHT`` posts.
+
+A post further than the novelty threshold from every centroid joins its
+nearest category for now and becomes a candidate. Once
+``CLUSTER_SPAWN_MIN_POSTS`` candidates agree (are closer to one of them
+than the agreement threshold), they start a new cluster together, its
+parent being the nearest existing category. Both thresholds are calibrated
+on a sample of the embedded posts for each mini-batch: hashed
+bag-of-words similarities are low (on-topic posts score 0.07-0.25 against
+the seeds) and shift with the corpus, so a fixed cutoff would either
+spawn a cluster per post or none at all. Candidates carry over between
+runs in ``cluster_candidates``.
+
+New clusters are described by their most common terms and listed as
+emerging once ``CLUSTER_MIN_POSTS`` posts have joined them. Clusters and
+assignments live in ``categories`` and ``post_categories``; each mini-batch
+is logged in ``cluster_runs``, whose last row is where the next run starts,
+so a nightly run only touches the posts added since, plus any post whose
+vector was recomputed (analysis.embeddings clears its similarity).
+"""
+import collections
+
+import numpy as np
+
+from config.settings import (
+    PROBLEM_CATEGORIES, EMBEDDING_DIM, CLUSTER_NOVELTY_THRESHOLD, CLUSTER_NOVELTY_PERCENTILE,
+    CLUSTER_AGREEMENT_PERCENTILE, CLUSTER_SPAWN_MIN_POSTS, CLUSTER_CALIBRATION_SAMPLE,
+    CLUSTER_CANDIDATES_MAX, CLUSTER_MIN_POSTS, CLUSTER_MAX, CLUSTER_SEED_WEIGHT,
+)
+from db import get_connection
+from analysis.cache import normalize_text
+from analysis.gate import TOKEN_RE
+from analysis.embeddings import STOPWORDS, embed_text, embed_pending, open_matrix, row_count
+
+# Posts per mini-batch
+CLUSTER_CHUNK = 4096
+
+# Recent member posts read to describe a discovered cluster
+DESCRIBE_SAMPLE = 50
+
+# Post pairs compared to calibrate the agreement threshold (from this many posts)
+PAIR_SAMPLE = 1000
+
+def top_terms(texts: list, n: int = 6) -> list:
+    """Words found in the most texts"""
+    counts = collections.Counter()
+    for text in texts:
+        counts.update({w for w in TOKEN_RE.findall(normalize_text(text))
+                       if len(w) > 2 and w not in STOPWORDS})
+    return [word for word, _ in counts.most_common(n)]
+
+def seed_categories(conn):
+    """Add the PROBLEM_CATEGORIES seeds (no-op once they have centroids)"""
+    for name, description in PROBLEM_CATEGORIES.items():
+        centroid = embed_text(f"{name.replace('_', ' ')} {description}")
+        conn.execute("INSERT OR IGNORE INTO categories (name, description) VALUES (?, ?)",
+                     (name, description))
+        conn.execute("""
+            UPDATE categories SET centroid = ?, weight = ? WHERE name = ? AND centroid IS NULL
+        """, (centroid.tobytes(), CLUSTER_SEED_WEIGHT, name))
+
+def load_centroids(conn) -> tuple:
+    """(category ids, names, centroid matrix, weights)"""
+    rows = conn.execute("""
+        SELECT id, name, centroid, weight FROM categories
+        WHERE centroid IS NOT NULL ORDER BY id
+    """).fetchall()
+    centroids = [np.frombuffer(row["centroid"], dtype=np.float32) for row in rows]
+    if any(len(c) != EMBEDDING_DIM for c in centroids):
+        raise RuntimeError("Centroids don't match EMBEDDING_DIM; re-cluster with `gtm cluster --reset`")
+    return ([row["id"] for row in rows], [row["name"] for row in rows],
+            np.array(centroids, dtype=np.float32).reshape(len(rows), EMBEDDING_DIM),
+            np.array([row["weight"] or 0.0 for row in rows]))
+
+def calibration_sample(matrix, size: int = CLUSTER_CALIBRATION_SAMPLE, seed: int = 0) -> np.ndarray:
+    """Random embedded posts (those with any words) to calibrate the thresholds on"""
+    n = row_count()
+    if not n:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(n, min(n, size), replace=False))
+    vectors = np.asarray(matrix[rows])
+    return vectors[np.linalg.norm(vectors, axis=1) > 0]
+
+def calibrate(sample: np.ndarray, centroids: np.ndarray) -> dict:
+    """Novelty and agreement thresholds against the current centroids"""
+    if CLUSTER_NOVELTY_THRESHOLD is not None:
+        novelty = CLUSTER_NOVELTY_THRESHOLD
+    elif len(sample) and len(centroids):
+        novelty = float(np.percentile((sample @ centroids.T).max(axis=1), CLUSTER_NOVELTY_PERCENTILE))
+    else:
+        novelty = 0.0
+    pairs = sample[:PAIR_SAMPLE] @ sample[:PAIR_SAMPLE].T
+    pairs = pairs[np.triu_indices(len(pairs), k=1)]
+    # Members of a new cluster should at least be closer to each other than to any old one
+    agreement = max(novelty, float(np.percentile(pairs, CLUSTER_AGREEMENT_PERCENTILE))) \
+        if len(pairs) else 1.0
+    return {"novelty": round(novelty, 4), "agreement": round(agreement, 4)}
+
+def agreeing_groups(vectors: np.ndarray, threshold: float,
+                    min_posts: int = CLUSTER_SPAWN_MIN_POSTS) -> list:
+    """Disjoint groups of at least ``min_posts`` rows, each within ``threshold`` of its first row"""
+    close = (vectors @ vectors.T) >= threshold
+    free = np.ones(len(vectors), dtype=bool)
+    groups = []
+    while free.any():
+        counts = (close & free[None, :]).sum(axis=1) * free
+        i = int(np.argmax(counts))
+        if counts[i] < min_posts:
+            break
+        members = np.flatnonzero(close[i] & free)
+        members = np.concatenate([[i], members[members != i]])
+        groups.append(members)
+        free[members] = False
+    return groups
+
+def spawn_category(conn, vector: np.ndarray, weight: float, parent: str, texts: list,
+                   created_at) -> int:
+    cursor = conn.execute("""
+        INSERT INTO categories (name, description, parent_category, first_seen, last_seen,
+                                centroid, weight)
+        VALUES ('emerging_new', ?, ?, ?, ?, ?, ?)
+    """, (", ".join(top_terms(texts)), parent, created_at,
+          created_at, vector.tobytes(), weight))
+    category_id = cursor.lastrowid
+    conn.execute("UPDATE categories SET name = ? WHERE id = ?", (f"emerging_{category_id}", category_id))
+    return category_id
+
+def spawn_agreeing(conn, state: dict, thresholds: dict) -> tuple:
+    """Start a cluster for each group of agreeing candidates; return (assignments, category indexes)"""
+    pool = state["pool"]
+    if len(pool) < CLUSTER_SPAWN_MIN_POSTS:
+        return [], []
+    vectors = np.array([item["vector"] for item in pool])
+    assigned, spawned = [], []
+    for members in agreeing_groups(vectors, thresholds["agreement"]):
+        if len(state["ids"]) >= CLUSTER_MAX:
+            break
+        centroid = vectors[members].mean(axis=0)
+        centroid /= np.linalg.norm(centroid)
+        parent = state["names"][int(np.argmax(state["centroids"] @ centroid))]
+        items = [pool[m] for m in members]
+        created = sorted(item["created_at"] for item in items if item["created_at"])
+        category_id = spawn_category(conn, centroid, float(len(members)), parent,
+                                     [item["text"] for item in items], created[0] if created else None)
+        state["ids"].append(category_id)
+        state["names"].append(f"emerging_{category_id}")
+        state["centroids"] = np.vstack([state["centroids"], centroid[None, :]])
+        state["weights"] = np.append(state["weights"], float(len(members)))
+        spawned.append(len(state["ids"]) - 1)
+        assigned += [(item["post_id"], category_id, round(float(vectors[m] @ centroid), 4))
+                     for item, m in zip(items, members)]
+    taken = {post_id for post_id, _, _ in assigned}
+    state["pool"] = [item for item in pool if item["post_id"] not in taken]
+    return assigned, spawned
+
+def assign_batch(conn, batch: list, vectors: np.ndarray, state: dict) -> dict:
+    """Assign one mini-batch, spawning clusters where novel posts agree, and move the centroids"""
+    ids, centroids, weights = state["ids"], state["centroids"], state["weights"]
+    # Recalibrated as the centroids move away from the seed descriptions
+    thresholds = calibrate(state["sample"], centroids)
+    sims = vectors @ centroids.T if len(ids) else np.zeros((len(vectors), 0))
+    best = np.argmax(sims, axis=1) if len(ids) else np.full(len(vectors), -1)
+    best_sim = sims[np.arange(len(vectors)), best] if len(ids) else np.full(len(vectors), -1.0)
+    novel = (best_sim < thresholds["novelty"]) & (np.linalg.norm(vectors, axis=1) > 0)
+
+    # Mini-batch update: each centroid becomes the running mean of its posts.
+    # Novel posts only join their nearest category until they have company
+    moving = np.where(novel, -1, best)
+    touched = np.unique(moving[moving >= 0])
+    for c in touched:
+        members = moving == c
+        total = weights[c] + members.sum()
+        centroid = (weights[c] * centroids[c] + vectors[members].sum(axis=0)) / total
+        norm = np.linalg.norm(centroid)
+        centroids[c] = centroid / norm if norm else centroid
+        weights[c] = total
+    state.update(centroids=centroids, weights=weights)
+
+    assigned = [(item["post_id"], ids[c], round(float(s), 4))
+                for item, c, s in zip(batch, best, best_sim) if c >= 0]
+    state["pool"] += [{"post_id": item["post_id"], "vector": vectors[i], "created_at": item["created_at"],
+                       "text": f"{item['title'] or ''} {item['body']}"}
+                      for i, item in enumerate(batch) if novel[i]]
+    grouped, spawned = spawn_agreeing(conn, state, thresholds)
+    # Grouped posts move from their provisional category to the new one
+    regrouped = {post_id for post_id, _, _ in grouped}
+    assigned = [a for a in assigned if a[0] not in regrouped] + grouped
+    state["pool"] = state["pool"][-CLUSTER_CANDIDATES_MAX:]
+
+    changed = [a[0] for a in assigned]
+    previous = set()  # categories losing posts that are assigned again
+    for start in range(0, len(changed), 500):
+        chunk = changed[start:start + 500]
+        previous.update(row[0] for row in conn.execute(f"""
+            SELECT category_id FROM post_categories WHERE post_id IN ({",".join("?" * len(chunk))})
+        """, chunk))
+    conn.executemany("DELETE FROM post_categories WHERE post_id = ?", [(post_id,) for post_id in changed])
+    conn.executemany("""
+        INSERT INTO post_categories (post_id, category_id, similarity) VALUES (?, ?, ?)
+    """, assigned)
+
+    for c in touched:
+        created = [item["created_at"] for item, b in zip(batch, moving) if b == c and item["created_at"]]
+        first, last = (min(created), max(created)) if created else (None, None)
+        conn.execute("""
+            UPDATE categories SET
+                centroid = ?, weight = ?,
+                first_seen = COALESCE(MIN(first_seen, ?), ?, first_seen),
+                last_seen = COALESCE(MAX(last_seen, ?), ?, last_seen)
+            WHERE id = ?
+        """, (state["centroids"][c].tobytes(), float(state["weights"][c]), first, first, last, last, ids[c]))
+    counted = previous | {category_id for _, category_id, _ in assigned}
+    conn.executemany("""
+        UPDATE categories SET
+            post_count = (SELECT COUNT(*) FROM post_categories WHERE category_id = categories.id)
+        WHERE id = ?
+    """, [(category_id,) for category_id in counted])
+
+    return {"assigned": len(assigned), "spawned": len(spawned), **thresholds,
+            "touched": sorted({ids[c] for c in touched} | {ids[c] for c in spawned})}
+
+def describe_categories(conn, category_ids: list):
+    """Refresh the top terms of discovered clusters from their latest posts"""
+    for category_id in category_ids:
+        texts = [row[0] for row in conn.execute("""
+            SELECT COALESCE(p.title, '') || ' ' || substr(COALESCE(p.body, ''), 1, 2000)
+            FROM post_categories pc JOIN posts p ON p.id = pc.post_id
+            WHERE pc.category_id = ? ORDER BY pc.rowid DESC LIMIT ?
+        """, (category_id, DESCRIBE_SAMPLE))]
+        conn.execute("""
+            UPDATE categories SET description = ? WHERE id = ? AND parent_category IS NOT NULL
+        """, (", ".join(top_terms(texts)), category_id))
+
+def load_candidates(conn, matrix) -> list:
+    rows = conn.execute("""
+        SELECT c.post_id, e.row, p.created_at,
+               COALESCE(p.title, '') || ' ' || substr(COALESCE(p.body, ''), 1, 2000) AS text
+        FROM cluster_candidates c
+        JOIN embeddings e ON e.post_id = c.post_id
+        JOIN posts p ON p.id = c.post_id
+        ORDER BY c.rowid
+    """).fetchall()
+    return [{"post_id": row["post_id"], "vector": np.array(matrix[row["row"]]),
+             "created_at": row["created_at"], "text": row["text"]} for row in rows]
+
+def save_candidates(conn, pool: list):
+    kept = [item["post_id"] for item in pool]
+    conn.execute("DELETE FROM cluster_candidates")
+    conn.executemany("INSERT INTO cluster_candidates (post_id) VALUES (?)", [(p,) for p in kept])
+
+def cluster_pending() -> dict:
+    """Embed and assign every post added or re-embedded since the last run"""
+    stats = {"embedded": embed_pending(), "assigned": 0, "spawned": 0}
+    matrix = open_matrix()
+    with get_connection() as conn:
+        seed_categories(conn)
+        ids, names, centroids, weights = load_centroids(conn)
+        watermark = conn.execute("SELECT COALESCE(MAX(last_row), -1) FROM cluster_runs").fetchone()[0]
+        pool = load_candidates(conn, matrix) if matrix is not None else []
+    state = {"ids": ids, "names": names, "centroids": centroids, "weights": weights, "pool": pool,
+             "sample": calibration_sample(matrix) if matrix is not None else None}
+
+    touched = set()
+    # Posts before the watermark that were re-embedded since they were
+    # assigned (their similarity was cleared), then the new ones
+    for stale in (True, False):
+        after = -1 if stale else watermark
+        while matrix is not None:
+            with get_connection() as conn:
+                batch = conn.execute(f"""
+                    SELECT e.row, e.post_id, p.title, substr(COALESCE(p.body, ''), 1, 2000) AS body,
+                           p.created_at
+                    FROM embeddings e JOIN posts p ON p.id = e.post_id
+                    WHERE e.row > ? {"AND e.row <= ? AND NOT EXISTS (SELECT 1 FROM post_categories pc WHERE "
+                                     "pc.post_id = e.post_id AND pc.similarity IS NOT NULL)" if stale else ""}
+                    ORDER BY e.row LIMIT ?
+                """, (after, watermark, CLUSTER_CHUNK) if stale else (after, CLUSTER_CHUNK)).fetchall()
+                if not batch:
+                    break
+                vectors = np.asarray(matrix[[item["row"] for item in batch]])
+                result = assign_batch(conn, batch, vectors, state)
+                save_candidates(conn, state["pool"])
+                after = batch[-1]["row"]
+                if not stale:
+                    watermark = after
+                    conn.execute("""
+                        INSERT INTO cluster_runs (last_row, assigned, spawned) VALUES (?, ?, ?)
+                    """, (watermark, result["assigned"], result["spawned"]))
+            stats["assigned"] += result["assigned"]
+            stats["spawned"] += result["spawned"]
+            stats.update(novelty=result["novelty"], agreement=result["agreement"])
+            touched.update(result["touched"])
+
+    with get_connection() as conn:
+        describe_categories(conn, sorted(touched))
+    return stats
+
+def reset_clusters():
+    """Forget discovered clusters and assignments; the next run starts from the seeds"""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM post_categories")
+        conn.execute("DELETE FROM cluster_runs")
+        conn.execute("DELETE FROM cluster_candidates")
+        conn.execute("DELETE FROM categories WHERE parent_category IS NOT NULL")
+        conn.execute("""
+            UPDATE categories SET centroid = NULL, weight = 0, post_count = 0,
+                                  first_seen = CURRENT_TIMESTAMP, last_seen = NULL
+        """)
+
+def get_categories(days: int = 30, emerging: bool = False, min_posts: int = None,
+                   limit: int = 50) -> list:
+    """Categories with total and recent post counts and mean fit, largest first
+
+    ``emerging`` keeps only discovered clusters first seen in the last ``days``.
+    """
+    query = """
+        SELECT c.id, c.name, c.parent_category, c.description, c.post_count,
+               c.first_seen, c.last_seen,
+               (SELECT COUNT(*) FROM post_categories pc JOIN posts p ON p.id = pc.post_id
+                WHERE pc.category_id = c.id AND p.created_at >= datetime('now', ?)) AS recent,
+               (SELECT AVG(a.fit_score) FROM post_categories pc JOIN analysis a ON a.post_id = pc.post_id
+                WHERE pc.category_id = c.id) AS avg_fit
+        FROM categories c
+        WHERE c.post_count >= ?
+    """
+    params = [f'-{days} days', CLUSTER_MIN_POSTS if min_posts is None else min_posts]
+    if emerging:
+        query += " AND c.parent_category IS NOT NULL AND c.first_seen >= datetime('now', ?)"
+        params.append(f'-{days} days')
+    query += " ORDER BY recent DESC, c.post_count DESC LIMIT ?"
+    params.append(limit)
+    with get_connection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(cluster_pending())
+    for category in get_categories(days=3650, limit=20):
+        print(category)
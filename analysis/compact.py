@@ -0,0 +1,98 @@
+"""Token-budget compaction of post bodies before analysis
+
+Cutting long bodies at a fixed character count spends the budget on
+whatever comes first and drops the closing sentences, which is often where
+people say what they actually need. Instead, bodies over the budget keep
+the sentences carrying problem signal (pain and need phrases, category and
+search terms, questions) plus the opening sentence for context, in their
+original order, with "..." marking the gaps.
+"""
+import re
+
+from config.settings import PROBLEM_CATEGORIES, HN_SEARCH_TERMS
+
+# Changes whenever selection changes, so cached responses aren't reused
+# across different compactions (see analysis.PROMPT_VERSION)
+COMPACT_VERSION = "sentences-v1"
+
+SIGNAL_PHRASES = (
+    "struggl", "need", "looking for", "how do", "how can", "anyone", "recommend",
+    "problem", "issue", "pain", "slow", "expensive", "cost", "latency", "bottleneck",
+    "can't", "cannot", "doesn't scale", "fail", "stuck", "help", "alternative",
+    "migrat", "egress", "outage", "deadline", "production",
+)
+
+def _signal_terms() -> set:
+    terms = set()
+    for category, description in PROBLEM_CATEGORIES.items():
+        terms.update(category.split("_"))
+        terms.update(re.findall(r"[a-z]{4,}", description.lower()))
+    for term in HN_SEARCH_TERMS:
+        terms.update(re.findall(r"[a-z]{3,}", term.lower()))
+    return terms
+
+SIGNAL_TERMS = _signal_terms()
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n+|$)")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+
+def sentence_score(sentence: str) -> float:
+    lower = sentence.lower()
+    if lower.startswith(("[code:", "[quote:")):
+        return 0.0
+    score = 2.0 * sum(1 for phrase in SIGNAL_PHRASES if phrase in lower)
+    score += len(SIGNAL_TERMS & set(re.findall(r"[a-z]+", lower)))
+    if sentence.endswith("?"):
+        score += 2.0
+    return score
+
+def compact_body(body: str, token_budget: int) -> str:
+    """Return ``body`` unchanged if it fits, else its highest-signal sentences"""
+    if estimate_tokens(body) <= token_budget:
+        return body
+
+    sentences = split_sentences(body)
+    scores = [sentence_score(s) for s in sentences]
+    if sentences:
+        scores[0] += 3.0  # The opening usually sets the context
+    # Highest score first, earlier sentences first among ties
+    order = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+
+    chosen, used = set(), 0
+    for i in order:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > token_budget:
+            continue
+        chosen.add(i)
+        used += cost
+
+    if not chosen:
+        # A single sentence over budget: fall back to its prefix
+        return body[:token_budget * 4]
+
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if i != previous + 1:
+            parts.append("...")
+        parts.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        parts.append("...")
+    return " ".join(parts)
+
+if __name__ == "__main__":
+    # Compare prompt body size against the old 3000-character prefix
+    from config.settings import ANALYSIS_BODY_TOKEN_BUDGET
+    from db import get_connection
+
+    with get_connection() as conn:
+        bodies = [row[0] for row in conn.execute("SELECT body FROM posts WHERE body != ''")]
+    before = sum(estimate_tokens(b[:3000]) for b in bodies)
+    after = sum(estimate_tokens(compact_body(b, ANALYSIS_BODY_TOKEN_BUDGET)) for b in bodies)
+    print(f"{len(bodies)} bodies: ~{before:,} tokens as 3000-char prefix, ~{after:,} compacted")
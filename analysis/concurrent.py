@@ -0,0 +1,223 @@
+"""Concurrent analysis engine with adaptive (AIMD) concurrency
+
+``run_analysis`` makes one blocking call per post with a fixed sleep in
+between. This engine keeps many requests in flight using the async
+provider calls (analysis.providers). The number of in-flight requests grows by about
+one per round of successful calls and halves when the provider answers
+429/529 (overloaded), waiting out any ``retry-after`` before sending more.
+A fixed pool of ``ANALYSIS_MAX_CONCURRENCY`` workers takes posts from a
+queue; the limiter decides how many of them may have a request out.
+Results are written to the DB in batches by a single writer. With several
+provider endpoints configured, calls go through analysis.router.
+"""
+import asyncio
+import time
+
+from config.settings import (
+    ANALYSIS_INITIAL_CONCURRENCY, ANALYSIS_MAX_CONCURRENCY, ANALYSIS_MAX_ATTEMPTS,
+)
+from db import get_unanalyzed_posts, insert_analyses, record_analysis_failures
+from analysis import (
+    format_prompt, parse_result, has_enough_content, analysis_row, overload_delay, AnalysisError,
+    ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA, PROMPT_VERSION, response_cache, cached_result,
+    get_router, NotConfiguredError, BudgetExhausted,
+)
+from analysis.providers import default_provider
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease"""
+
+    def __init__(self, initial: int = ANALYSIS_INITIAL_CONCURRENCY,
+                 maximum: int = ANALYSIS_MAX_CONCURRENCY, minimum: int = 1,
+                 decrease: float = 0.5):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                await self._cond.wait()
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            # Wake one waiter per free slot (more than one once the limit has grown)
+            self._cond.notify(max(1, int(self.limit) - self.in_flight))
+
+    def on_success(self):
+        # +1 per `limit` successes, i.e. roughly +1 per round trip
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_overload(self, retry_after: float):
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + retry_after)
+        # Requests already in flight will all see the same overload;
+        # only back off once per pause
+        if now - self.last_decrease > retry_after:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.last_decrease = now
+
+class BatchedWriter:
+    """Collects analysis rows, response cache entries and failures and writes them in batches"""
+
+    def __init__(self, stats: dict, batch_size: int = 25):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.pending = []
+        self.cache_entries = []
+        self.failures = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, row: dict, cache_entry: tuple = None):
+        """Queue an analysis row and, for a fresh answer, its ``response_cache.put_many`` entry"""
+        self.pending.append(row)
+        if cache_entry:
+            self.cache_entries.append(cache_entry)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def fail(self, post_id: str, error: str):
+        self.failures.append((post_id, error))
+        self.stats["failed"] += 1
+        if len(self.failures) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            rows, self.pending = self.pending, []
+            failures, self.failures = self.failures, []
+            cache_entries, self.cache_entries = self.cache_entries, []
+            if cache_entries:
+                try:
+                    await asyncio.to_thread(response_cache.put_many, cache_entries)
+                except Exception as e:
+                    print(f"Error caching responses: {e}")
+            if failures:
+                try:
+                    await asyncio.to_thread(record_analysis_failures, failures)
+                except Exception as e:
+                    print(f"Error recording analysis failures: {e}")
+            if not rows:
+                return
+            try:
+                inserted = await asyncio.to_thread(insert_analyses, rows)
+            except Exception as e:
+                print(f"Error inserting analysis batch: {e}")
+                self.stats["errors"] += len(rows)
+                return
+            self.stats["analyzed"] += inserted
+            self.stats["high_fit"] += sum(1 for r in rows if (r["fit_score"] or 0) >= 7)
+
+def make_caller():
+    """Return an async ``prompt -> (response text, model)`` function for the configured provider"""
+    router = get_router()
+    if router:
+        # Failover happens inside the router; overloads only reach the
+        # limiter once every endpoint is overloaded
+        async def call(prompt: str) -> tuple:
+            return await router.complete(prompt, 500, ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA)
+        return call
+
+    # Async provider clients have SDK retries disabled, so rate limits reach the limiter
+    provider = default_provider()
+    if provider is not None:
+        async def call(prompt: str) -> tuple:
+            return await provider.acomplete(prompt, 500), provider.model
+        return call
+
+    raise NotConfiguredError("No API key configured for analysis")
+
+async def _analyze_one(post, call, limiter: AIMDLimiter, writer: BatchedWriter, stats: dict):
+    # SQLite lookups run off the event loop so they don't hold up requests in flight
+    cached = await asyncio.to_thread(cached_result, post.title, post.body, PROMPT_VERSION)
+    if cached is not None:
+        result, model = cached
+        await writer.add(analysis_row(post.id, result, model_used=model))
+        return
+
+    prompt = format_prompt(post.title, post.body, post.source, post.url)
+
+    for _ in range(ANALYSIS_MAX_ATTEMPTS):
+        await limiter.acquire()
+        try:
+            text, model = await call(prompt)
+        except BudgetExhausted as e:
+            # Not the post's fault: it stays queued for tomorrow's budget
+            if not stats.get("budget_exhausted"):
+                print(f"Stopping: {e}")
+            stats["budget_exhausted"] = True
+            return
+        except Exception as e:
+            delay = overload_delay(e)
+            if delay is None:
+                print(f"Analysis API error for {post.id}: {e}")
+                stats["errors"] += 1
+                await writer.fail(post.id, str(e))
+                return
+            limiter.on_overload(delay)
+            stats["rate_limited"] += 1
+            continue
+        finally:
+            await limiter.release()
+
+        limiter.on_success()
+        try:
+            result = parse_result(text)
+        except AnalysisError as e:
+            stats["errors"] += 1
+            await writer.fail(post.id, str(e))
+            return
+        await writer.add(analysis_row(post.id, result, model_used=model),
+                         (post.title, post.body, PROMPT_VERSION, model, result))
+        return
+
+    print(f"Giving up on {post.id} after {ANALYSIS_MAX_ATTEMPTS} rate-limited attempts")
+    stats["errors"] += 1
+
+async def analyze_posts_async(posts: list, call=None, limiter: AIMDLimiter = None) -> dict:
+    """Analyze posts concurrently, return the same stats as ``run_analysis``"""
+    stats = {"analyzed": 0, "skipped": 0, "errors": 0, "high_fit": 0, "rate_limited": 0,
+             "failed": 0}
+    call = call or make_caller()
+    limiter = limiter or AIMDLimiter()
+    writer = BatchedWriter(stats)
+
+    queue = asyncio.Queue()
+    for post in posts:
+        if not has_enough_content(post):
+            stats["skipped"] += 1
+            continue
+        queue.put_nowait(post)
+
+    async def worker():
+        while not queue.empty() and not stats.get("budget_exhausted"):
+            await _analyze_one(queue.get_nowait(), call, limiter, writer, stats)
+
+    await asyncio.gather(*(worker() for _ in range(min(limiter.maximum, queue.qsize()))))
+    await writer.flush()
+    stats["concurrency"] = round(limiter.limit, 1)
+    return stats
+
+def run_analysis_concurrent(batch_size: int = 100) -> dict:
+    """Synchronous entry point for the concurrent engine"""
+    posts = get_unanalyzed_posts(limit=batch_size)
+    return asyncio.run(analyze_posts_async(posts))
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    stats = run_analysis_concurrent(batch_size=50)
+    print(f"Analysis complete: {stats}")
@@ -0,0 +1,307 @@
+"""Local vector index over posts for "more leads like this one"
+
+Embeddings are CPU-only: signed feature hashing of a post's words and
+bigrams (log-scaled counts, stopwords dropped) into ``EMBEDDING_DIM``
+dimensions, L2-normalized. Once a post has been analyzed, the vector of its
+problem summary is blended in, so posts describing the same pain land close
+together even when they use different words.
+
+Vectors live in one contiguous float32 matrix in a memory-mapped file
+(``EMBEDDINGS_PATH``); the ``embeddings`` table maps each post to its row.
+Searches stream the matrix in ``EMBEDDING_CHUNK_ROWS`` blocks through a
+batched NumPy dot product and keep a running top-k, so the matrix is never
+loaded into RAM as a whole. For millions of rows, ``build_ivf`` clusters
+the vectors (k-means) into an inverted file index; a search then only
+scores the rows of the ``EMBEDDING_IVF_NPROBE`` nearest clusters plus any
+rows added since the index was built.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from config.settings import (
+    EMBEDDINGS_PATH, EMBEDDING_IVF_PATH, EMBEDDING_DIM, EMBEDDING_CHUNK_ROWS,
+    EMBEDDING_IVF_NPROBE, EMBEDDING_SUMMARY_WEIGHT,
+)
+from db import get_connection
+from analysis.cache import normalize_text
+from analysis.gate import TOKEN_RE
+
+# Body characters embedded per post
+MAX_TEXT_CHARS = 8000
+
+# Posts embedded per round trip
+EMBED_CHUNK = 2000
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have how i if in is it its just me my
+not of on or our so that the their them then there they this to was we what when which
+who will with you your would could should been being into about than also any all
+""".split())
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Unit-length hashed bag of words and bigrams (zeros for empty text)"""
+    words = [w for w in TOKEN_RE.findall(normalize_text(text)) if w not in STOPWORDS and len(w) > 1]
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    if not grams:
+        return vector
+    hashes = np.array([zlib.crc32(g.encode()) for g in grams], dtype=np.int64)
+    buckets, counts = np.unique(hashes, return_counts=True)
+    # Low bits pick the dimension, one higher bit the sign, so collisions cancel out
+    signs = np.where((buckets >> 20) & 1, 1.0, -1.0)
+    np.add.at(vector, buckets % dim, signs * (1.0 + np.log(counts)))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def embed_post(title: str, body: str, summary: str = None) -> np.ndarray:
+    vector = embed_text(f"{title or ''}\n{(body or '')[:MAX_TEXT_CHARS]}")
+    if summary:
+        vector = vector + EMBEDDING_SUMMARY_WEIGHT * embed_text(summary)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+    return vector.astype(np.float32)
+
+def row_count() -> int:
+    """Rows in use in the matrix"""
+    with get_connection() as conn:
+        return conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings").fetchone()[0]
+
+def open_matrix(rows: int = 0, mode: str = "r", path=EMBEDDINGS_PATH):
+    """Memory-map the matrix, growing the file to hold at least ``rows`` rows
+
+    Returns None when there is no matrix yet and nothing to write.
+    """
+    row_bytes = EMBEDDING_DIM * 4
+    capacity = path.stat().st_size // row_bytes if path.exists() else 0
+    if rows > capacity:
+        # Grow geometrically; the new tail is sparse until written
+        capacity = max(rows, capacity * 2, 1024)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as f:
+            f.truncate(capacity * row_bytes)
+    if capacity == 0:
+        return None
+    return np.memmap(path, dtype=np.float32, mode=mode, shape=(capacity, EMBEDDING_DIM))
+
+def embed_pending() -> int:
+    """Embed new posts and re-embed posts whose summary arrived since; return how many"""
+    embedded = 0
+    while True:
+        with get_connection() as conn:
+            pending = conn.execute("""
+                SELECT p.id, p.title, p.body, a.problem_summary, e.row
+                FROM posts p
+                LEFT JOIN analysis a ON a.post_id = p.id
+                LEFT JOIN embeddings e ON e.post_id = p.id
+                WHERE e.post_id IS NULL
+                OR (e.with_summary = 0 AND COALESCE(a.problem_summary, '') != '')
+                LIMIT ?
+            """, (EMBED_CHUNK,)).fetchall()
+            if not pending:
+                return embedded
+
+            next_row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings").fetchone()[0]
+            rows = []
+            for item in pending:
+                if item["row"] is None:
+                    rows.append(next_row)
+                    next_row += 1
+                else:
+                    rows.append(item["row"])
+
+            matrix = open_matrix(next_row, mode="r+")
+            for item, row in zip(pending, rows):
+                matrix[row] = embed_post(item["title"], item["body"], item["problem_summary"])
+            matrix.flush()
+            del matrix
+
+            # Only map rows once their vectors are on disk
+            conn.executemany("""
+                INSERT OR REPLACE INTO embeddings (post_id, row, with_summary, embedded_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """, [(item["id"], row, int(bool(item["problem_summary"])))
+                  for item, row in zip(pending, rows)])
+            # A recomputed vector has to be clustered again (analysis.clusters)
+            conn.executemany("UPDATE post_categories SET similarity = NULL WHERE post_id = ?",
+                             [(item["id"],) for item in pending if item["row"] is not None])
+        embedded += len(pending)
+
+def _merge_top_k(best: tuple, scores: np.ndarray, rows: np.ndarray, k: int) -> tuple:
+    """Merge candidate (scores, rows) into the running per-query best"""
+    if best is not None:
+        scores = np.concatenate([best[0], scores], axis=1)
+        rows = np.concatenate([best[1], rows], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+def top_k_exact(queries: np.ndarray, k: int, start_row: int = 0) -> tuple:
+    """Best ``k`` rows for each query by streaming the matrix in chunks
+
+    ``queries`` is (Q, dim); returns (scores, rows), each (Q, <=k), unsorted.
+    """
+    n = row_count()
+    matrix = open_matrix()
+    best = None
+    if matrix is None:
+        return np.zeros((len(queries), 0)), np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(start_row, n, EMBEDDING_CHUNK_ROWS):
+        end = min(n, start + EMBEDDING_CHUNK_ROWS)
+        scores = queries @ np.asarray(matrix[start:end]).T
+        rows = np.broadcast_to(np.arange(start, end), scores.shape)
+        best = _merge_top_k(best, scores, rows, k)
+    if best is None:
+        return np.zeros((len(queries), 0)), np.zeros((len(queries), 0), dtype=np.int64)
+    return best
+
+def spherical_kmeans(sample: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids for cosine similarity"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms > 0, norms, 1)
+    return centroids
+
+def build_ivf(clusters: int = None, sample_size: int = 100_000, seed: int = 0,
+              path=EMBEDDING_IVF_PATH) -> dict:
+    """Cluster the matrix into an inverted file index and save it"""
+    n = row_count()
+    matrix = open_matrix()
+    if matrix is None or n < 2:
+        raise RuntimeError("Not enough embedded posts to build an index")
+    clusters = min(n, clusters or max(1, int(np.sqrt(n))))
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(n, min(n, sample_size), replace=False))
+    centroids = spherical_kmeans(np.asarray(matrix[sample_rows]), clusters, seed=seed)
+
+    assign = np.empty(n, dtype=np.int32)
+    for start in range(0, n, EMBEDDING_CHUNK_ROWS):
+        end = min(n, start + EMBEDDING_CHUNK_ROWS)
+        assign[start:end] = np.argmax(np.asarray(matrix[start:end]) @ centroids.T, axis=1)
+
+    order = np.argsort(assign, kind="stable")
+    offsets = np.searchsorted(assign[order], np.arange(clusters + 1))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, centroids=centroids, rows=order.astype(np.int64), offsets=offsets, indexed=n)
+    return {"rows": n, "clusters": clusters}
+
+def load_ivf(path=EMBEDDING_IVF_PATH):
+    """(centroids, rows, offsets, indexed row count) or None"""
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return data["centroids"], data["rows"], data["offsets"], int(data["indexed"])
+
+def top_k_ivf(queries: np.ndarray, k: int, index: tuple, nprobe: int = EMBEDDING_IVF_NPROBE) -> tuple:
+    """Approximate top-k: rows in the nearest clusters plus rows added after the index"""
+    centroids, rows, offsets, indexed = index
+    matrix = open_matrix()
+    probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+    results = []
+    for query, lists in zip(queries, probes):
+        candidates = np.sort(np.concatenate([rows[offsets[c]:offsets[c + 1]] for c in lists]))
+        scores = (np.asarray(matrix[candidates]) @ query)[None, :]
+        results.append(_merge_top_k(None, scores, candidates[None, :], k))
+
+    # Rows embedded since the index was built are scanned exactly
+    tail = top_k_exact(queries, k, start_row=indexed)
+    merged = [_merge_top_k((tail[0][i:i + 1], tail[1][i:i + 1]), s, r, k)
+              for i, (s, r) in enumerate(results)]
+    width = max(s.shape[1] for s, _ in merged)
+    scores = np.full((len(queries), width), -np.inf)
+    found = np.full((len(queries), width), -1, dtype=np.int64)
+    for i, (s, r) in enumerate(merged):
+        scores[i, :s.shape[1]], found[i, :r.shape[1]] = s[0], r[0]
+    return scores, found
+
+def vectors_for(post_ids: list) -> dict:
+    """Stored vectors of these posts (embedding any that are pending first)"""
+    placeholders = ",".join("?" * len(post_ids))
+    with get_connection() as conn:
+        mapped = conn.execute(
+            f"SELECT post_id, row FROM embeddings WHERE post_id IN ({placeholders})", post_ids
+        ).fetchall()
+    if len(mapped) < len(post_ids):
+        embed_pending()
+        with get_connection() as conn:
+            mapped = conn.execute(
+                f"SELECT post_id, row FROM embeddings WHERE post_id IN ({placeholders})", post_ids
+            ).fetchall()
+    matrix = open_matrix()
+    return {r["post_id"]: np.array(matrix[r["row"]]) for r in mapped}
+
+def search(queries: np.ndarray, k: int = 10, exact: bool = False) -> list:
+    """Nearest posts per query vector as lists of (post_id, similarity), best first"""
+    index = None if exact else load_ivf()
+    if index is not None:
+        scores, rows = top_k_ivf(queries, k, index)
+    else:
+        scores, rows = top_k_exact(queries, k)
+
+    wanted = sorted({int(r) for r in rows.ravel() if r >= 0})
+    with get_connection() as conn:
+        post_ids = {}
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            post_ids.update(conn.execute(
+                f"SELECT row, post_id FROM embeddings WHERE row IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+
+    results = []
+    for query_scores, query_rows in zip(scores, rows):
+        order = np.argsort(-query_scores)
+        results.append([(post_ids[int(query_rows[i])], round(float(query_scores[i]), 4))
+                        for i in order if int(query_rows[i]) in post_ids])
+    return results
+
+def similar_posts(post_id: str, k: int = 10, exact: bool = False) -> list:
+    """(post_id, similarity) of the ``k`` posts nearest to ``post_id``, best first"""
+    vector = vectors_for([post_id]).get(post_id)
+    if vector is None:
+        raise KeyError(f"Unknown post {post_id}")
+    neighbours = search(vector[None, :], k + 1, exact=exact)[0]
+    return [(other, score) for other, score in neighbours if other != post_id][:k]
+
+def describe(neighbours: list) -> list:
+    """Post and analysis fields for (post_id, similarity) pairs, in order"""
+    if not neighbours:
+        return []
+    post_ids = [post_id for post_id, _ in neighbours]
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT p.id, p.source, p.title, p.url, a.fit_score, a.use_case, a.problem_summary
+            FROM posts p LEFT JOIN analysis a ON a.post_id = p.id
+            WHERE p.id IN ({",".join("?" * len(post_ids))})
+        """, post_ids).fetchall()
+    by_id = {row["id"]: dict(row) for row in rows}
+    return [{**by_id[post_id], "similarity": score} for post_id, score in neighbours if post_id in by_id]
+
+def reset_embeddings():
+    """Forget every vector (e.g. after changing EMBEDDING_DIM)"""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM embeddings")
+    for path in (EMBEDDINGS_PATH, EMBEDDING_IVF_PATH):
+        if path.exists():
+            path.unlink()
+
+if __name__ == "__main__":
+    import time
+    from db import init_db
+    init_db()
+    print(f"Embedded {embed_pending()} posts, {row_count()} rows in the matrix")
+    with get_connection() as conn:
+        row = conn.execute("SELECT post_id FROM embeddings ORDER BY RANDOM() LIMIT 1").fetchone()
+    if row:
+        start = time.monotonic()
+        neighbours = similar_posts(row["post_id"], exact=True)
+        print(f"Nearest to {row['post_id']} in {(time.monotonic() - start) * 1000:.1f} ms: {neighbours}")
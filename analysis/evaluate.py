@@ -0,0 +1,166 @@
+"""Offline evaluation of a candidate model or prompt
+
+``eval_set`` is a fixed, stratified sample of analyzed posts together with
+the scores they had when it was built (the reference labels). ``evaluate``
+replays those posts through a candidate provider/model, optionally with a
+different system prompt, and reports agreement with the labels (fit error,
+high-fit precision/recall, use case match), cost and latency. Nothing is
+written to ``analysis``, so a cheaper model can be judged before re-scoring
+anything. Each run's metrics are kept in ``eval_runs``; its calls are
+logged in ``llm_calls`` with purpose ``eval`` and count against the daily
+analysis budget.
+"""
+import asyncio
+import json
+import random
+import time
+
+from config.settings import ANALYSIS_PROVIDER, ANALYSIS_BODY_TOKEN_BUDGET
+from db import get_connection
+from analysis import (
+    ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA, ANALYSIS_PROMPT, POST_TEMPLATE, PROMPT_VERSION,
+    format_prompt, parse_result, AnalysisError, StopAnalysis, telemetry, response_cache,
+)
+from analysis import budget
+from analysis.compact import COMPACT_VERSION
+from analysis.providers import make_provider
+from analysis.rescore import FIT_BANDS
+
+# Requests in flight while replaying the set
+EVAL_CONCURRENCY = 8
+
+def build_eval_set(size: int = 200, seed: int = 0) -> int:
+    """Replace the labeled set with a stratified sample of current analyses"""
+    rng = random.Random(seed)
+    per_band, extra = divmod(size, len(FIT_BANDS))
+    with get_connection() as conn:
+        chosen = []
+        for i, (low, high) in enumerate(FIT_BANDS):
+            band = conn.execute("""
+                SELECT a.post_id, a.fit_score, a.urgency_score, a.use_case, a.model_used,
+                       a.prompt_version
+                FROM analysis a JOIN posts p ON p.id = a.post_id
+                WHERE a.fit_score BETWEEN ? AND ?
+                ORDER BY a.post_id
+            """, (low, high)).fetchall()
+            take = per_band + (1 if i < extra else 0)
+            chosen += rng.sample(band, min(take, len(band)))
+
+        conn.execute("DELETE FROM eval_set")
+        conn.executemany("""
+            INSERT INTO eval_set (post_id, fit_score, urgency_score, use_case, label_model,
+                                  label_prompt_version)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [tuple(row) for row in chosen])
+    return len(chosen)
+
+def load_eval_set(limit: int = None) -> list:
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT e.post_id, e.fit_score, e.urgency_score, e.use_case,
+                   p.title, p.body, p.source, p.url
+            FROM eval_set e JOIN posts p ON p.id = e.post_id
+            ORDER BY e.post_id LIMIT ?
+        """, (limit if limit is not None else -1,)).fetchall()
+
+async def _replay(provider, system: str, items: list) -> list:
+    """(label row, result or None, usage, latency ms, error) per item"""
+    semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+    async def one(item):
+        async with semaphore:
+            prompt = format_prompt(item["title"], item["body"], item["source"], item["url"])
+            start = time.monotonic()
+            try:
+                with budget.reserve("eval", provider.model, system, prompt, ANALYSIS_SCHEMA, 500), \
+                        telemetry.track(provider.name, provider.model, purpose="eval") as call:
+                    text, call.usage = await provider.arequest(system, prompt, 500, ANALYSIS_SCHEMA)
+            except StopAnalysis:
+                raise
+            except Exception as e:
+                return item, None, None, None, str(e)
+            latency = int((time.monotonic() - start) * 1000)
+            try:
+                return item, parse_result(text), call.usage, latency, None
+            except AnalysisError as e:
+                return item, None, call.usage, latency, str(e)
+
+    return await asyncio.gather(*(one(item) for item in items))
+
+def mean(values) -> float:
+    values = list(values)
+    return round(sum(values) / len(values), 3) if values else None
+
+def score_agreement(outcomes: list) -> dict:
+    """Agreement of candidate results with the labels"""
+    answered = [(item, result) for item, result, *_ in outcomes if result is not None]
+    labeled_high = sum(1 for item, _ in answered if item["fit_score"] >= 7)
+    predicted_high = sum(1 for _, result in answered if result["fit_score"] >= 7)
+    both_high = sum(1 for item, result in answered
+                    if item["fit_score"] >= 7 and result["fit_score"] >= 7)
+    return {
+        "posts": len(outcomes),
+        "answered": len(answered),
+        "errors": len(outcomes) - len(answered),
+        "fit_mae": mean(abs(r["fit_score"] - i["fit_score"]) for i, r in answered),
+        "fit_within_1": mean(abs(r["fit_score"] - i["fit_score"]) <= 1 for i, r in answered),
+        "urgency_mae": mean(abs(r["urgency_score"] - i["urgency_score"]) for i, r in answered),
+        "use_case_match": mean(r["use_case"] == i["use_case"] for i, r in answered),
+        "high_fit_precision": round(both_high / predicted_high, 3) if predicted_high else None,
+        "high_fit_recall": round(both_high / labeled_high, 3) if labeled_high else None,
+    }
+
+def evaluate(provider: str = ANALYSIS_PROVIDER, model: str = None, system_prompt: str = None,
+             limit: int = None) -> dict:
+    """Replay the labeled set through a candidate and return (and store) its metrics"""
+    items = load_eval_set(limit)
+    if not items:
+        raise RuntimeError("Labeled set is empty; build it first (gtm eval --build)")
+    candidate = make_provider(provider, model)
+    system = system_prompt or ANALYSIS_SYSTEM_PROMPT
+    version = PROMPT_VERSION if system_prompt is None else response_cache.prompt_version(
+        system, ANALYSIS_PROMPT, POST_TEMPLATE, json.dumps(ANALYSIS_SCHEMA),
+        f"{COMPACT_VERSION}:{ANALYSIS_BODY_TOKEN_BUDGET}",
+    )
+
+    start = time.monotonic()
+    outcomes = asyncio.run(_replay(candidate, system, items))
+    telemetry.flush()
+
+    latencies = sorted(o[3] for o in outcomes if o[3] is not None)
+    costs = [telemetry.call_cost(candidate.model, o[2]) for o in outcomes if o[2]]
+    tokens = sum(o[2].get("input_tokens", 0) + o[2].get("output_tokens", 0)
+                 + o[2].get("cache_read_tokens", 0) for o in outcomes if o[2])
+    metrics = {
+        **score_agreement(outcomes),
+        "wall_seconds": round(time.monotonic() - start, 1),
+        "p50_ms": telemetry.percentile(latencies, 0.5),
+        "p95_ms": telemetry.percentile(latencies, 0.95),
+        "tokens_per_post": round(tokens / len(outcomes)),
+        "cost_usd": sum(costs) if costs and None not in costs else None,
+    }
+    metrics["cost_per_post"] = metrics["cost_usd"] / len(outcomes) if metrics["cost_usd"] is not None else None
+
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO eval_runs (provider, model, prompt_version, metrics)
+            VALUES (?, ?, ?, ?)
+        """, (candidate.name, candidate.model, version, json.dumps(metrics)))
+    return {"provider": candidate.name, "model": candidate.model, "prompt_version": version, **metrics}
+
+def get_eval_runs(limit: int = 10) -> list:
+    """Recent evaluation runs, newest first"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT id, provider, model, prompt_version, metrics, run_at
+            FROM eval_runs ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
+    return [{**{k: row[k] for k in row.keys() if k != "metrics"}, **json.loads(row["metrics"])}
+            for row in rows]
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    if not load_eval_set(1):
+        print(f"Built labeled set of {build_eval_set()} posts")
+    print(evaluate())
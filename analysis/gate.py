@@ -0,0 +1,243 @@
+"""Local pre-filter that decides which posts are worth an LLM call
+
+Most posts the crawlers pick up score 0-3. This is a CPU-only logistic
+regression over hashed word unigrams/bigrams, trained from the labels
+already in ``analysis`` (fit_score >= GATE_POSITIVE_FIT is relevant).
+
+- training holds out part of the labels (by a hash of the post id), picks
+  the threshold on one half so GATE_TARGET_RECALL of relevant posts pass,
+  and reports recall and pass rate on the other half
+- before each analysis run, pending posts are scored in vectorized
+  batches and the decision is stored in ``gate_decisions``; rejected posts
+  are left out of ``get_unanalyzed_posts``
+- GATE_SAMPLE_RATE of rejected posts go to the LLM anyway, and
+  ``gate_report`` shows how many of those turned out relevant (drift)
+"""
+import json
+import random
+import re
+import time
+import zlib
+
+import numpy as np
+
+from config.settings import (
+    GATE_MODEL_PATH, GATE_POSITIVE_FIT, GATE_TARGET_RECALL, GATE_SAMPLE_RATE,
+    GATE_MIN_LABELS,
+)
+from db import get_connection
+from analysis.cache import normalize_text
+
+FEATURE_BITS = 18
+N_FEATURES = 1 << FEATURE_BITS
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+# Posts scored per vectorized batch
+SCORE_CHUNK = 5000
+
+def features(title: str, body: str, source: str) -> np.ndarray:
+    """Hashed unigram + bigram feature indices for one post"""
+    words = TOKEN_RE.findall(normalize_text(f"{title or ''} {body or ''}"))
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    grams.append(f"source={source}")
+    hashed = [zlib.crc32(g.encode()) & (N_FEATURES - 1) for g in grams]
+    return np.unique(np.array(hashed, dtype=np.int64))
+
+def stack(docs: list) -> tuple:
+    """Concatenate per-post feature arrays into (indices, values, doc_ids)
+
+    Values are 1/sqrt(n) so every post has unit L2 norm.
+    """
+    lengths = np.array([len(d) for d in docs])
+    indices = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int64)
+    doc_ids = np.repeat(np.arange(len(docs)), lengths)
+    values = 1.0 / np.sqrt(lengths[doc_ids])
+    return indices, values, doc_ids
+
+def decision_scores(weights: np.ndarray, bias: float, batch: tuple, n_docs: int) -> np.ndarray:
+    indices, values, doc_ids = batch
+    return bias + np.bincount(doc_ids, weights=weights[indices] * values, minlength=n_docs)
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+def fit_logistic(docs: list, labels: np.ndarray, epochs: int = 10, lr: float = 2.0,
+                 l2: float = 1e-5, batch_size: int = 256, seed: int = 0) -> tuple:
+    """Mini-batch SGD on class-balanced log loss, return (weights, bias)"""
+    rng = np.random.default_rng(seed)
+    weights = np.zeros(N_FEATURES)
+    bias = 0.0
+
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    sample_weight = np.where(labels == 1, len(labels) / (2 * max(positives, 1)),
+                             len(labels) / (2 * max(negatives, 1)))
+
+    for _ in range(epochs):
+        order = rng.permutation(len(docs))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = stack([docs[i] for i in rows])
+            error = (sigmoid(decision_scores(weights, bias, batch, len(rows))) - labels[rows])
+            error *= sample_weight[rows]
+            indices, values, doc_ids = batch
+            grad = np.bincount(indices, weights=error[doc_ids] * values, minlength=N_FEATURES)
+            weights -= lr * (grad / len(rows) + l2 * weights)
+            bias -= lr * error.mean()
+    return weights, bias
+
+def recall_threshold(scores: np.ndarray, labels: np.ndarray, target: float) -> float:
+    """Threshold passing at least ``target`` of the positives
+
+    Lowered to halfway to the next negative below it, which lets through
+    no more calibration negatives and leaves margin for unseen positives.
+    """
+    positive = np.sort(scores[labels == 1])
+    if len(positive) == 0:
+        return float("-inf")
+    threshold = positive[int(np.floor((1 - target) * len(positive)))]
+    below = scores[(labels == 0) & (scores < threshold)]
+    if len(below):
+        threshold = (threshold + below.max()) / 2
+    return float(threshold)
+
+def evaluate(scores: np.ndarray, labels: np.ndarray, threshold: float) -> dict:
+    passed = scores >= threshold
+    positives = labels == 1
+    return {
+        "examples": int(len(labels)),
+        "positives": int(positives.sum()),
+        "recall": round(float(passed[positives].mean()), 3) if positives.any() else None,
+        "pass_rate": round(float(passed.mean()), 3) if len(labels) else None,
+    }
+
+def split_bucket(post_id: str) -> int:
+    """0-99, stable per post: <70 train, <85 calibration, else test"""
+    return zlib.crc32(f"gate:{post_id}".encode()) % 100
+
+def load_labeled() -> list:
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT p.id, p.title, p.body, p.source, a.fit_score
+            FROM analysis a JOIN posts p ON p.id = a.post_id
+            WHERE a.model_used NOT LIKE 'local-%'
+        """).fetchall()
+
+def train_gate(path=GATE_MODEL_PATH, target_recall: float = GATE_TARGET_RECALL) -> dict:
+    """Train on LLM labels, calibrate the threshold, save the model and return held-out metrics"""
+    rows = load_labeled()
+    if len(rows) < GATE_MIN_LABELS:
+        raise RuntimeError(f"Need at least {GATE_MIN_LABELS} analyzed posts to train, have {len(rows)}")
+
+    docs = [features(r["title"], r["body"], r["source"]) for r in rows]
+    labels = np.array([1 if (r["fit_score"] or 0) >= GATE_POSITIVE_FIT else 0 for r in rows])
+    buckets = np.array([split_bucket(r["id"]) for r in rows])
+    train, calib, test = buckets < 70, (buckets >= 70) & (buckets < 85), buckets >= 85
+
+    def subset(mask):
+        return [docs[i] for i in np.flatnonzero(mask)], labels[mask]
+
+    train_docs, train_labels = subset(train)
+    weights, bias = fit_logistic(train_docs, train_labels)
+
+    def score(mask):
+        chosen, chosen_labels = subset(mask)
+        return decision_scores(weights, bias, stack(chosen), len(chosen)), chosen_labels
+
+    calib_scores, calib_labels = score(calib)
+    threshold = recall_threshold(calib_scores, calib_labels, target_recall)
+    test_scores, test_labels = score(test)
+
+    meta = {
+        "version": f"{int(time.time()):x}",
+        "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "positive_fit": GATE_POSITIVE_FIT,
+        "target_recall": target_recall,
+        "train": evaluate(decision_scores(weights, bias, stack(train_docs), len(train_docs)),
+                          train_labels, threshold),
+        "test": evaluate(test_scores, test_labels, threshold),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, weights=weights.astype(np.float32), bias=bias,
+                        threshold=threshold, meta=json.dumps(meta))
+
+    # Rejections by the old model never reached the LLM, so re-scoring them is free
+    with get_connection() as conn:
+        conn.execute("DELETE FROM gate_decisions WHERE passed = 0 AND sampled = 0")
+    return meta
+
+def load_model(path=GATE_MODEL_PATH):
+    """(weights, bias, threshold, meta) or None if no model has been trained"""
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return (data["weights"].astype(np.float64), float(data["bias"]),
+                float(data["threshold"]), json.loads(str(data["meta"])))
+
+def gate_pending(path=GATE_MODEL_PATH, sample_rate: float = GATE_SAMPLE_RATE) -> dict:
+    """Score unanalyzed posts that have no decision yet and record the outcome"""
+    stats = {"scored": 0, "passed": 0, "rejected": 0, "sampled": 0}
+    model = load_model(path)
+    if model is None:
+        return stats
+    weights, bias, threshold, meta = model
+
+    with get_connection() as conn:
+        pending = conn.execute("""
+            SELECT p.id, p.title, p.body, p.source FROM posts p
+            WHERE NOT EXISTS (SELECT 1 FROM analysis a WHERE a.post_id = p.id)
+            AND NOT EXISTS (SELECT 1 FROM gate_decisions g WHERE g.post_id = p.id)
+        """).fetchall()
+
+    for start in range(0, len(pending), SCORE_CHUNK):
+        chunk = pending[start:start + SCORE_CHUNK]
+        docs = [features(r["title"], r["body"], r["source"]) for r in chunk]
+        scores = decision_scores(weights, bias, stack(docs), len(docs))
+
+        decisions = []
+        for row, score in zip(chunk, scores):
+            passed = score >= threshold
+            sampled = not passed and random.random() < sample_rate
+            decisions.append((row["id"], float(score), int(passed), int(sampled), meta["version"]))
+            stats["passed" if passed else "rejected"] += 1
+            stats["sampled"] += sampled
+
+        with get_connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO gate_decisions (post_id, score, passed, sampled, model_version)
+                VALUES (?, ?, ?, ?, ?)
+            """, decisions)
+        stats["scored"] += len(chunk)
+
+    return stats
+
+def gate_report(path=GATE_MODEL_PATH) -> dict:
+    """Held-out metrics from training plus live pass rate and drift on sampled rejects"""
+    model = load_model(path)
+    report = {"model": model[3] if model else None}
+
+    with get_connection() as conn:
+        report["decisions"] = dict(conn.execute("""
+            SELECT CASE WHEN passed THEN 'passed' WHEN sampled THEN 'sampled' ELSE 'rejected' END,
+                   COUNT(*)
+            FROM gate_decisions GROUP BY 1
+        """).fetchall())
+        # Rejected posts the LLM scored anyway: relevant ones are misses
+        row = conn.execute("""
+            SELECT COUNT(*) AS analyzed,
+                   COALESCE(SUM(a.fit_score >= ?), 0) AS relevant
+            FROM gate_decisions g JOIN analysis a ON a.post_id = g.post_id
+            WHERE g.passed = 0 AND g.sampled = 1
+        """, (GATE_POSITIVE_FIT,)).fetchone()
+    report["drift"] = {
+        "sampled_analyzed": row["analyzed"],
+        "relevant": row["relevant"],
+        "miss_rate": round(row["relevant"] / row["analyzed"], 3) if row["analyzed"] else None,
+    }
+    return report
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Trained gate: {train_gate()}")
+    print(f"Gate report: {gate_report()}")
@@ -0,0 +1,98 @@
+"""Load test for run_analysis against the simulator provider
+
+    python -m analysis.loadtest [posts] [--sequential|--batched|--threads] [--profile NAME]
+
+Seeds a scratch database with synthetic posts and, for each fault profile in
+``SIMULATOR_PROFILES`` (or just ``--profile``), times ``run_analysis`` over
+all of them with the simulator pinned as the only provider. Defaults to 10k
+posts through the concurrent engine. Reports end-to-end wall clock
+(prioritizing, calls, parsing and DB writes), analyzed posts/sec and the
+error/failure counts. The real database and APIs are never touched.
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import db
+from config.settings import SIMULATOR_PROFILES, PROBLEM_CATEGORIES, SIMULATOR_SEED
+from analysis import run_analysis
+from analysis.compact import SIGNAL_PHRASES
+from analysis.providers import SimulatedProvider, pin
+
+FILLER = ("we", "our", "team", "the", "cluster", "data", "jobs", "every", "night", "using",
+          "currently", "with", "about", "storage", "servers", "pipeline", "and", "it", "is")
+
+def synthetic_posts(count: int, seed: int = SIMULATOR_SEED) -> list:
+    """Rows for ``posts``: filler text salted with category and problem-signal words"""
+    rng = random.Random(seed)
+    topics = [description.lower().split() for description in PROBLEM_CATEGORIES.values()]
+    rows = []
+    for i in range(count):
+        words = rng.choice(topics) + list(rng.sample(SIGNAL_PHRASES, 3))
+        words += rng.choices(FILLER, k=rng.randint(20, 120))
+        rng.shuffle(words)
+        title = " ".join(rng.choice(topics)[:6]).capitalize()
+        rows.append((f"hn_load{i}", "hn", f"load{i}", title, " ".join(words) + ".",
+                     f"https://news.ycombinator.com/item?id={i}", "loadtest",
+                     f"2026-01-01 00:00:{i % 60:02d}", None))
+    return rows
+
+def seed_database(count: int):
+    db.init_db()
+    with db.get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO posts (id, source, source_id, title, body, url, author, created_at, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, synthetic_posts(count))
+
+def run_profile(profile: str, posts: int, mode: str) -> dict:
+    """Time one run over ``posts`` fresh posts in a scratch database"""
+    original = db.DB_PATH
+    with tempfile.TemporaryDirectory() as scratch:
+        db.DB_PATH = Path(scratch) / "loadtest.db"
+        try:
+            seed_database(posts)
+            pin(SimulatedProvider(profile=profile))
+            start = time.monotonic()
+            stats = run_analysis(batch_size=posts, delay=0, **({mode: True} if mode != "sequential" else {}))
+            elapsed = time.monotonic() - start
+        finally:
+            pin()
+            db.DB_PATH = original
+    return {
+        "profile": profile,
+        "seconds": round(elapsed, 2),
+        "posts_per_sec": round(stats["analyzed"] / elapsed, 1) if elapsed else None,
+        "analyzed": stats["analyzed"],
+        "errors": stats["errors"],
+        "failed": stats.get("failed", 0),
+        "rate_limited": stats.get("rate_limited", 0),
+        "requests": stats["tokens"]["requests"],
+        "tokens": stats["tokens"]["input_tokens"] + stats["tokens"]["output_tokens"],
+    }
+
+def benchmark(posts: int = 10_000, mode: str = "concurrent", profiles: list = None) -> list:
+    return [run_profile(profile, posts, mode) for profile in profiles or SIMULATOR_PROFILES]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m analysis.loadtest",
+                                     description="Benchmark run_analysis against the simulator",
+                                     allow_abbrev=False)
+    parser.add_argument("posts", nargs="?", type=int, default=10_000, help="posts per profile")
+    modes = parser.add_mutually_exclusive_group()
+    for mode in ("sequential", "batched", "threads"):
+        modes.add_argument(f"--{mode}", dest="mode", action="store_const", const=mode,
+                           help=f"{mode} run_analysis instead of the concurrent engine")
+    parser.add_argument("--profile", action="append", choices=list(SIMULATOR_PROFILES),
+                        help="fault profile to run (repeatable; default: all)")
+    args = parser.parse_args()
+    mode = args.mode or "concurrent"
+
+    print(f"{args.posts:,} posts, {mode} mode")
+    for result in benchmark(args.posts, mode, args.profile):
+        print(f"{result['profile']:<14} {result['seconds']:>8.2f}s  {result['posts_per_sec']:>8} posts/s  "
+              f"analyzed {result['analyzed']:,}  errors {result['errors']}  failed {result['failed']}  "
+              f"rate-limited {result['rate_limited']}  requests {result['requests']:,}  "
+              f"tokens {result['tokens']:,}")
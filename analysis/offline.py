@@ -0,0 +1,36 @@
+"""Deterministic keyword scorer standing in for the LLM offline
+
+Answers like a single-post analysis from category and urgency keyword hits
+in the prompt text. Used by the ``simulator`` provider (analysis.providers)
+and the ``local`` batch backend (analysis.batch_jobs).
+"""
+import hashlib
+import json
+import re
+
+from config.settings import PROBLEM_CATEGORIES
+
+URGENCY_WORDS = ("urgent", "asap", "production", "outage", "deadline", "help", "struggling", "stuck")
+
+def local_score(prompt: str) -> str:
+    """Deterministic JSON analysis from keyword hits in the post text"""
+    text = prompt.lower()
+    words = set(re.findall(r"[a-z]+", text))
+
+    best, best_hits = "other", 0
+    for category, description in PROBLEM_CATEGORIES.items():
+        terms = set(category.split("_")) | set(re.findall(r"[a-z]{4,}", description.lower()))
+        hits = len(terms & words)
+        if hits > best_hits:
+            best, best_hits = category, hits
+
+    urgency_hits = sum(1 for w in URGENCY_WORDS if w in words)
+    # Small stable jitter so identical keyword counts don't all tie
+    jitter = int(hashlib.sha256(text.encode()).hexdigest(), 16) % 2
+    return json.dumps({
+        "fit_score": min(10, best_hits * 2 + jitter),
+        "urgency_score": min(10, urgency_hits * 3),
+        "use_case": best,
+        "problem_summary": "Scored offline by keyword match",
+        "reasoning": f"{best_hits} category keyword hits, {urgency_hits} urgency words",
+    })
@@ -0,0 +1,251 @@
+"""Value-prioritized analysis queue and daily spend governor
+
+``get_unanalyzed_posts`` hands out pending posts by a cheap prior score
+(``post_priors``) instead of newest first, so when the backlog is bigger
+than the budget the likeliest leads are analyzed first. The prior (0-1)
+blends, with ``PRIOR_WEIGHTS``:
+- yield: smoothed high-fit rate of the post's channel (subreddit or HN
+  search term) among posts analyzed so far
+- engagement: votes and comments from metadata (as in lead ranking)
+- keywords: problem-signal phrases and category terms in the text
+- thread: best fit score already found in the post's thread
+
+Each run and ``gtm queue`` score only the posts without a prior. A prior
+is dropped, and so recomputed, once a post in the same thread has been
+analyzed since (its thread component is stale) and once it is older than
+``PRIOR_MAX_AGE_HOURS`` (channel yields drift).
+
+The governor plans a run against the daily budget
+(``ANALYSIS_DAILY_TOKEN_BUDGET`` / ``ANALYSIS_DAILY_COST_BUDGET``). Before
+a run it admits posts in priority order while their worst-case cost on
+any model analysis may use fits what's left of today's budget. Once less
+than ``ANALYSIS_BUDGET_RESERVE`` of the budget is left, only posts with a
+prior of at least ``ANALYSIS_BUDGET_RESERVE_MIN_PRIOR`` are admitted. The
+cap itself is enforced per request by ``analysis.budget``, which also
+covers retries, hedges and the other modes; admission just keeps a run
+from starting work it can't finish.
+"""
+import json
+import re
+
+from config.settings import (
+    PRIOR_WEIGHTS, PRIOR_YIELD_SMOOTHING, PRIOR_MAX_AGE_HOURS,
+    ANALYSIS_BUDGET_RESERVE, ANALYSIS_BUDGET_RESERVE_MIN_PRIOR,
+)
+from db import get_connection, get_unanalyzed_posts
+from db.ranking import engagement_score
+from analysis import (
+    ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA, format_prompt, has_enough_content, cache_models,
+    BudgetExhausted,
+)
+from analysis import budget
+from analysis.budget import spent_today
+from analysis.compact import SIGNAL_PHRASES, SIGNAL_TERMS
+from analysis.threads import thread_id
+
+# Pending posts scored per query/insert round trip
+SCORE_CHUNK = 5000
+
+# Output allowance per single-post request (see analysis.complete)
+MAX_OUTPUT_TOKENS = 500
+
+# Signal hits at which the keyword component maxes out
+KEYWORD_SATURATION = 6
+
+# SQL for the thread a ``posts`` row (alias p) belongs to, as analysis.threads.thread_id
+THREAD_SQL = """COALESCE({p}.source || '_' || COALESCE(json_extract({p}.metadata, '$.parent_id'),
+                                                     json_extract({p}.metadata, '$.story_id')),
+                         {p}.id)"""
+
+def channel(source: str, metadata: dict) -> str:
+    """Where a post came from: subreddit for Reddit, search term for HN"""
+    return f"{source}/{metadata.get('subreddit') or metadata.get('search_term') or ''}"
+
+def channel_yields() -> dict:
+    """Smoothed high-fit rate per channel, scaled so the best channel is 1"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT p.source || '/' || COALESCE(json_extract(p.metadata, '$.subreddit'),
+                                               json_extract(p.metadata, '$.search_term'), '') AS channel,
+                   COUNT(*) AS analyzed, SUM(a.fit_score >= 7) AS high_fit
+            FROM analysis a JOIN posts p ON p.id = a.post_id
+            GROUP BY channel
+        """).fetchall()
+    total = sum(r["analyzed"] for r in rows)
+    if not total:
+        return {}
+    base = sum(r["high_fit"] for r in rows) / total
+    yields = {
+        r["channel"]: (r["high_fit"] + PRIOR_YIELD_SMOOTHING * base) / (r["analyzed"] + PRIOR_YIELD_SMOOTHING)
+        for r in rows
+    }
+    best = max(yields.values())
+    return {key: value / best for key, value in yields.items()} if best else {}
+
+def thread_fits() -> dict:
+    """Best analyzed fit score (0-10) per thread"""
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {THREAD_SQL.format(p="p")} AS thread, MAX(a.fit_score) AS fit
+            FROM analysis a JOIN posts p ON p.id = a.post_id
+            GROUP BY thread
+        """).fetchall()
+    return {r["thread"]: r["fit"] or 0 for r in rows}
+
+def keyword_score(title: str, body: str) -> float:
+    """0-1 from distinct signal phrases and category/search terms"""
+    text = f"{title or ''} {body or ''}".lower()
+    hits = sum(1 for phrase in SIGNAL_PHRASES if phrase in text)
+    hits += len(SIGNAL_TERMS & set(re.findall(r"[a-z]+", text)))
+    return min(1.0, hits / KEYWORD_SATURATION)
+
+def prior_score(post, metadata: dict, yields: dict, fits: dict) -> float:
+    # Channels with no analyzed posts yet get the average
+    default_yield = sum(yields.values()) / len(yields) if yields else 0.5
+    components = {
+        "yield": yields.get(channel(post.source, metadata), default_yield),
+        "engagement": engagement_score(metadata) / 10,
+        "keywords": keyword_score(post.title, post.body),
+        "thread": fits.get(thread_id(post), 0) / 10,
+    }
+    return sum(PRIOR_WEIGHTS[key] * value for key, value in components.items())
+
+class _Pending:
+    """Post-like view of a posts row, for thread_id()"""
+    __slots__ = ("id", "source", "title", "body", "metadata")
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+
+def prioritize_pending() -> int:
+    """Score unanalyzed posts without a current prior, return how many were scored"""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM post_priors WHERE post_id IN (SELECT post_id FROM analysis)")
+        # Everything analyzed since the last pass; its threads' priors are stale
+        last_pass = conn.execute("SELECT MAX(computed_at) FROM post_priors").fetchone()[0]
+        if last_pass:
+            conn.execute(f"""
+                DELETE FROM post_priors WHERE post_id IN (
+                    SELECT p.id FROM post_priors pp JOIN posts p ON p.id = pp.post_id
+                    WHERE {THREAD_SQL.format(p="p")} IN (
+                        SELECT {THREAD_SQL.format(p="q")} FROM analysis a
+                        JOIN posts q ON q.id = a.post_id
+                        WHERE a.analyzed_at >= ?
+                    )
+                )
+            """, (last_pass,))
+        conn.execute("DELETE FROM post_priors WHERE computed_at < datetime('now', ?)",
+                     (f"-{PRIOR_MAX_AGE_HOURS} hours",))
+    yields, fits = channel_yields(), thread_fits()
+    scored = 0
+    last_id = ""
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT p.id, p.source, p.title, p.body, p.metadata FROM posts p
+                WHERE p.id > ?
+                AND NOT EXISTS (SELECT 1 FROM analysis a WHERE a.post_id = p.id)
+                AND NOT EXISTS (SELECT 1 FROM post_priors pp WHERE pp.post_id = p.id)
+                ORDER BY p.id LIMIT ?
+            """, (last_id, SCORE_CHUNK)).fetchall()
+            if not rows:
+                return scored
+            priors = []
+            for row in rows:
+                post = _Pending(row)
+                metadata = json.loads(post.metadata) if post.metadata else {}
+                priors.append((post.id, prior_score(post, metadata, yields, fits)))
+            conn.executemany("""
+                INSERT OR REPLACE INTO post_priors (post_id, score, computed_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, priors)
+        scored += len(rows)
+        last_id = rows[-1]["id"]
+
+def worst_case(post, models: list) -> dict:
+    """Most tokens and USD analyzing ``post`` can be billed on any of ``models``"""
+    prompt = format_prompt(post.title, post.body, post.source, post.url)
+    costs = [budget.worst_case(model, ANALYSIS_SYSTEM_PROMPT, prompt, ANALYSIS_SCHEMA, MAX_OUTPUT_TOKENS)
+             for model in models]
+    return {key: max(c[key] for c in costs) for key in ("tokens", "cost")}
+
+def post_priors(post_ids: list) -> dict:
+    if not post_ids:
+        return {}
+    placeholders = ",".join("?" * len(post_ids))
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT post_id, score FROM post_priors WHERE post_id IN ({placeholders})
+        """, post_ids).fetchall()
+    return {r["post_id"]: r["score"] for r in rows}
+
+def admit(batch_size: int) -> dict:
+    """How many of the next ``batch_size`` queued posts today's budget allows
+
+    Returns governor stats; ``admitted`` is the number of posts, taken in
+    queue order, whose worst-case cost fits in the remaining budget. None
+    are admitted (``reason`` says why) when a model analysis may use has
+    no price and a cost budget is set.
+    """
+    spent = spent_today()
+    stats = {"spent_tokens": spent["tokens"], "spent_cost": round(spent["cost"], 4),
+             "admitted": 0, "held_back": 0}
+    posts = get_unanalyzed_posts(limit=batch_size)
+    priors = post_priors([p.id for p in posts])
+    models = cache_models()
+    limits = budget.limits()
+    used = dict(spent)
+
+    for post in posts:
+        if not has_enough_content(post):
+            # Skipped without a call
+            stats["admitted"] += 1
+            continue
+        try:
+            cost = worst_case(post, models)
+        except BudgetExhausted as e:
+            stats["reason"] = str(e)
+            stats["admitted"] = 0
+            break
+        if any(used[key] + cost[key] > cap for key, cap in limits):
+            break
+        in_reserve = any(used[key] + cost[key] > cap * (1 - ANALYSIS_BUDGET_RESERVE)
+                         for key, cap in limits)
+        if in_reserve and priors.get(post.id, 0) < ANALYSIS_BUDGET_RESERVE_MIN_PRIOR:
+            # The queue is in priority order, so everything after is lower value too
+            break
+        for key in used:
+            used[key] += cost[key]
+        stats["admitted"] += 1
+
+    stats["held_back"] = len(posts) - stats["admitted"]
+    return stats
+
+def prepare_queue(batch_size: int) -> tuple:
+    """Refresh priors, then apply the budget; return ``(batch_size, governor stats)``"""
+    prioritize_pending()
+    if not budget.configured():
+        return batch_size, None
+    governor = admit(batch_size)
+    if "reason" in governor:
+        print(f"Daily analysis budget: {governor['reason']}")
+    elif governor["held_back"]:
+        print(f"Daily analysis budget: admitting {governor['admitted']} of "
+              f"{governor['admitted'] + governor['held_back']} queued posts")
+    return governor["admitted"], governor
+
+def queue_preview(limit: int = 20) -> list:
+    """Next posts in the analysis queue with their prior score"""
+    posts = get_unanalyzed_posts(limit=limit)
+    priors = post_priors([p.id for p in posts])
+    return [{"post_id": p.id, "source": p.source, "title": p.title,
+             "prior": priors.get(p.id), "created_at": p.created_at} for p in posts]
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Prioritized {prioritize_pending()} pending posts")
+    print(f"Spent today: {spent_today()}")
+    for item in queue_preview(10):
+        print(f"{item['prior']:.2f}  {item['post_id']}  {item['title']}")
@@ -0,0 +1,357 @@
+"""Analysis providers: one interface over the LLM backends
+
+Every analysis mode sends prompts through a ``Provider``: ``complete``
+(blocking) or ``acomplete`` (async) returns the schema-shaped JSON text,
+holds the request's worst case against the daily budget while it runs
+(``analysis.budget``) and records telemetry and token usage. Subclasses only
+implement ``request`` / ``arequest``, returning ``(text, usage)``.
+
+Besides the Anthropic and OpenAI providers there is an offline
+``simulator`` (``ANALYSIS_PROVIDER = "simulator"``) for load testing. It
+answers with deterministic JSON derived from the post text, shaped by the
+schema it is given (single post, batch or thread), and injects latency,
+429/500 errors and malformed output per a ``SIMULATOR_PROFILES`` entry.
+Latency and faults are drawn from a seed, the prompt and the attempt
+number, so a rerun over the same posts sees the same faults, and a retry
+of a failed prompt can succeed. ``python -m analysis.loadtest`` benchmarks
+``run_analysis`` against it.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from config.settings import (
+    ANTHROPIC_API_KEY, OPENAI_API_KEY, ANALYSIS_MODEL, OPENAI_MODEL, ANALYSIS_PROVIDER,
+    SIMULATOR_MODEL, SIMULATOR_PROFILES, SIMULATOR_PROFILE, SIMULATOR_SEED,
+)
+from analysis import (
+    anthropic_request, openai_request, anthropic_text, usage_anthropic, usage_openai,
+    record_usage, get_anthropic, get_openai, telemetry, cache_prefix_tokens, prompt_cacheable,
+    prompt_cache_min_tokens, format_prompt, ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA,
+)
+from analysis import budget
+from analysis.compact import estimate_tokens
+from analysis.offline import local_score
+
+class Provider:
+    """Answers analysis prompts with JSON text matching a schema"""
+    name = None
+    needs_key = True
+
+    def __init__(self, model: str, api_key: str = None):
+        self.model = model
+        self.api_key = api_key
+
+    def request(self, system: str, prompt: str, max_tokens: int, schema: dict) -> tuple:
+        """Return ``(response text, usage dict)``"""
+        raise NotImplementedError
+
+    async def arequest(self, system: str, prompt: str, max_tokens: int, schema: dict) -> tuple:
+        raise NotImplementedError
+
+    def complete(self, prompt: str, max_tokens: int = 500, system: str = ANALYSIS_SYSTEM_PROMPT,
+                 schema: dict = ANALYSIS_SCHEMA) -> str:
+        with budget.reserve("analysis", self.model, system, prompt, schema, max_tokens), \
+                telemetry.track(self.name, self.model) as call:
+            text, call.usage = self.request(system, prompt, max_tokens, schema)
+        record_usage(call.usage)
+        return text
+
+    async def acomplete(self, prompt: str, max_tokens: int = 500,
+                        system: str = ANALYSIS_SYSTEM_PROMPT, schema: dict = ANALYSIS_SCHEMA) -> str:
+        with budget.reserve("analysis", self.model, system, prompt, schema, max_tokens), \
+                telemetry.track(self.name, self.model) as call:
+            text, call.usage = await self.arequest(system, prompt, max_tokens, schema)
+        record_usage(call.usage)
+        return text
+
+class _SDKProvider(Provider):
+    """Shared client handling for the SDK-backed providers
+
+    The blocking client for the configured key is the module-wide one
+    (``get_anthropic``/``get_openai``). Async clients are bound to the
+    event loop they were first used on and have SDK retries disabled, so
+    rate limits reach the caller (AIMD limiter or router).
+    """
+
+    def __init__(self, model: str, api_key: str = None):
+        super().__init__(model, api_key or self.default_key())
+        self._client = None
+        self._async_clients = {}  # event loop -> async client
+
+    def default_key(self):
+        raise NotImplementedError
+
+    def client(self):
+        if self.api_key == self.default_key():
+            return self.shared_client()
+        if self._client is None:
+            self._client = self.make_client(async_client=False)
+        return self._client
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = self.make_client(async_client=True)
+        return self._async_clients[loop]
+
+class AnthropicProvider(_SDKProvider):
+    name = "anthropic"
+
+    def default_key(self):
+        return ANTHROPIC_API_KEY
+
+    def shared_client(self):
+        return get_anthropic()
+
+    def make_client(self, async_client: bool):
+        import anthropic
+        if async_client:
+            return anthropic.AsyncAnthropic(api_key=self.api_key, max_retries=0)
+        return anthropic.Anthropic(api_key=self.api_key)
+
+    def request(self, system, prompt, max_tokens, schema):
+        message = self.client().messages.create(
+            **anthropic_request(system, prompt, max_tokens, schema, model=self.model))
+        return anthropic_text(message), usage_anthropic(message.usage)
+
+    async def arequest(self, system, prompt, max_tokens, schema):
+        message = await self.async_client().messages.create(
+            **anthropic_request(system, prompt, max_tokens, schema, model=self.model))
+        return anthropic_text(message), usage_anthropic(message.usage)
+
+class OpenAIProvider(_SDKProvider):
+    name = "openai"
+
+    def default_key(self):
+        return OPENAI_API_KEY
+
+    def shared_client(self):
+        return get_openai()
+
+    def make_client(self, async_client: bool):
+        import openai
+        if async_client:
+            return openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return openai.OpenAI(api_key=self.api_key)
+
+    def request(self, system, prompt, max_tokens, schema):
+        response = self.client().chat.completions.create(
+            **openai_request(system, prompt, max_tokens, schema, model=self.model))
+        return response.choices[0].message.content, usage_openai(response.usage)
+
+    async def arequest(self, system, prompt, max_tokens, schema):
+        response = await self.async_client().chat.completions.create(
+            **openai_request(system, prompt, max_tokens, schema, model=self.model))
+        return response.choices[0].message.content, usage_openai(response.usage)
+
+class SimulatedAPIError(Exception):
+    """Injected provider error, shaped like the SDK errors ``overload_delay`` reads"""
+
+    def __init__(self, status_code: int, message: str, retry_after: float = None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+# "=== POST ID: x ===" (batched) and "=== ID: x (comment) ===" (threads)
+ITEM_RE = re.compile(r"^=== (?:POST )?ID: (\S+)(?: \([^)]*\))? ===$", re.MULTILINE)
+
+class SimulatedProvider(Provider):
+    """Offline provider with deterministic answers and injected faults
+
+    ``profile`` is a ``SIMULATOR_PROFILES`` entry (or name):
+    - latency_median / latency_sigma: lognormal response time in seconds
+    - rate_limit / server_error / malformed: share of requests answered
+      with a 429 (with ``retry_after``), a 500, or truncated JSON
+    - max_concurrency: requests in flight above this get a 429 (None: no limit)
+    """
+    name = "simulator"
+    needs_key = False
+
+    def __init__(self, model: str = SIMULATOR_MODEL, api_key: str = None,
+                 profile=SIMULATOR_PROFILE, seed: int = SIMULATOR_SEED):
+        super().__init__(model, api_key)
+        self.configure(profile, seed)
+
+    def configure(self, profile=SIMULATOR_PROFILE, seed: int = SIMULATOR_SEED):
+        """Switch fault profile and seed, forgetting attempt counts"""
+        self.profile_name = profile if isinstance(profile, str) else "custom"
+        self.profile = {**SIMULATOR_PROFILES["clean"],
+                        **(SIMULATOR_PROFILES[profile] if isinstance(profile, str) else profile)}
+        self.seed = seed
+        self.attempts = {}  # prompt hash -> requests so far
+        self.in_flight = 0
+        self.cached_systems = set()
+        self._lock = threading.Lock()
+
+    def _draw(self, system: str, prompt: str) -> tuple:
+        """(latency, fault or None) for this attempt at ``prompt``"""
+        key = hashlib.sha256(prompt.encode()).hexdigest()
+        with self._lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        p = self.profile
+        latency = p["latency_median"] * rng.lognormvariate(0, p["latency_sigma"])
+        roll = rng.random()
+        fault = None
+        for name in ("rate_limit", "server_error", "malformed"):
+            if roll < p[name]:
+                fault = name
+                break
+            roll -= p[name]
+        return latency, fault
+
+    def _answer(self, system: str, prompt: str, schema: dict, fault: str) -> tuple:
+        if fault == "rate_limit" or (self.profile["max_concurrency"] is not None
+                                     and self.in_flight > self.profile["max_concurrency"]):
+            raise SimulatedAPIError(429, "rate_limit_error", self.profile["retry_after"])
+        if fault == "server_error":
+            raise SimulatedAPIError(500, "internal server error")
+
+        text = json.dumps(simulated_answer(prompt, schema))
+        if fault == "malformed":
+            text = text[:len(text) // 2]
+
+        # Providers cache the static prefix after its first use, if it's long enough
+        prefix = cache_prefix_tokens(system, schema)
+        cacheable = prompt_cacheable(system, schema, self.model)
+        with self._lock:
+            cached = cacheable and system in self.cached_systems
+            if cacheable:
+                self.cached_systems.add(system)
+        usage = {
+            "input_tokens": estimate_tokens(prompt) + (0 if cacheable else prefix),
+            "output_tokens": estimate_tokens(text),
+            "cache_read_tokens": prefix if cached else 0,
+            "cache_write_tokens": prefix if cacheable and not cached else 0,
+        }
+        return text, usage
+
+    def request(self, system, prompt, max_tokens, schema):
+        latency, fault = self._draw(system, prompt)
+        self.in_flight += 1
+        try:
+            time.sleep(latency)
+            return self._answer(system, prompt, schema, fault)
+        finally:
+            self.in_flight -= 1
+
+    async def arequest(self, system, prompt, max_tokens, schema):
+        latency, fault = self._draw(system, prompt)
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(latency)
+            return self._answer(system, prompt, schema, fault)
+        finally:
+            self.in_flight -= 1
+
+def simulated_answer(prompt: str, schema: dict) -> dict:
+    """Schema-shaped result for ``prompt``, scored by keyword match
+
+    Arrays of objects get one entry per ``=== ID ===`` item in the prompt,
+    each scored from its own text.
+    """
+    items = ITEM_RE.split(prompt)
+    # split() gives [preamble, id1, text1, id2, text2, ...]
+    return _fill(schema, prompt, list(zip(items[1::2], items[2::2])))
+
+def _fill(schema: dict, text: str, items: list, scores: dict = None):
+    scores = scores or json.loads(local_score(text))
+    kind = schema.get("type")
+    if kind == "object":
+        result = {}
+        for offset, (name, spec) in enumerate(schema.get("properties", {}).items()):
+            if name in scores:
+                result[name] = scores[name]
+            elif spec.get("type") == "object":
+                # Nested scores (e.g. per profile) vary a little per entry
+                fit = max(0, min(10, scores["fit_score"] + offset % 3 - 1))
+                result[name] = _fill(spec, text, items, {**scores, "fit_score": fit})
+            else:
+                result[name] = _fill(spec, text, items, scores)
+        return result
+    if kind == "array":
+        return [{**_fill(schema["items"], block, []), "id": item_id} for item_id, block in items]
+    if kind == "integer":
+        return scores["fit_score"]
+    return scores["problem_summary"]
+
+PROVIDERS = {
+    "anthropic": AnthropicProvider,
+    "openai": OpenAIProvider,
+    "simulator": SimulatedProvider,
+}
+
+DEFAULT_MODELS = {
+    "anthropic": ANALYSIS_MODEL,
+    "openai": OPENAI_MODEL,
+    "simulator": SIMULATOR_MODEL,
+}
+
+def make_provider(name: str, model: str = None, api_key: str = None, **options) -> Provider:
+    return PROVIDERS[name](model or DEFAULT_MODELS[name], api_key, **options)
+
+_providers = {}
+_pinned = None
+
+def get_provider(name: str) -> Provider:
+    """Shared provider instance for ``name`` with its default model and key"""
+    if name not in _providers:
+        _providers[name] = make_provider(name)
+    return _providers[name]
+
+def default_provider():
+    """Provider for ``ANALYSIS_PROVIDER``, falling back to the other key; None without one"""
+    if _pinned is not None:
+        return _pinned
+    if ANALYSIS_PROVIDER == "simulator":
+        return get_provider("simulator")
+    if ANALYSIS_PROVIDER == "anthropic" and ANTHROPIC_API_KEY:
+        return get_provider("anthropic")
+    if OPENAI_API_KEY:
+        return get_provider("openai")
+    return None
+
+def pin(provider: Provider = None):
+    """Send all analysis to ``provider``, bypassing settings and the router (load tests)
+
+    ``pin()`` restores the configured provider(s).
+    """
+    global _pinned
+    _pinned = provider
+
+def pinned():
+    return _pinned
+
+def check_prompt_cache(provider: Provider, system: str = ANALYSIS_SYSTEM_PROMPT,
+                       schema: dict = ANALYSIS_SCHEMA) -> dict:
+    """Send two requests sharing ``system`` and check the second read it from the cache
+
+    ``ok`` is False when a prefix long enough to cache wasn't read back, or
+    when one deemed too short was cached anyway (the minimum is wrong).
+    """
+    usage = []
+    for i in range(2):
+        prompt = format_prompt("Prompt cache check", f"Request {i + 1} of 2, ignore.", "check", "")
+        with budget.reserve("check", provider.model, system, prompt, schema, 50), \
+                telemetry.track(provider.name, provider.model, purpose="check") as call:
+            _, call.usage = provider.request(system, prompt, 50, schema)
+        usage.append(call.usage)
+    cacheable = prompt_cacheable(system, schema, provider.model)
+    read = usage[1]["cache_read_tokens"]
+    return {
+        "model": provider.model,
+        "prefix_tokens": cache_prefix_tokens(system, schema),
+        "min_tokens": prompt_cache_min_tokens(provider.model),
+        "cacheable": cacheable,
+        "cache_write_tokens": usage[0]["cache_write_tokens"],
+        "cache_read_tokens": read,
+        "ok": (read > 0) == cacheable,
+    }
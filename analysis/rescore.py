@@ -0,0 +1,152 @@
+"""Incremental re-scoring after a prompt or model change
+
+Every ``analysis`` row records the model and prompt version (hash of the
+prompt templates) that produced it. Changing ``ANALYSIS_PROMPT`` or
+``ANALYSIS_MODEL`` leaves existing rows alone; ``rescore`` re-analyzes only
+a chosen subset with the current prompt and model and moves the scores it
+replaces to ``analysis_history``:
+- ``high-fit``: fit_score >= ``min_fit``, best first
+- ``recent``: posts created in the last ``days``, newest first
+- ``sample``: a stratified sample with equal counts per fit band, to see
+  how the change moves scores across the whole range
+
+Only stale rows (another model or prompt version) are picked unless
+``include_current`` is set.
+"""
+import random
+import time
+
+from db import get_connection, replace_analyses
+from analysis import (
+    PROMPT_VERSION, request_analysis, analysis_row, has_enough_content, cache_models,
+    overload_delay, StopAnalysis, BudgetExhausted,
+)
+from analysis.batched import BATCH_PROMPT_VERSION
+from analysis.threads import THREAD_PROMPT_VERSION, get_posts
+
+SUBSETS = ("high-fit", "recent", "sample")
+
+# Fit score bands for the stratified sample
+FIT_BANDS = ((0, 3), (4, 6), (7, 10))
+
+# Re-scored rows written per transaction
+WRITE_BATCH = 25
+
+def current_versions() -> list:
+    """Prompt versions of the current single-post, batched and thread prompts"""
+    return [PROMPT_VERSION, BATCH_PROMPT_VERSION, THREAD_PROMPT_VERSION]
+
+def _stale_filter(include_current: bool) -> tuple:
+    """SQL condition (on alias ``a``) and params selecting outdated analyses"""
+    if include_current:
+        return "1 = 1", []
+    versions, models = current_versions(), cache_models()
+    return (f"""(a.prompt_version IS NULL
+                 OR a.prompt_version NOT IN ({",".join("?" * len(versions))})
+                 OR a.model_used NOT IN ({",".join("?" * len(models))}))""",
+            versions + models)
+
+def select_for_rescore(subset: str, limit: int = 100, min_fit: int = 7, days: int = 7,
+                       include_current: bool = False, seed: int = 0) -> list:
+    """Post IDs to re-analyze for ``subset``"""
+    stale, params = _stale_filter(include_current)
+    with get_connection() as conn:
+        if subset == "high-fit":
+            rows = conn.execute(f"""
+                SELECT a.post_id FROM analysis a
+                WHERE a.fit_score >= ? AND {stale}
+                ORDER BY a.fit_score DESC, a.rank_score DESC LIMIT ?
+            """, [min_fit, *params, limit]).fetchall()
+            return [r["post_id"] for r in rows]
+
+        if subset == "recent":
+            rows = conn.execute(f"""
+                SELECT a.post_id FROM analysis a JOIN posts p ON p.id = a.post_id
+                WHERE p.created_at >= datetime('now', ?) AND {stale}
+                ORDER BY p.created_at DESC LIMIT ?
+            """, [f'-{days} days', *params, limit]).fetchall()
+            return [r["post_id"] for r in rows]
+
+        if subset == "sample":
+            rng = random.Random(seed)
+            per_band, extra = divmod(limit, len(FIT_BANDS))
+            chosen = []
+            for i, (low, high) in enumerate(FIT_BANDS):
+                band = [r["post_id"] for r in conn.execute(f"""
+                    SELECT a.post_id FROM analysis a
+                    WHERE a.fit_score BETWEEN ? AND ? AND {stale}
+                    ORDER BY a.post_id
+                """, [low, high, *params]).fetchall()]
+                take = per_band + (1 if i < extra else 0)
+                chosen += rng.sample(band, min(take, len(band)))
+            return chosen
+
+    raise ValueError(f"Unknown subset {subset!r}, expected one of {', '.join(SUBSETS)}")
+
+def previous_scores(post_ids: list) -> dict:
+    if not post_ids:
+        return {}
+    placeholders = ",".join("?" * len(post_ids))
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT post_id, fit_score FROM analysis WHERE post_id IN ({placeholders})
+        """, post_ids).fetchall()
+    return {r["post_id"]: r["fit_score"] for r in rows}
+
+def rescore(post_ids: list, delay: float = 0.5) -> dict:
+    """Re-analyze posts with the current prompt and model, return run stats
+
+    ``changed`` counts posts whose fit moved by 2 or more; ``promoted`` and
+    ``demoted`` count posts crossing the high-fit line (7).
+    """
+    stats = {"selected": len(post_ids), "rescored": 0, "errors": 0, "skipped": 0,
+             "changed": 0, "promoted": 0, "demoted": 0, "fit_delta": 0.0}
+    before = previous_scores(post_ids)
+    posts = get_posts(post_ids)
+    rows = []
+
+    def flush():
+        replace_analyses(rows)
+        stats["rescored"] += len(rows)
+        rows.clear()
+
+    for post_id in post_ids:
+        post = posts.get(post_id)
+        if post is None or not has_enough_content(post):
+            stats["skipped"] += 1
+            continue
+        try:
+            result = request_analysis(post.title, post.body, post.source, post.url)
+        except BudgetExhausted as e:
+            print(f"Stopping: {e}")
+            stats["budget_exhausted"] = True
+            break
+        except StopAnalysis:
+            raise
+        except Exception as e:
+            print(f"Re-score error for {post_id}: {e}")
+            stats["errors"] += 1
+            time.sleep(overload_delay(e) or delay)
+            continue
+
+        old, new = before.get(post_id) or 0, result["fit_score"]
+        stats["fit_delta"] += new - old
+        stats["changed"] += abs(new - old) >= 2
+        stats["promoted"] += old < 7 <= new
+        stats["demoted"] += new < 7 <= old
+        rows.append(analysis_row(post_id, result))
+        if len(rows) >= WRITE_BATCH:
+            flush()
+        time.sleep(delay)
+
+    flush()
+    if stats["rescored"]:
+        stats["fit_delta"] = round(stats["fit_delta"] / stats["rescored"], 2)
+    return stats
+
+if __name__ == "__main__":
+    from db import init_db, get_analysis_versions
+    init_db()
+    for version in get_analysis_versions():
+        print(version)
+    print(f"Stale high-fit posts: {len(select_for_rescore('high-fit', limit=10_000))}")
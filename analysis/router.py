@@ -0,0 +1,273 @@
+"""Provider router: load balancing, failover and hedged requests
+
+Analysis calls normally go to the single provider in ``ANALYSIS_PROVIDER``,
+so when it is slow or rate-limited the whole run stalls. The router knows
+every configured endpoint (provider + model + API key) and, per request:
+- picks an endpoint at random in proportion to its weight and health
+  (recent error rate and latency); endpoints cooling down after an
+  overload or server error are skipped
+- if no answer arrives within ``ANALYSIS_HEDGE_AFTER`` seconds, sends the
+  same request to a second endpoint and takes whichever answers first,
+  cancelling the other
+- on an overload or server error, fails over to the next endpoint
+
+Requests use the async provider calls (analysis.providers) so losers can
+be cancelled; synchronous callers go through a background event loop
+(``run_sync``). Every answer comes back with the model that produced it,
+for ``analysis.model_used``. Each attempt, hedges and failovers included,
+is held against the daily budget by the provider call (analysis.budget);
+a hedge the budget can't cover is dropped, the request it backs carries on.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+from config.settings import (
+    ANTHROPIC_API_KEY, OPENAI_API_KEY, ANALYSIS_MODEL, OPENAI_MODEL, ANALYSIS_PROVIDER,
+    SIMULATOR_MODEL, ANALYSIS_ENDPOINTS, ANALYSIS_HEDGE_AFTER, ANALYSIS_ENDPOINT_COOLDOWN,
+)
+from analysis import overload_delay, NotConfiguredError, StopAnalysis
+from analysis.providers import PROVIDERS, DEFAULT_MODELS, make_provider
+
+# Weight of the newest sample in the latency/error moving averages
+HEALTH_ALPHA = 0.2
+
+class Endpoint:
+    """One provider/model/key combination and its recent health"""
+
+    def __init__(self, name: str, provider: str, model: str, api_key: str, weight: float = 1.0,
+                 options: dict = None):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.weight = weight
+        self.backend = make_provider(provider, model, api_key, **(options or {}))
+        self.latency = None  # moving average of successful call time (s)
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.wins = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def health(self) -> float:
+        """Multiplier on ``weight``: lower for error-prone, slow or busy endpoints"""
+        latency = self.latency if self.latency is not None else 1.0
+        return (1.0 - 0.9 * self.error_rate) / (1.0 + latency) / (1 + self.in_flight)
+
+    def record_success(self, seconds: float):
+        self.latency = seconds if self.latency is None else (
+            HEALTH_ALPHA * seconds + (1 - HEALTH_ALPHA) * self.latency)
+        self.error_rate *= 1 - HEALTH_ALPHA
+
+    def record_failure(self, cooldown: float):
+        self.error_rate = HEALTH_ALPHA + (1 - HEALTH_ALPHA) * self.error_rate
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    async def call(self, system: str, prompt: str, max_tokens: int, schema: dict) -> str:
+        return await self.backend.acomplete(prompt, max_tokens, system, schema)
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "wins": self.wins,
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 2),
+        }
+
+def default_endpoints() -> list:
+    """One endpoint per configured key; ``ANALYSIS_PROVIDER`` takes all traffic
+
+    The other provider gets weight 0, so it is only used for hedging and
+    failover. Set ``ANALYSIS_ENDPOINTS`` to spread load across several.
+    The simulator never shares traffic with real providers.
+    """
+    if ANALYSIS_PROVIDER == "simulator":
+        return [{"provider": "simulator", "model": SIMULATOR_MODEL, "weight": 1.0}]
+    configs = []
+    if ANTHROPIC_API_KEY:
+        configs.append({"provider": "anthropic", "model": ANALYSIS_MODEL,
+                        "api_key_env": "ANTHROPIC_API_KEY"})
+    if OPENAI_API_KEY:
+        configs.append({"provider": "openai", "model": OPENAI_MODEL,
+                        "api_key_env": "OPENAI_API_KEY"})
+    configs.sort(key=lambda c: c["provider"] != ANALYSIS_PROVIDER)
+    for i, config in enumerate(configs):
+        config["weight"] = 1.0 if i == 0 else 0.0
+    return configs
+
+def load_endpoints(configs: list = None) -> list:
+    """Endpoints from ``ANALYSIS_ENDPOINTS`` (or the defaults), skipping missing keys"""
+    endpoints = []
+    for config in configs or ANALYSIS_ENDPOINTS or default_endpoints():
+        key_env = config.get("api_key_env")
+        api_key = os.environ.get(key_env) if key_env else None
+        if PROVIDERS[config["provider"]].needs_key and not api_key:
+            continue
+        model = config.get("model") or DEFAULT_MODELS[config["provider"]]
+        name = config.get("name") or ":".join(filter(None, (config["provider"], model, key_env)))
+        endpoints.append(Endpoint(name, config["provider"], model, api_key,
+                                  config.get("weight", 1.0), config.get("options")))
+    return endpoints
+
+def should_fail_over(error: Exception) -> bool:
+    """Overloads, server errors and connection failures are the endpoint's fault"""
+    if isinstance(error, StopAnalysis):
+        return False
+    status = getattr(error, "status_code", None)
+    return overload_delay(error) is not None or status is None or status >= 500
+
+class Router:
+    """Spreads requests across endpoints with failover and hedging"""
+
+    def __init__(self, endpoints: list, hedge_after: float = ANALYSIS_HEDGE_AFTER,
+                 cooldown: float = ANALYSIS_ENDPOINT_COOLDOWN):
+        self.endpoints = endpoints
+        self.hedge_after = hedge_after
+        self.cooldown = cooldown
+        self.stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def models(self) -> list:
+        """Distinct models, highest weight first"""
+        ordered = sorted(self.endpoints, key=lambda e: -e.weight)
+        return list(dict.fromkeys(e.model for e in ordered))
+
+    def pick(self, exclude=()):
+        """Endpoint for the next attempt, None if every endpoint is excluded"""
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        ready = [e for e in candidates if e.available()] or [
+            min(candidates, key=lambda e: e.cooldown_until)]
+        weighted = [e for e in ready if e.weight > 0]
+        if not weighted:
+            # Only fallback endpoints left: take the healthiest
+            return max(ready, key=lambda e: e.health())
+        return random.choices(weighted, [e.weight * e.health() for e in weighted])[0]
+
+    async def _attempt(self, endpoint: Endpoint, system: str, prompt: str,
+                       max_tokens: int, schema: dict) -> tuple:
+        delay = endpoint.cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        start = time.monotonic()
+        try:
+            text = await endpoint.call(system, prompt, max_tokens, schema)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if should_fail_over(e):
+                delay = overload_delay(e)
+                endpoint.record_failure(self.cooldown if delay is None else delay)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        endpoint.record_success(time.monotonic() - start)
+        return text, endpoint
+
+    async def complete(self, prompt: str, max_tokens: int, system: str, schema: dict) -> tuple:
+        """Return ``(response text, model)`` from the first endpoint to answer
+
+        Raises the last error once every endpoint has failed, or straight
+        away for errors that aren't the endpoint's fault (e.g. a bad request).
+        """
+        if not self.endpoints:
+            raise NotConfiguredError("No API key configured for analysis")
+
+        tried = []
+        hedges = set()
+        error = None
+
+        def start(endpoint):
+            tried.append(endpoint)
+            return asyncio.ensure_future(self._attempt(endpoint, system, prompt, max_tokens, schema))
+
+        tasks = {start(self.pick())}
+        hedged = self.hedge_after is None
+        try:
+            while tasks:
+                timeout = None if hedged else self.hedge_after
+                done, tasks = await asyncio.wait(tasks, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = self.pick(exclude=tried)
+                    if backup is not None:
+                        self.stats["hedged"] += 1
+                        hedges.add(backup)
+                        tasks.add(start(backup))
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        text, endpoint = task.result()
+                        endpoint.wins += 1
+                        if endpoint in hedges:
+                            self.stats["hedge_wins"] += 1
+                        return text, endpoint.model
+                    error = task.exception()
+                    if isinstance(error, StopAnalysis) and tasks:
+                        # The budget can't cover a hedge, but the first request may still answer
+                        continue
+                    if not should_fail_over(error):
+                        raise error
+
+                if not tasks:
+                    following = self.pick(exclude=tried)
+                    if following is not None:
+                        self.stats["failovers"] += 1
+                        tasks.add(start(following))
+        finally:
+            # Losing or abandoned requests
+            for task in tasks:
+                task.cancel()
+        raise error
+
+    def reset_stats(self):
+        """Zero the run counters; endpoint health is kept"""
+        for key in self.stats:
+            self.stats[key] = 0
+        for endpoint in self.endpoints:
+            endpoint.requests = endpoint.wins = 0
+
+    def summary(self) -> dict:
+        return {**self.stats, "endpoints": {e.name: e.summary() for e in self.endpoints}}
+
+_router = None
+_lock = threading.Lock()
+_loop = None
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        _router = Router(load_endpoints())
+    return _router
+
+def run_sync(coro):
+    """Run a coroutine on the router's background event loop and wait for it"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-router", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+if __name__ == "__main__":
+    # Show configured endpoints and time one short request through the router
+    from analysis import format_prompt, ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA
+
+    router = get_router()
+    for endpoint in router.endpoints:
+        print(f"{endpoint.name}: weight {endpoint.weight}")
+    prompt = format_prompt("Spark jobs too slow", "Our nightly Spark batch takes 6 hours, "
+                           "mostly moving data out of on-prem storage.", "hn", None)
+    start = time.monotonic()
+    text, model = run_sync(router.complete(prompt, 500, ANALYSIS_SYSTEM_PROMPT, ANALYSIS_SCHEMA))
+    print(f"{model} answered in {time.monotonic() - start:.2f}s: {text}")
+    print(router.summary())
@@ -0,0 +1,179 @@
+"""Per-call LLM telemetry: latency, tokens, outcome and cost
+
+Every LLM API call (analysis in all modes, batch API results and the daily
+briefing) is recorded in ``llm_calls``. Call sites wrap the request in
+``track()`` and set ``call.usage`` from the response; the outcome and
+latency are filled in when the block exits. Rows are buffered and written
+in batches (and at exit), so recording adds no DB round trip per call.
+
+``llm_report()`` backs ``gtm llm-report``: latency percentiles, tokens per
+analyzed post, cost per high-fit lead and a daily trend.
+"""
+import atexit
+import asyncio
+import threading
+import time
+from collections import defaultdict
+
+from config.settings import MODEL_PRICING, BATCH_API_DISCOUNT
+from db import get_connection
+
+# Buffered rows are written once this many are pending
+FLUSH_EVERY = 50
+
+USAGE_KEYS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+_pending = []
+_lock = threading.Lock()
+
+def call_cost(model: str, usage: dict, batch: bool = False):
+    """USD cost of one call from MODEL_PRICING, None for unknown models"""
+    prices = MODEL_PRICING.get(model)
+    if prices is None:
+        return None
+    cost = sum(usage.get(key, 0) * prices.get(key.replace("_tokens", ""), 0)
+               for key in USAGE_KEYS) / 1_000_000
+    return cost * BATCH_API_DISCOUNT if batch else cost
+
+def error_outcome(error: BaseException) -> str:
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    from analysis import OVERLOAD_STATUSES
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status in OVERLOAD_STATUSES or "overloaded" in str(error).lower():
+        return "overloaded"
+    return "error"
+
+def record_call(purpose: str, provider: str, model: str, outcome: str,
+                latency_ms: int = None, usage: dict = None, error: str = None):
+    """Queue one ``llm_calls`` row"""
+    usage = usage or {}
+    row = (
+        purpose, provider, model, outcome, latency_ms,
+        *(usage.get(key, 0) for key in USAGE_KEYS),
+        call_cost(model, usage, batch=purpose == "batch") if outcome == "ok" else None,
+        error[:500] if error else None,
+    )
+    with _lock:
+        _pending.append(row)
+        full = len(_pending) >= FLUSH_EVERY
+    if full:
+        flush()
+
+def flush():
+    """Write queued rows; telemetry problems never fail the caller"""
+    global _pending
+    with _lock:
+        rows, _pending = _pending, []
+    if not rows:
+        return
+    try:
+        with get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO llm_calls (purpose, provider, model, outcome, latency_ms,
+                                       input_tokens, output_tokens, cache_read_tokens,
+                                       cache_write_tokens, cost_usd, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+    except Exception as e:
+        print(f"Error recording LLM telemetry: {e}")
+
+atexit.register(flush)
+
+class track:
+    """Context manager timing one call; set ``.usage`` from the response
+
+    Exceptions (including cancellation of a losing hedged request) are
+    recorded with their outcome and re-raised.
+    """
+
+    def __init__(self, provider: str, model: str, purpose: str = "analysis"):
+        self.provider = provider
+        self.model = model
+        self.purpose = purpose
+        self.usage = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency_ms = int((time.monotonic() - self.start) * 1000)
+        if exc is None:
+            record_call(self.purpose, self.provider, self.model, "ok", latency_ms, self.usage)
+        else:
+            record_call(self.purpose, self.provider, self.model, error_outcome(exc),
+                        latency_ms, self.usage, str(exc) or exc_type.__name__)
+        return False
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def llm_report(days: int = 7) -> dict:
+    """Latency, token and cost summary of LLM calls over the last ``days``"""
+    flush()
+    cutoff = f'-{days} days'
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT date(called_at) AS day, purpose, model, outcome, latency_ms,
+                   input_tokens + cache_read_tokens + cache_write_tokens AS input_tokens,
+                   output_tokens, cache_read_tokens, cost_usd
+            FROM llm_calls
+            WHERE called_at >= datetime('now', ?)
+            ORDER BY latency_ms
+        """, (cutoff,)).fetchall()
+        outcomes = conn.execute("""
+            SELECT COUNT(*) AS analyzed,
+                   COALESCE(SUM(fit_score >= 7), 0) AS high_fit
+            FROM analysis
+            WHERE analyzed_at >= datetime('now', ?)
+        """, (cutoff,)).fetchone()
+
+    def summarize(group: list) -> dict:
+        latencies = [r["latency_ms"] for r in group if r["outcome"] == "ok" and r["latency_ms"] is not None]
+        return {
+            "calls": len(group),
+            "errors": sum(1 for r in group if r["outcome"] in ("error", "overloaded")),
+            "overloaded": sum(1 for r in group if r["outcome"] == "overloaded"),
+            "cancelled": sum(1 for r in group if r["outcome"] == "cancelled"),
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "input_tokens": sum(r["input_tokens"] for r in group),
+            "output_tokens": sum(r["output_tokens"] for r in group),
+            "cache_read_tokens": sum(r["cache_read_tokens"] for r in group),
+            "cost_usd": sum(r["cost_usd"] or 0 for r in group),
+        }
+
+    by_model, by_day = defaultdict(list), defaultdict(list)
+    for row in rows:
+        by_model[(row["purpose"], row["model"])].append(row)
+        by_day[row["day"]].append(row)
+
+    analysis_rows = [r for r in rows if r["purpose"] in ("analysis", "batch")]
+    totals = summarize(rows)
+    analysis_totals = summarize(analysis_rows)
+    analyzed, high_fit = outcomes["analyzed"], outcomes["high_fit"]
+    tokens = analysis_totals["input_tokens"] + analysis_totals["output_tokens"]
+    totals.update({
+        "analyzed": analyzed,
+        "high_fit": high_fit,
+        "tokens_per_post": round(tokens / analyzed) if analyzed else None,
+        "cost_per_post": analysis_totals["cost_usd"] / analyzed if analyzed else None,
+        "cost_per_high_fit": analysis_totals["cost_usd"] / high_fit if high_fit else None,
+    })
+    return {
+        "days": days,
+        "totals": totals,
+        "models": [{"purpose": purpose, "model": model, **summarize(group)}
+                   for (purpose, model), group in sorted(by_model.items())],
+        "daily": [{"day": day, **summarize(group)} for day, group in sorted(by_day.items())],
+    }
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    report = llm_report()
+    print(f"LLM calls, last {report['days']} days: {report['totals']}")
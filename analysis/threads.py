@@ -0,0 +1,259 @@
+"""Thread-level analysis: score a whole discussion in one call
+
+Reddit comments and HN comments are stored as separate posts, so a busy
+thread costs one call per comment and each call sees a fragment. Here
+pending posts are grouped by thread (``metadata.parent_id`` for Reddit,
+``metadata.story_id`` for HN) and each thread is analyzed in one request,
+with the original post as context. The response has per-item scores, which
+become ordinary ``analysis`` rows, and a thread summary stored in
+``thread_summaries``.
+
+Threads longer than the token budget are split into several requests that
+each repeat the original post. Single posts with nothing else pending in
+their thread go through the normal single-post path. Thread results depend
+on the surrounding comments, so they aren't put in the response cache.
+"""
+import json
+import time
+from collections import OrderedDict
+
+from config.settings import (
+    ANALYSIS_BATCH_TOKEN_BUDGET, ANALYSIS_BATCH_MAX_POSTS,
+    ANALYSIS_BATCH_OUTPUT_TOKENS_PER_POST, ANALYSIS_BODY_TOKEN_BUDGET,
+)
+from db import (
+    get_connection, get_unanalyzed_posts, fetch_records, insert_analyses,
+    record_analysis_failures, Post,
+)
+from analysis import (
+    PROMPT_HEADER, RESULT_FIELDS, SCORING_GUIDANCE, RESULT_PROPERTIES,
+    parse_analysis_json, has_enough_content, analysis_row, complete_routed, object_schema,
+    request_analysis, overload_delay, response_cache, StopAnalysis, BudgetExhausted,
+)
+from analysis.batched import parse_batch_results
+from analysis.compact import compact_body, estimate_tokens, COMPACT_VERSION
+
+_INDENTED_FIELDS = "\n".join("      " + line for line in RESULT_FIELDS.splitlines())
+
+THREAD_SYSTEM_PROMPT = f"""{PROMPT_HEADER}
+
+You will be given a discussion thread: the original post for context, then the posts/comments to score, each introduced by its ID. For each one, determine if its author is experiencing a problem that Expanso/Bacalhau could solve. Use the rest of the thread to understand what each comment is replying to, but score each author's own problem.
+
+Also summarize the thread as a whole.
+
+Respond in JSON format with exactly one result per ID, copying each ID exactly:
+{{
+  "thread_summary": "<2-3 sentences: what the discussion is about and any pain points raised>",
+  "thread_fit_score": <0-10, how relevant the discussion as a whole is>,
+  "results": [
+    {{
+      "id": "<ID>",
+{_INDENTED_FIELDS}
+    }}
+  ]
+}}
+
+{SCORING_GUIDANCE}
+
+Respond ONLY with the JSON object, no other text."""
+
+THREAD_SCHEMA = object_schema({
+    "thread_summary": {"type": "string"},
+    "thread_fit_score": {"type": "integer"},
+    "results": {
+        "type": "array",
+        "items": object_schema({"id": {"type": "string"}, **RESULT_PROPERTIES}),
+    },
+})
+
+# Recorded on the analysis rows (thread results aren't cached)
+THREAD_PROMPT_VERSION = response_cache.prompt_version(
+    THREAD_SYSTEM_PROMPT, json.dumps(THREAD_SCHEMA),
+    f"{COMPACT_VERSION}:{ANALYSIS_BODY_TOKEN_BUDGET}",
+)
+
+def thread_id(post) -> str:
+    """ID of the post that started ``post``'s thread (the post itself for roots)"""
+    metadata = json.loads(post.metadata) if post.metadata else {}
+    parent = metadata.get("parent_id") or metadata.get("story_id")
+    return f"{post.source}_{parent}" if parent else post.id
+
+def group_threads(posts: list) -> "OrderedDict[str, list]":
+    threads = OrderedDict()
+    for post in posts:
+        threads.setdefault(thread_id(post), []).append(post)
+    return threads
+
+def get_posts(post_ids: list) -> dict:
+    if not post_ids:
+        return {}
+    placeholders = ",".join("?" * len(post_ids))
+    with get_connection() as conn:
+        rows = fetch_records(conn, Post, f"""
+            SELECT {Post.columns()} FROM posts WHERE id IN ({placeholders})
+        """, post_ids)
+    return {post.id: post for post in rows}
+
+def format_item(post, label: str) -> str:
+    body = compact_body(post.body, ANALYSIS_BODY_TOKEN_BUDGET) if post.body else "(no body)"
+    return f"=== ID: {post.id} ({label}) ===\n{body}"
+
+def format_thread_prompt(root, items: list) -> str:
+    """User message for one thread request"""
+    first = root or items[0]
+    lines = [
+        f"THREAD: {first.title or '(no title)'}",
+        f"SOURCE: {first.source}",
+        f"URL: {first.url}",
+        "",
+    ]
+    if root is not None and all(p.id != root.id for p in items):
+        body = compact_body(root.body, ANALYSIS_BODY_TOKEN_BUDGET) if root.body else "(no body)"
+        lines += ["=== ORIGINAL POST (context only, do not score) ===", body, ""]
+    for post in items:
+        label = "original post" if root is not None and post.id == root.id else "comment"
+        lines += [format_item(post, label), ""]
+    return "Analyze the following thread:\n\n" + "\n".join(lines).strip()
+
+def split_thread(root, items: list, token_budget: int = ANALYSIS_BATCH_TOKEN_BUDGET,
+                 max_posts: int = ANALYSIS_BATCH_MAX_POSTS) -> list:
+    """Chunks of ``items`` whose prompts fit the budget, each at least one item"""
+    base = estimate_tokens(THREAD_SYSTEM_PROMPT) + estimate_tokens(format_thread_prompt(root, items[:1]))
+    chunks, chunk, used = [], [], base
+    for post in items:
+        cost = estimate_tokens(format_item(post, "comment"))
+        if chunk and (used + cost > token_budget or len(chunk) >= max_posts):
+            chunks.append(chunk)
+            chunk, used = [], base
+        chunk.append(post)
+        used += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def save_thread_summary(thread: str, root_id: str, post_count: int,
+                        summary: str, fit_score, model_used: str):
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO thread_summaries (thread_id, root_post_id, post_count, summary,
+                                          fit_score, model_used, analyzed_at)
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(thread_id) DO UPDATE SET
+                post_count = thread_summaries.post_count + excluded.post_count,
+                summary = excluded.summary,
+                fit_score = excluded.fit_score,
+                model_used = excluded.model_used,
+                analyzed_at = excluded.analyzed_at
+        """, (thread, root_id, post_count, summary, fit_score, model_used))
+
+def get_thread_summaries(limit: int = 20, min_fit: int = 0) -> list:
+    """Most recently analyzed thread summaries"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT t.thread_id, t.post_count, t.summary, t.fit_score, t.analyzed_at,
+                   p.title, p.url, p.source
+            FROM thread_summaries t
+            LEFT JOIN posts p ON p.id = t.root_post_id
+            WHERE COALESCE(t.fit_score, 0) >= ?
+            ORDER BY t.analyzed_at DESC
+            LIMIT ?
+        """, (min_fit, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+def analyze_thread_chunk(thread: str, root, items: list, stats: dict):
+    prompt = format_thread_prompt(root, items)
+    max_tokens = ANALYSIS_BATCH_OUTPUT_TOKENS_PER_POST * (len(items) + 1)
+    error, model = None, None
+    try:
+        response, model = complete_routed(prompt, max_tokens=max_tokens, system=THREAD_SYSTEM_PROMPT,
+                            schema=THREAD_SCHEMA)
+        data = parse_analysis_json(response)
+        results = parse_batch_results(response)
+    except StopAnalysis:
+        raise
+    except Exception as e:
+        print(f"Thread analysis error for {thread} ({len(items)} posts): {e}")
+        data, results = {}, {}
+        error = e
+    stats["thread_requests"] += 1
+
+    rows, failures = [], []
+    for post in items:
+        result = results.get(post.id)
+        if result:
+            rows.append(analysis_row(post.id, result, model_used=model,
+                                     prompt_version=THREAD_PROMPT_VERSION))
+        elif error is None or overload_delay(error) is None:
+            failures.append((post.id, str(error) if error else "Missing or invalid in thread response"))
+    stats["errors"] += len(items) - len(rows)
+
+    if rows:
+        stats["analyzed"] += insert_analyses(rows)
+        stats["high_fit"] += sum(1 for r in rows if (r["fit_score"] or 0) >= 7)
+    if failures:
+        record_analysis_failures(failures)
+        stats["failed"] += len(failures)
+
+    if isinstance(data, dict) and data.get("thread_summary"):
+        fit = data.get("thread_fit_score")
+        save_thread_summary(thread, root.id if root else None, len(rows),
+                            str(data["thread_summary"]), fit if isinstance(fit, int) else None, model)
+        stats["threads"] += 1
+
+def run_thread_analysis(batch_size: int = 100, delay: float = 0.5) -> dict:
+    """Analyze pending posts thread by thread, return run stats
+
+    Use a large ``batch_size`` so whole threads are picked up together.
+    """
+    stats = {"analyzed": 0, "skipped": 0, "errors": 0, "high_fit": 0, "failed": 0,
+             "thread_requests": 0, "threads": 0}
+
+    posts = []
+    for post in get_unanalyzed_posts(limit=batch_size):
+        if has_enough_content(post):
+            posts.append(post)
+        else:
+            stats["skipped"] += 1
+
+    threads = group_threads(posts)
+    roots = get_posts([t for t in threads if t not in {p.id for p in posts}])
+    try:
+        for thread, items in threads.items():
+            root = roots.get(thread) or next((p for p in items if p.id == thread), None)
+
+            if len(items) == 1 and (root is None or root.id == items[0].id):
+                # Nothing else pending in this thread
+                post = items[0]
+                try:
+                    result = request_analysis(post.title, post.body, post.source, post.url)
+                except StopAnalysis:
+                    raise
+                except Exception as e:
+                    print(f"Analysis error for {post.id}: {e}")
+                    stats["errors"] += 1
+                    if overload_delay(e) is None:
+                        record_analysis_failures([(post.id, str(e))])
+                        stats["failed"] += 1
+                else:
+                    stats["analyzed"] += insert_analyses([analysis_row(post.id, result)])
+                    stats["high_fit"] += result["fit_score"] >= 7
+                time.sleep(delay)
+                continue
+
+            # Original post first, then comments oldest first
+            items.sort(key=lambda p: (p.id != thread, p.created_at or ""))
+            for chunk in split_thread(root, items):
+                analyze_thread_chunk(thread, root, chunk, stats)
+                time.sleep(delay)  # Rate limiting
+    except BudgetExhausted as e:
+        # Keep what was analyzed; the rest waits for tomorrow's budget
+        print(f"Stopping: {e}")
+        stats["budget_exhausted"] = True
+
+    return stats
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    stats = run_thread_analysis(batch_size=200)
+    print(f"Thread analysis complete: {stats}")
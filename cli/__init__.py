@@ -1,23 +1,45 @@
 """CLI for GTM Semantic Crawler"""
 import click
 import json
+import time
 from datetime import datetime
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
 
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from db import init_db, get_opportunities, get_stats, get_category_trends
+from db import init_db
+from config.settings import PRODUCT_PROFILES
+from cli import daemon
 
-console = Console()
+# rich is imported on first use, so commands that answer with JSON don't pay for it
+
+class _LazyConsole:
+    """Creates the rich Console when something is first printed"""
+    _console = None
+
+    def __getattr__(self, name):
+        if _LazyConsole._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console()
+        return getattr(_LazyConsole._console, name)
+
+console = _LazyConsole()
+
+def Table(*args, **kwargs):
+    from rich.table import Table as RichTable
+    return RichTable(*args, **kwargs)
+
+def Panel(*args, **kwargs):
+    from rich.panel import Panel as RichPanel
+    return RichPanel(*args, **kwargs)
 
 @click.group()
-def cli():
+@click.option('--local', is_flag=True, help="Query in this process even if `gtm serve` is running")
+def cli(local):
     """GTM Semantic Crawler - Find PMF opportunities"""
     init_db()
+    daemon.use_daemon = not local
 
 @cli.command()
 @click.option('--min-fit', default=5, help='Minimum fit score (0-10)')
@@ -25,31 +47,64 @@ def cli():
 @click.option('--use-case', '-u', help='Filter by use case category')
 @click.option('--days', '-d', default=7, help='Number of days to look back')
 @click.option('--limit', '-n', default=20, help='Maximum results')
+@click.option('--sort', type=click.Choice(['fit', 'rank']), default='fit',
+              help='Order by fit/urgency or by the blended lead rank')
+@click.option('--profile', '-p', type=click.Choice(list(PRODUCT_PROFILES)),
+              help="Use a positioning profile's scores instead of the main analysis")
+@click.option('--like', 'like', metavar='POST_ID',
+              help='Only posts similar to this one, most similar first')
+@click.option('--competitor', help='Only posts mentioning this competitor or group (e.g. Splunk, observability)')
+@click.option('--signal', help='Only posts with this buying signal or group (e.g. migration)')
 @click.option('--json-output', is_flag=True, help='Output as JSON')
-def query(min_fit, min_urgency, use_case, days, limit, json_output):
+def query(min_fit, min_urgency, use_case, days, limit, sort, profile, like, competitor, signal,
+          json_output):
     """Query opportunities with filters"""
-    results = get_opportunities(
+    similarity = None
+    if like:
+        from analysis.embeddings import similar_posts
+        try:
+            # Over-fetch neighbours so enough survive the other filters
+            similarity = dict(similar_posts(like, k=max(limit * 10, 200)))
+        except KeyError as e:
+            console.print(f"[red]{e.args[0]}[/red]")
+            return
+
+    results = daemon.call(
+        "opportunities",
         min_fit=min_fit,
         min_urgency=min_urgency,
         use_case=use_case,
         days=days,
-        limit=limit,
+        limit=limit if similarity is None else len(similarity),
+        sort=sort,
+        profile=profile,
+        post_ids=None if similarity is None else list(similarity),
+        competitor=competitor,
+        signal=signal,
     )
+    if similarity is not None:
+        results = sorted(results, key=lambda r: -similarity[r.id])[:limit]
     
     if json_output:
         # Convert datetime objects to strings
+        rows = []
         for r in results:
-            for k, v in r.items():
+            row = r.to_dict()
+            for k, v in row.items():
                 if isinstance(v, datetime):
-                    r[k] = v.isoformat()
-        click.echo(json.dumps(results, indent=2))
+                    row[k] = v.isoformat()
+            rows.append(row)
+        click.echo(json.dumps(rows, indent=2))
         return
     
     if not results:
         console.print("[yellow]No opportunities found matching criteria[/yellow]")
         return
     
-    table = Table(title=f"Top Opportunities (fit>={min_fit}, last {days} days)")
+    scope = f"{profile}, " if profile else ""
+    scope += f"like {like}, " if like else ""
+    scope += "".join(f"{value}, " for value in (competitor, signal) if value)
+    table = Table(title=f"Top Opportunities ({scope}fit>={min_fit}, last {days} days)")
     table.add_column("Fit", justify="center", style="green")
     table.add_column("Urg", justify="center", style="yellow")
     table.add_column("Use Case", style="cyan")
@@ -59,20 +114,50 @@ def query(min_fit, min_urgency, use_case, days, limit, json_output):
     
     for r in results:
         table.add_row(
-            str(r.get('fit_score', 0)),
-            str(r.get('urgency_score', 0)),
-            r.get('use_case', 'other')[:15],
-            r.get('source', 'unknown'),
-            (r.get('problem_summary') or '')[:50],
-            (r.get('url') or '')[:40],
+            str(r.fit_score or 0),
+            str(r.urgency_score or 0),
+            (r.use_case or 'other')[:15],
+            r.source or 'unknown',
+            (r.problem_summary or '')[:50],
+            (r.url or '')[:40],
         )
     
     console.print(table)
 
+@cli.command()
+@click.option('--min-fit', default=7, help='Minimum fit score (0-10)')
+@click.option('--min-urgency', default=0, help='Minimum urgency score (0-10)')
+@click.option('--use-case', '-u', help='Filter by use case category')
+@click.option('--competitor', help='Only posts mentioning this competitor or group')
+@click.option('--signal', help='Only posts with this buying signal or group')
+@click.option('--json-output', is_flag=True, help='One JSON object per line')
+def follow(min_fit, min_urgency, use_case, competitor, signal, json_output):
+    """Print new opportunities as they're analyzed (Ctrl-C to stop)"""
+    from cli.follow import follow as follow_opportunities
+
+    if not json_output:
+        console.print(f"[dim]Following new analyses with fit>={min_fit}...[/dim]")
+    try:
+        for r in follow_opportunities(min_fit=min_fit, min_urgency=min_urgency, use_case=use_case,
+                                      competitor=competitor, signal=signal):
+            if json_output:
+                row = r.to_dict()
+                for k, v in row.items():
+                    if isinstance(v, datetime):
+                        row[k] = v.isoformat()
+                click.echo(json.dumps(row))
+                sys.stdout.flush()
+            else:
+                console.print(f"[green]{r.fit_score}[/green]/[yellow]{r.urgency_score}[/yellow] "
+                              f"[cyan]{r.use_case or 'other'}[/cyan] [blue]{r.source}[/blue] "
+                              f"{r.problem_summary or r.title or ''}  {r.url or ''}")
+    except KeyboardInterrupt:
+        pass
+
 @cli.command()
 def stats():
     """Show crawler statistics"""
-    s = get_stats()
+    s = daemon.call("stats")
     
     panel_content = f"""
 [bold]Total Posts:[/bold] {s.get('total_posts', 0)}
@@ -94,7 +179,7 @@ def stats():
 @click.option('--days', '-d', default=30, help='Days to analyze')
 def trends(days):
     """Show category trends over time"""
-    data = get_category_trends(days=days)
+    data = daemon.call("trends", days=days)
     
     if not data:
         console.print("[yellow]No trend data available[/yellow]")
@@ -129,7 +214,8 @@ def trends(days):
 @click.option('--limit', '-n', default=10, help='Maximum results')
 def export(use_case, days, limit):
     """Export opportunities for outreach"""
-    results = get_opportunities(
+    results = daemon.call(
+        "opportunities",
         min_fit=6,
         use_case=use_case,
         days=days,
@@ -138,16 +224,38 @@ def export(use_case, days, limit):
     
     for r in results:
         console.print(f"\n[bold cyan]═══ Opportunity ═══[/bold cyan]")
-        console.print(f"[bold]Fit:[/bold] {r.get('fit_score')}/10 | [bold]Urgency:[/bold] {r.get('urgency_score')}/10")
-        console.print(f"[bold]Problem:[/bold] {r.get('problem_summary')}")
-        console.print(f"[bold]URL:[/bold] {r.get('url')}")
-        console.print(f"[dim]Reasoning: {r.get('reasoning')}[/dim]")
+        console.print(f"[bold]Fit:[/bold] {r.fit_score}/10 | [bold]Urgency:[/bold] {r.urgency_score}/10")
+        console.print(f"[bold]Problem:[/bold] {r.problem_summary}")
+        console.print(f"[bold]URL:[/bold] {r.url}")
+        console.print(f"[dim]Reasoning: {r.reasoning}[/dim]")
+
+@cli.command()
+@click.option('--days', '-d', default=30, help='Days to look back')
+def profiles(days):
+    """Compare positioning profiles scored alongside the main analysis"""
+    from db import get_profile_summary
+    
+    rows = get_profile_summary(days=days)
+    table = Table(title=f"Positioning Profiles (last {days} days)")
+    table.add_column("Profile", style="cyan")
+    table.add_column("Analyzed", justify="right")
+    table.add_column("High Fit (7+)", justify="right", style="green")
+    table.add_column("Avg Fit", justify="right")
+    
+    for r in rows:
+        avg = f"{r['avg_fit']:.1f}" if r['avg_fit'] is not None else "-"
+        table.add_row(r['profile'], f"{r['analyzed']:,}", f"{r['high_fit']:,}", avg)
+    
+    console.print(table)
 
 @cli.command()
 @click.option('--days', '-d', default=1, help='Days to crawl back')
 @click.option('--analyze/--no-analyze', default=True, help='Run analysis after crawl')
 @click.option('--batch-size', '-b', default=50, help='Analysis batch size')
-def crawl(days, analyze, batch_size):
+@click.option('--async', 'concurrent', is_flag=True, help='Analyze with concurrent requests')
+@click.option('--batched', is_flag=True, help='Score several posts per request')
+@click.option('--threads', is_flag=True, help='Score each discussion thread in one request')
+def crawl(days, analyze, batch_size, concurrent, batched, threads):
     """Run crawlers and optionally analyze"""
     from crawlers import crawl_hn, crawl_reddit
     from analysis import run_analysis
@@ -162,8 +270,618 @@ def crawl(days, analyze, batch_size):
     
     if analyze:
         console.print("[bold]Running AI analysis...[/bold]")
-        analysis_stats = run_analysis(batch_size=batch_size)
+        analysis_stats = run_analysis(batch_size=batch_size, concurrent=concurrent,
+                                      batched=batched, threads=threads)
         console.print(f"Analysis: {analysis_stats}")
 
+@cli.command()
+@click.option('--min-fit', default=0, help='Minimum thread fit score (0-10)')
+@click.option('--limit', '-n', default=20, help='Maximum results')
+def threads(min_fit, limit):
+    """Show thread summaries from thread-level analysis"""
+    from analysis.threads import get_thread_summaries
+    
+    rows = get_thread_summaries(limit=limit, min_fit=min_fit)
+    if not rows:
+        console.print("[yellow]No thread summaries yet - analyze with --threads[/yellow]")
+        return
+    
+    table = Table(title="Discussion Threads")
+    table.add_column("Fit", justify="center", style="green")
+    table.add_column("Posts", justify="right")
+    table.add_column("Thread", max_width=40)
+    table.add_column("Summary", max_width=60)
+    table.add_column("URL", style="blue", max_width=40)
+    
+    for r in rows:
+        table.add_row(
+            str(r['fit_score'] if r['fit_score'] is not None else '-'), str(r['post_count']),
+            (r['title'] or r['thread_id'])[:40], r['summary'] or '', r['url'] or '',
+        )
+    
+    console.print(table)
+
+@cli.command()
+@click.option('--full', is_flag=True, help='Recompute every row, not just the decay window')
+def rerank(full):
+    """Recompute time-decayed lead rank scores"""
+    from db import refresh_rankings
+    
+    updated = refresh_rankings(full=full)
+    console.print(f"Updated rank score for {updated} leads")
+
+@cli.command()
+@click.option('--limit', '-n', default=20, help='Maximum jobs to show')
+def batches(limit):
+    """Show offline analysis batch jobs"""
+    from analysis.batch_jobs import list_batches
+    
+    jobs = list_batches(limit=limit)
+    if not jobs:
+        console.print("[yellow]No batch jobs yet[/yellow]")
+        return
+    
+    table = Table(title="Analysis Batch Jobs")
+    table.add_column("ID", justify="right")
+    table.add_column("Backend", style="blue")
+    table.add_column("Status", style="cyan")
+    table.add_column("Posts", justify="right")
+    table.add_column("Submitted")
+    table.add_column("Completed")
+    table.add_column("Remote ID", max_width=30)
+    
+    for job in jobs:
+        table.add_row(
+            str(job['id']), job['backend'], job['status'], str(job['request_count']),
+            str(job['submitted_at'] or ''), str(job['completed_at'] or ''),
+            job['remote_id'] or (job['error'] or '')[:30],
+        )
+    
+    console.print(table)
+
+@cli.command()
+@click.argument('post_ids', nargs=-1)
+@click.option('--status', type=click.Choice(['retrying', 'dead']), help='Only show this state')
+@click.option('--limit', '-n', default=20, help='Maximum results')
+@click.option('--retry', is_flag=True, help='Queue POST_IDS (default: all dead-lettered posts) for analysis again')
+def failures(post_ids, status, limit, retry):
+    """Show posts whose analysis failed"""
+    from db import get_analysis_failures, retry_analysis_failures
+
+    if retry:
+        count = retry_analysis_failures(list(post_ids) or None)
+        console.print(f"[green]Queued {count} posts for analysis again[/green]")
+        return
+
+    rows = get_analysis_failures(status=status, limit=limit)
+    if post_ids:
+        rows = [r for r in rows if r['post_id'] in post_ids]
+    if not rows:
+        console.print("[green]No failed analyses[/green]")
+        return
+
+    table = Table(title="Failed Analyses")
+    table.add_column("Post", style="cyan")
+    table.add_column("Title", max_width=40)
+    table.add_column("Tries", justify="right")
+    table.add_column("Status")
+    table.add_column("Next Retry")
+    table.add_column("Last Error", max_width=50, style="red")
+
+    for r in rows:
+        state = "[red]dead[/red]" if r['status'] == 'dead' else r['status']
+        table.add_row(
+            r['post_id'], (r['title'] or '')[:40], str(r['attempts']), state,
+            '' if r['status'] == 'dead' else str(r['next_retry_at']),
+            (r['last_error'] or '')[:50],
+        )
+
+    console.print(table)
+
+@cli.command()
+@click.option('--clear', is_flag=True, help='Delete all cached responses')
+@click.option('--evict', is_flag=True, help='Apply the size limits now')
+def cache(clear, evict):
+    """Show the LLM response cache"""
+    from analysis import cache as response_cache
+    from analysis import PROMPT_VERSION
+
+    if clear:
+        console.print(f"[green]Deleted {response_cache.clear()} cached responses[/green]")
+        return
+    if evict:
+        console.print(f"[green]Evicted {response_cache.evict()} cached responses[/green]")
+
+    info = response_cache.cache_info()
+    console.print(f"[bold]{info['entries']:,}[/bold] responses, "
+                  f"{info['bytes'] / 1024:,.0f} KB, {info['hits']:,} hits")
+
+    table = Table(title="Response Cache")
+    table.add_column("Prompt Version", style="cyan")
+    table.add_column("Model", style="blue")
+    table.add_column("Entries", justify="right")
+    table.add_column("Hits", justify="right")
+
+    for row in info['versions']:
+        version = row['prompt_version']
+        if version == PROMPT_VERSION:
+            version += " (current)"
+        table.add_row(version, row['model'], str(row['entries']), str(row['hits']))
+
+    console.print(table)
+
+@cli.command('prompt-cache')
+@click.option('--provider', type=click.Choice(['anthropic', 'openai', 'simulator']), default=None,
+              help='Provider to check (default: the configured one)')
+@click.option('--model', default=None, help='Model to check (default: the provider\'s)')
+@click.option('--offline', is_flag=True, help='Only say whether caching applies to the model, no calls')
+def prompt_cache(provider, model, offline):
+    """Check that the provider caches the analysis system prompt (two small calls)"""
+    from analysis import NotConfiguredError, StopAnalysis, prompt_cache_status
+    from analysis.providers import make_provider, default_provider, check_prompt_cache
+
+    target = make_provider(provider, model) if provider else default_provider()
+    if offline or target is None:
+        status = prompt_cache_status(model or (target.model if target else None))
+        state = "[green]active[/green]" if status['active'] else "[yellow]inactive[/yellow]"
+        console.print(f"Prompt caching {state} for {status['model']}: prefix ~{status['prefix_tokens']:,} "
+                      f"tokens, minimum {status['min_tokens']:,}")
+    if target is None:
+        console.print(f"[red]{NotConfiguredError('No API key configured for analysis')}[/red]")
+        return
+    if offline:
+        return
+    try:
+        result = check_prompt_cache(target)
+    except StopAnalysis as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    console.print(f"{result['model']}: prefix ~{result['prefix_tokens']:,} tokens, "
+                  f"minimum {result['min_tokens']:,} to cache")
+    console.print(f"First call wrote {result['cache_write_tokens']:,}, "
+                  f"second read {result['cache_read_tokens']:,} cached tokens")
+    if not result['ok']:
+        console.print("[red]Cache reads don't match the expected minimum; check "
+                      "PROMPT_CACHE_MIN_TOKENS[/red]")
+    elif result['cacheable']:
+        console.print("[green]The second call read the prefix from the cache[/green]")
+    else:
+        console.print("[yellow]The prefix is below the model's minimum, so it isn't cached[/yellow]")
+
+@cli.command('query-cache')
+@click.option('--clear', is_flag=True, help='Drop all cached query results')
+def query_cache(clear):
+    """Show query result cache hit rates (of `gtm serve` while it runs)"""
+    info = daemon.call("query_cache", clear=clear)
+    if clear:
+        console.print(f"[green]Dropped {info['cleared']:,} cached results[/green]")
+        return
+
+    console.print(f"[bold]{info['entries']:,}[/bold] results in memory"
+                  + (", shared on disk" if info['disk'] else ""))
+    table = Table(title="Query Cache")
+    table.add_column("Function", style="cyan")
+    table.add_column("Hits", justify="right")
+    table.add_column("Disk Hits", justify="right")
+    table.add_column("Misses", justify="right")
+    table.add_column("Hit Rate", justify="right")
+
+    for name, counts in sorted(info['functions'].items()):
+        rate = f"{counts['hit_rate']:.0%}" if counts['hit_rate'] is not None else "-"
+        table.add_row(name, f"{counts['hits']:,}", f"{counts['disk_hits']:,}",
+                      f"{counts['misses']:,}", rate)
+
+    console.print(table)
+
+@cli.command('llm-report')
+@click.option('--days', '-d', default=7, help='Days to look back')
+def llm_report(days):
+    """Show LLM call latency, tokens and cost"""
+    from analysis.telemetry import llm_report as do_report
+
+    def ms(value):
+        return f"{value:,}" if value is not None else "-"
+
+    def usd(value):
+        return f"${value:.4f}" if value is not None else "-"
+
+    report = do_report(days=days)
+    totals = report['totals']
+    if not totals['calls']:
+        console.print(f"[yellow]No LLM calls recorded in the last {days} days[/yellow]")
+        return
+
+    console.print(f"[bold]{totals['calls']:,}[/bold] calls, {usd(totals['cost_usd'])} total, "
+                  f"{totals['analyzed']:,} posts analyzed ({totals['high_fit']:,} high-fit)")
+    console.print(f"Tokens per post: {totals['tokens_per_post'] or '-'}  "
+                  f"Cost per post: {usd(totals['cost_per_post'])}  "
+                  f"Cost per high-fit lead: {usd(totals['cost_per_high_fit'])}")
+
+    table = Table(title=f"LLM Calls by Model ({days} days)")
+    table.add_column("Purpose", style="cyan")
+    table.add_column("Model", style="blue")
+    table.add_column("Calls", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("p50 ms", justify="right")
+    table.add_column("p95 ms", justify="right")
+    table.add_column("In", justify="right")
+    table.add_column("Cached", justify="right")
+    table.add_column("Out", justify="right")
+    table.add_column("Cost", justify="right", style="green")
+
+    for row in report['models']:
+        table.add_row(
+            row['purpose'], row['model'], f"{row['calls']:,}", f"{row['errors']:,}",
+            ms(row['p50_ms']), ms(row['p95_ms']), f"{row['input_tokens']:,}",
+            f"{row['cache_read_tokens']:,}", f"{row['output_tokens']:,}", usd(row['cost_usd']),
+        )
+    console.print(table)
+
+    daily = Table(title="Daily Trend")
+    daily.add_column("Day", style="cyan")
+    daily.add_column("Calls", justify="right")
+    daily.add_column("Errors", justify="right")
+    daily.add_column("p50 ms", justify="right")
+    daily.add_column("p95 ms", justify="right")
+    daily.add_column("Tokens", justify="right")
+    daily.add_column("Cost", justify="right", style="green")
+
+    for row in report['daily']:
+        daily.add_row(
+            row['day'], f"{row['calls']:,}", f"{row['errors']:,}", ms(row['p50_ms']),
+            ms(row['p95_ms']), f"{row['input_tokens'] + row['output_tokens']:,}",
+            usd(row['cost_usd']),
+        )
+    console.print(daily)
+
+@cli.command()
+@click.option('--limit', '-n', default=20, help='Maximum posts to show')
+def queue(limit):
+    """Show the analysis queue by prior score and today's budget"""
+    from analysis.priority import prioritize_pending, queue_preview, spent_today
+    from config.settings import ANALYSIS_DAILY_TOKEN_BUDGET, ANALYSIS_DAILY_COST_BUDGET
+
+    prioritize_pending()
+    spent = spent_today()
+    token_cap = f" / {ANALYSIS_DAILY_TOKEN_BUDGET:,}" if ANALYSIS_DAILY_TOKEN_BUDGET is not None else ""
+    cost_cap = f" / ${ANALYSIS_DAILY_COST_BUDGET:.2f}" if ANALYSIS_DAILY_COST_BUDGET is not None else ""
+    console.print(f"Spent today: {spent['tokens']:,}{token_cap} tokens, ${spent['cost']:.4f}{cost_cap}")
+
+    table = Table(title="Analysis Queue")
+    table.add_column("Prior", justify="right", style="green")
+    table.add_column("Source", style="blue")
+    table.add_column("Post ID", style="dim")
+    table.add_column("Title", max_width=60)
+
+    for item in queue_preview(limit):
+        prior = f"{item['prior']:.2f}" if item['prior'] is not None else "-"
+        table.add_row(prior, item['source'], item['post_id'], (item['title'] or "")[:60])
+
+    console.print(table)
+
+@cli.command()
+def versions():
+    """Show current analyses by model and prompt version"""
+    from db import get_analysis_versions
+    from analysis import cache_models
+    from analysis.rescore import current_versions
+
+    current, models = current_versions(), cache_models()
+    table = Table(title="Analysis Versions")
+    table.add_column("Model", style="blue")
+    table.add_column("Prompt", style="dim")
+    table.add_column("Posts", justify="right")
+    table.add_column("High Fit", justify="right", style="green")
+    table.add_column("Avg Fit", justify="right")
+    table.add_column("Last Analyzed")
+    table.add_column("Status")
+
+    for row in get_analysis_versions():
+        is_current = row['prompt_version'] in current and row['model_used'] in models
+        table.add_row(
+            row['model_used'] or "-", row['prompt_version'] or "(unversioned)",
+            f"{row['analyzed']:,}", f"{row['high_fit']:,}", f"{row['avg_fit']:.1f}",
+            row['last_analyzed'], "[green]current[/green]" if is_current else "[yellow]stale[/yellow]",
+        )
+    console.print(table)
+
+@cli.command()
+@click.argument('subset', type=click.Choice(['high-fit', 'recent', 'sample']))
+@click.option('--limit', '-n', default=100, help='Maximum posts to re-score')
+@click.option('--min-fit', default=7, help='Minimum fit score for high-fit')
+@click.option('--days', '-d', default=7, help='Days back for recent')
+@click.option('--all', 'include_current', is_flag=True,
+              help='Also re-score posts already on the current prompt and model')
+@click.option('--delay', default=0.5, help='Seconds between API calls')
+@click.option('--dry-run', is_flag=True, help='Only show how many posts would be re-scored')
+def rescore(subset, limit, min_fit, days, include_current, delay, dry_run):
+    """Re-analyze a subset of posts with the current prompt and model"""
+    from analysis.rescore import select_for_rescore, rescore as do_rescore
+
+    post_ids = select_for_rescore(subset, limit=limit, min_fit=min_fit, days=days,
+                                  include_current=include_current)
+    if dry_run or not post_ids:
+        console.print(f"{len(post_ids):,} posts selected for re-scoring")
+        return
+    console.print(f"Re-score: {do_rescore(post_ids, delay=delay)}")
+
+@cli.command('eval')
+@click.option('--build', type=int, default=None, help='Rebuild the labeled set with this many posts first')
+@click.option('--provider', '-p', default=None, help='Candidate provider (default: ANALYSIS_PROVIDER)')
+@click.option('--model', '-m', default=None, help="Candidate model (default: the provider's)")
+@click.option('--system-prompt', type=click.File('r'), default=None,
+              help='Candidate system prompt file (default: the current prompt)')
+@click.option('--limit', '-n', default=None, type=int, help='Only replay this many labeled posts')
+@click.option('--history', is_flag=True, help='Show earlier evaluation runs instead')
+def eval_command(build, provider, model, system_prompt, limit, history):
+    """Replay the labeled set through a candidate model or prompt"""
+    from analysis.evaluate import build_eval_set, evaluate, get_eval_runs
+    from config.settings import ANALYSIS_PROVIDER
+
+    def show(value, fmt="{}"):
+        return fmt.format(value) if value is not None else "-"
+
+    if history:
+        table = Table(title="Evaluation Runs")
+        table.add_column("Run", justify="right")
+        table.add_column("Model", style="blue")
+        table.add_column("Prompt", style="dim")
+        table.add_column("Fit MAE", justify="right")
+        table.add_column("±1", justify="right")
+        table.add_column("High-Fit P/R", justify="right")
+        table.add_column("p50 ms", justify="right")
+        table.add_column("Cost/Post", justify="right", style="green")
+        for run in get_eval_runs():
+            table.add_row(
+                str(run['id']), run['model'], run['prompt_version'], show(run['fit_mae']),
+                show(run['fit_within_1']),
+                f"{show(run['high_fit_precision'])}/{show(run['high_fit_recall'])}",
+                show(run['p50_ms']), show(run['cost_per_post'], "${:.5f}"),
+            )
+        console.print(table)
+        return
+
+    if build:
+        console.print(f"Labeled set: {build_eval_set(build)} posts")
+    try:
+        result = evaluate(provider or ANALYSIS_PROVIDER, model,
+                          system_prompt.read() if system_prompt else None, limit)
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+
+    console.print(f"[bold]{result['provider']}:{result['model']}[/bold] prompt {result['prompt_version']}: "
+                  f"{result['answered']}/{result['posts']} answered in {result['wall_seconds']}s")
+    console.print(f"Fit MAE {show(result['fit_mae'])}, within ±1 {show(result['fit_within_1'])}, "
+                  f"urgency MAE {show(result['urgency_mae'])}, use case match {show(result['use_case_match'])}")
+    console.print(f"High-fit precision {show(result['high_fit_precision'])}, "
+                  f"recall {show(result['high_fit_recall'])}")
+    console.print(f"Latency p50 {show(result['p50_ms'])} ms, p95 {show(result['p95_ms'])} ms; "
+                  f"{result['tokens_per_post']:,} tokens/post, "
+                  f"cost {show(result['cost_usd'], '${:.4f}')} ({show(result['cost_per_post'], '${:.5f}')}/post)")
+
+@cli.command()
+@click.argument('post_id')
+@click.option('--limit', '-n', default=10, help='Maximum results')
+@click.option('--exact', is_flag=True, help='Scan every vector even if an IVF index exists')
+def similar(post_id, limit, exact):
+    """Find the posts most similar to POST_ID"""
+    from analysis.embeddings import similar_posts, describe
+
+    start = time.monotonic()
+    try:
+        neighbours = similar_posts(post_id, k=limit, exact=exact)
+    except KeyError as e:
+        console.print(f"[red]{e.args[0]}[/red]")
+        return
+    elapsed = (time.monotonic() - start) * 1000
+
+    table = Table(title=f"Posts like {post_id} ({elapsed:.0f} ms)")
+    table.add_column("Sim", justify="right", style="magenta")
+    table.add_column("Fit", justify="center", style="green")
+    table.add_column("Use Case", style="cyan")
+    table.add_column("Post", style="dim")
+    table.add_column("Title", max_width=50)
+    table.add_column("URL", max_width=40)
+    for row in describe(neighbours):
+        table.add_row(
+            f"{row['similarity']:.3f}",
+            str(row['fit_score']) if row['fit_score'] is not None else "-",
+            (row['use_case'] or '-')[:15],
+            row['id'],
+            (row['title'] or row['problem_summary'] or '')[:50],
+            (row['url'] or '')[:40],
+        )
+    console.print(table)
+
+@cli.command()
+@click.option('--ivf', is_flag=True, help='Also (re)build the IVF index for large collections')
+@click.option('--clusters', default=None, type=int, help='IVF clusters (default: sqrt of the rows)')
+@click.option('--rebuild', is_flag=True, help='Drop every vector and embed all posts again')
+def embed(ivf, clusters, rebuild):
+    """Embed new posts into the local vector index"""
+    from analysis.embeddings import embed_pending, build_ivf, reset_embeddings, row_count
+    from analysis.clusters import reset_clusters
+
+    if rebuild:
+        # Rows are renumbered, so clustering starts over too
+        reset_embeddings()
+        reset_clusters()
+    console.print(f"Embedded {embed_pending():,} posts ({row_count():,} in the index)")
+    if ivf:
+        try:
+            result = build_ivf(clusters)
+        except RuntimeError as e:
+            console.print(f"[red]{e}[/red]")
+            return
+        console.print(f"IVF index: {result['rows']:,} rows in {result['clusters']:,} clusters")
+
+@cli.command()
+@click.option('--reset', is_flag=True, help='Drop discovered clusters and assign every post again')
+def cluster(reset):
+    """Assign new posts to problem categories, discovering new ones"""
+    from analysis.clusters import cluster_pending, reset_clusters
+
+    if reset:
+        reset_clusters()
+    try:
+        stats = cluster_pending()
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    console.print(f"Embedded {stats['embedded']:,}, assigned {stats['assigned']:,} posts, "
+                  f"{stats['spawned']:,} new clusters")
+    if 'novelty' in stats:
+        console.print(f"Novelty threshold {stats['novelty']:.3f}, agreement {stats['agreement']:.3f}")
+
+@cli.command()
+@click.option('--days', '-d', default=30, help='Days counted as recent')
+@click.option('--emerging', is_flag=True, help='Only clusters discovered in the last DAYS')
+@click.option('--min-posts', default=None, type=int, help='Minimum posts per category (default from settings)')
+@click.option('--limit', '-n', default=30, help='Maximum categories')
+def categories(days, emerging, min_posts, limit):
+    """Show problem categories, including discovered ones"""
+    from analysis.clusters import get_categories
+
+    rows = get_categories(days=days, emerging=emerging, min_posts=min_posts, limit=limit)
+    if not rows:
+        console.print("[yellow]No categories yet - run `gtm cluster`[/yellow]")
+        return
+
+    table = Table(title=f"{'Emerging ' if emerging else ''}Problem Categories (last {days} days)")
+    table.add_column("Category", style="cyan")
+    table.add_column("Parent", style="dim")
+    table.add_column("Recent", justify="right", style="yellow")
+    table.add_column("Posts", justify="right")
+    table.add_column("Avg Fit", justify="right", style="green")
+    table.add_column("First Seen")
+    table.add_column("Terms / Description", max_width=50)
+    for row in rows:
+        table.add_row(
+            row['name'], row['parent_category'] or "-", f"{row['recent']:,}", f"{row['post_count']:,}",
+            f"{row['avg_fit']:.1f}" if row['avg_fit'] is not None else "-",
+            (row['first_seen'] or "")[:10], (row['description'] or "")[:50],
+        )
+    console.print(table)
+
+@cli.command()
+@click.option('--all', 'retag', is_flag=True, help='Re-tag every post, not just untagged ones')
+def tag(retag):
+    """Tag posts with keywords.json matches (new crawls are tagged at ingest)"""
+    from crawlers.tagger import tag_posts
+
+    console.print(f"Tagged {tag_posts(retag=retag):,} posts")
+
+@cli.command()
+@click.option('--category', '-c', default='competitor_brands',
+              help='keywords.json category (e.g. buying_signals, pain_points)')
+@click.option('--days', '-d', default=30, help='Days to look back')
+@click.option('--limit', '-n', default=25, help='Maximum keywords')
+def mentions(category, days, limit):
+    """Show posts and high-fit leads per tagged keyword"""
+    from crawlers.tagger import get_tag_counts
+
+    rows = get_tag_counts(category, days)[:limit]
+    if not rows:
+        console.print(f"[yellow]No {category} mentions in the last {days} days[/yellow]")
+        return
+
+    table = Table(title=f"{category} mentions (last {days} days)")
+    table.add_column("Keyword", style="cyan")
+    table.add_column("Group", style="dim")
+    table.add_column("Posts", justify="right")
+    table.add_column("High Fit", justify="right", style="green")
+    table.add_column("Avg Fit", justify="right")
+    for row in rows:
+        table.add_row(row['keyword'], row['tag'], f"{row['posts']:,}", f"{row['high_fit']:,}",
+                      f"{row['avg_fit']:.1f}" if row['avg_fit'] is not None else "-")
+    console.print(table)
+
+@cli.command()
+def serve():
+    """Keep a warm process answering query/stats/trends/export over a Unix socket"""
+    try:
+        daemon.serve()
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+
+@cli.command('train-gate')
+@click.option('--recall', default=None, type=float, help='Target recall for relevant posts (default from settings)')
+def train_gate(recall):
+    """Train the local pre-filter from existing LLM analyses"""
+    from analysis.gate import train_gate as do_train
+    from config.settings import GATE_TARGET_RECALL
+
+    try:
+        meta = do_train(target_recall=recall or GATE_TARGET_RECALL)
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+        return
+    test = meta['test']
+    console.print(f"[green]Trained gate {meta['version']}[/green] on {meta['train']['examples']:,} posts")
+    console.print(f"Held-out: {test['examples']:,} posts, {test['positives']:,} relevant, "
+                  f"recall {test['recall']}, pass rate {test['pass_rate']}")
+
+@cli.command('gate-report')
+def gate_report():
+    """Show pre-filter recall, pass rate and drift"""
+    from analysis.gate import gate_report as do_report
+
+    report = do_report()
+    model = report['model']
+    if not model:
+        console.print("[yellow]No gate model yet - run `gtm train-gate`[/yellow]")
+        return
+
+    table = Table(title=f"Gate {model['version']} (trained {model['trained_at']})")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", justify="right")
+
+    test = model['test']
+    table.add_row("Held-out posts", f"{test['examples']:,}")
+    table.add_row("Held-out recall", str(test['recall']))
+    table.add_row("Held-out pass rate", str(test['pass_rate']))
+    for decision in ('passed', 'rejected', 'sampled'):
+        table.add_row(f"Posts {decision}", f"{report['decisions'].get(decision, 0):,}")
+
+    drift = report['drift']
+    table.add_row("Sampled rejects analyzed", f"{drift['sampled_analyzed']:,}")
+    table.add_row("...of which relevant", f"{drift['relevant']:,}")
+    table.add_row("Miss rate", str(drift['miss_rate']))
+
+    console.print(table)
+
+@cli.command('export-changes')
+@click.option('--since', default=0, help='Export changes after this sequence number (0 = full snapshot)')
+@click.option('--skip-origin', help='Leave out rows that were applied from this peer')
+@click.option('--peer', help='Machine the export is for; it has applied up to --since, '
+                             'so older changes can be pruned (default: --skip-origin)')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Output file (default stdout)')
+def export_changes(since, skip_origin, peer, output):
+    """Export changed rows as JSON lines for another machine"""
+    from db.sync import export_changes as do_export
+    
+    result = do_export(output, since=since, skip_origin=skip_origin, peer=peer or skip_origin)
+    if result['snapshot'] and since > 0:
+        click.echo(f"Changes after seq {since} were pruned; exported a full snapshot instead", err=True)
+    click.echo(
+        f"Exported {result['upserts']} upserts, {result['deletes']} deletes "
+        f"(seq {result['since']} → {result['until']})"
+        + (f", pruned {result['pruned']} applied changes" if result['pruned'] else ""),
+        err=True,
+    )
+
+@cli.command('apply-changes')
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('--peer', '-p', help='Name of the machine the export came from')
+def apply_changes(input, peer):
+    """Apply an export-changes file to this database"""
+    from db.sync import apply_changes as do_apply
+    
+    result = do_apply(input, peer=peer)
+    console.print(f"Applied {result['upserts']} upserts, {result['deletes']} deletes")
+    if result['until'] is not None:
+        console.print(f"Next export on the source: [bold]--since {result['until']}[/bold]")
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,150 @@
+"""Resident query process for the read commands (``gtm serve``)
+
+Scripts call ``gtm query``/``gtm stats`` many times in a row, and each call
+pays for a fresh interpreter, imports and a cold SQLite cache. ``serve``
+keeps one process up with pooled connections (warm statement and page
+caches) and answers read operations over a Unix socket at
+``SERVE_SOCKET_PATH``.
+
+The protocol is JSON lines: each request is a line like
+``{"op": "stats"}`` or ``{"op": "opportunities", "args": {"min_fit": 7}}``.
+Each reply is ``{"ok": true, "result": ...}`` or
+``{"ok": false, "error": "..."}``. A connection may send any number of
+requests. ``call`` is what the CLI uses: it asks the daemon when the socket
+is live and runs the operation in-process otherwise.
+"""
+import json
+import os
+import socket
+
+from config.settings import SERVE_SOCKET_PATH, SERVE_CACHE_MB
+
+# Seconds to wait on the daemon before falling back to a local query
+CLIENT_TIMEOUT = 30
+
+# Set by `gtm --local` to always query in-process
+use_daemon = True
+
+def _opportunities(**kwargs):
+    from db import get_opportunities
+    return get_opportunities(**kwargs)
+
+def _stats():
+    from db import get_stats
+    return get_stats()
+
+def _trends(days: int = 30):
+    from db import get_category_trends
+    return get_category_trends(days=days)
+
+def _query_cache(clear: bool = False):
+    from db import query_cache
+    cleared = query_cache.clear() if clear else 0
+    return {**query_cache.stats(), "cleared": cleared}
+
+# Read operations the daemon answers
+OPERATIONS = {
+    "opportunities": _opportunities,
+    "stats": _stats,
+    "trends": _trends,
+    "query_cache": _query_cache,
+}
+
+def encode(result):
+    """JSON-ready form of an operation result (records become dicts)"""
+    if isinstance(result, list):
+        return [r.to_dict() if hasattr(r, "to_dict") else r for r in result]
+    return result
+
+def decode(op: str, result):
+    """Inverse of ``encode``, so callers get what the local call returns"""
+    if op == "opportunities":
+        from db.records import Opportunity
+        return [Opportunity(**row) for row in result]
+    return result
+
+class DaemonError(Exception):
+    """The daemon ran the request and it failed"""
+
+def request(op: str, path=SERVE_SOCKET_PATH, **args):
+    """Run ``op`` in the daemon; OSError when none is listening"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CLIENT_TIMEOUT)
+        sock.connect(str(path))
+        sock.sendall(json.dumps({"op": op, "args": args}).encode() + b"\n")
+        with sock.makefile("rb") as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError("Daemon closed the connection")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise DaemonError(response["error"])
+    return decode(op, response["result"])
+
+def call(op: str, **args):
+    """``op`` through a running daemon, or in this process if there is none"""
+    if use_daemon and os.path.exists(SERVE_SOCKET_PATH):
+        try:
+            return request(op, **args)
+        except OSError:
+            pass
+    return OPERATIONS[op](**args)
+
+def handle(line: bytes) -> bytes:
+    """One request line -> one reply line"""
+    try:
+        message = json.loads(line)
+        operation = OPERATIONS.get(message.get("op"))
+        if operation is None:
+            raise ValueError(f"Unknown op {message.get('op')!r}, expected one of {', '.join(OPERATIONS)}")
+        response = {"ok": True, "result": encode(operation(**message.get("args", {})))}
+    except Exception as e:
+        response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return json.dumps(response, default=str).encode() + b"\n"
+
+def serve(path=SERVE_SOCKET_PATH):
+    """Answer requests on ``path`` until interrupted"""
+    import signal
+    import socketserver
+    import db
+
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(str(path))
+            raise RuntimeError(f"Already serving on {path}")
+        except ConnectionRefusedError:
+            os.unlink(path)  # left behind by a daemon that didn't shut down cleanly
+
+    db.init_db()
+    db.enable_connection_pool(SERVE_CACHE_MB)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(handle(line))
+                    self.wfile.flush()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    server = Server(str(path), Handler)
+    os.chmod(path, 0o600)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on {path} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+if __name__ == "__main__":
+    serve()
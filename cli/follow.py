@@ -0,0 +1,37 @@
+"""Stream of new opportunities as they're analyzed (``gtm follow``)
+
+Instead of re-running a query over the whole window, ``follow`` keeps one
+connection open and remembers the last ``analysis.id`` it has seen. Between
+polls the only work is ``PRAGMA data_version``, which changes when another
+connection commits and costs microseconds without touching any table.
+Only when it changes are the analyses past the watermark read, by primary
+key, and filtered.
+"""
+import time
+
+from config.settings import FOLLOW_POLL_SECONDS
+
+def follow(min_fit: int = 7, min_urgency: int = 0, use_case: str = None,
+           competitor: str = None, signal: str = None, after_id: int = None,
+           interval: float = FOLLOW_POLL_SECONDS):
+    """Yield each matching opportunity analyzed from now on (after ``after_id`` if given)"""
+    from db import get_connection, get_new_opportunities
+
+    with get_connection() as conn:
+        if after_id is None:
+            after_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM analysis").fetchone()[0]
+        version = None
+        while True:
+            current = conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != version:
+                version = current
+                after_id, matches = get_new_opportunities(
+                    conn, after_id, min_fit=min_fit, min_urgency=min_urgency,
+                    use_case=use_case, competitor=competitor, signal=signal,
+                )
+                yield from matches
+            time.sleep(interval)
+
+if __name__ == "__main__":
+    for opportunity in follow(min_fit=0, after_id=0):
+        print(opportunity.fit_score, opportunity.urgency_score, opportunity.title)
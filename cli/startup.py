@@ -0,0 +1,121 @@
+"""Cold-start budget for read commands
+
+    python -m cli.startup [--runs=N]
+
+Runs each command in ``BUDGETS`` in a fresh interpreter against a scratch
+database (already initialized, as in normal use) with ``-X importtime``,
+and reports the median wall clock and import time. It also checks that a
+bare ``import cli`` loads none of ``IMPORT_FORBIDDEN``. Exits non-zero when
+a command goes over its budget or imports one of ``HEAVY_MODULES``, or
+``import cli`` pulls in a forbidden module, e.g. after a top-level import of
+an SDK slips back into the CLI.
+
+This is a manual check (there is no test suite to hook it into): run it
+after changing imports in cli/, db/ or config/.
+"""
+import json
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Median wall clock budget per command in ms (interpreter start included)
+BUDGETS = {
+    "query --json-output": 150,
+    "query": 200,
+    "stats": 200,
+    "trends": 200,
+    "export ml_inference": 200,
+}
+
+# Modules no read command should import
+HEAVY_MODULES = ("anthropic", "openai", "httpx", "requests", "numpy", "analysis", "crawlers")
+
+# Modules ``import cli`` alone must not load: commands import them when they run
+IMPORT_FORBIDDEN = ("numpy", "anthropic", "openai", "rich")
+
+IMPORT_RUNNER = """
+import sys, json
+sys.path.insert(0, {root!r})
+import cli
+print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}} & set({forbidden!r}))))
+"""
+
+# Run a command the way ./gtm does, against the scratch database, then list
+# which heavy modules ended up imported
+RUNNER = """
+import sys, json
+sys.path.insert(0, {root!r})
+import db
+db.DB_PATH = __import__("pathlib").Path({db_path!r})
+from cli import cli
+try:
+    cli({args!r}, standalone_mode=False)
+finally:
+    heavy = sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))
+    print("\\n" + json.dumps(heavy), file=sys.stderr)
+"""
+
+IMPORT_RE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", re.MULTILINE)
+
+def run_once(command: str, db_path: Path) -> dict:
+    code = RUNNER.format(root=str(ROOT), db_path=str(db_path), args=command.split(),
+                         heavy=list(HEAVY_MODULES))
+    start = time.monotonic()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True)
+    elapsed = (time.monotonic() - start) * 1000
+    if result.returncode:
+        raise RuntimeError(f"{command!r} failed:\n{result.stderr[-2000:]}")
+    # Top-level (unindented) entries carry the cumulative time of everything they pulled in
+    import_us = sum(int(us) for us, name in IMPORT_RE.findall(result.stderr)
+                    if not name.startswith(" "))
+    heavy = json.loads(result.stderr.strip().splitlines()[-1])
+    return {"ms": elapsed, "import_ms": import_us / 1000, "heavy": heavy}
+
+def check_import() -> list:
+    """Modules of ``IMPORT_FORBIDDEN`` that a fresh ``import cli`` loads"""
+    code = IMPORT_RUNNER.format(root=str(ROOT), forbidden=list(IMPORT_FORBIDDEN))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"import cli failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def check(runs: int = 5) -> list:
+    """Median cold-start time per command, with budget verdicts"""
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = Path(scratch) / "startup.db"
+        subprocess.run([sys.executable, "-c", RUNNER.format(
+            root=str(ROOT), db_path=str(db_path), args=["stats"], heavy=[])],
+            capture_output=True, check=True)
+        for command, budget in BUDGETS.items():
+            samples = [run_once(command, db_path) for _ in range(runs)]
+            ms = statistics.median(s["ms"] for s in samples)
+            heavy = sorted({m for s in samples for m in s["heavy"]})
+            results.append({
+                "command": command,
+                "ms": round(ms, 1),
+                "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+                "budget_ms": budget,
+                "heavy": heavy,
+                "ok": ms <= budget and not heavy,
+            })
+    return results
+
+if __name__ == "__main__":
+    runs = next((int(a.split("=", 1)[1]) for a in sys.argv[1:] if a.startswith("--runs=")), 5)
+    loaded = check_import()
+    print(f"{'import cli':<22} {'loads ' + ', '.join(loaded) if loaded else 'ok'}")
+    results = check(runs)
+    for r in results:
+        verdict = "ok" if r["ok"] else "OVER"
+        heavy = f"  imports {', '.join(r['heavy'])}" if r["heavy"] else ""
+        print(f"{r['command']:<22} {r['ms']:>7.1f} ms (imports {r['import_ms']:>6.1f} ms)  "
+              f"budget {r['budget_ms']} ms  {verdict}{heavy}")
+    sys.exit(0 if not loaded and all(r["ok"] for r in results) else 1)
@@ -12,7 +12,153 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 # Model selection - use cheap models for volume
 ANALYSIS_MODEL = "claude-3-haiku-20240307"  # or "gpt-4o-mini"
-ANALYSIS_PROVIDER = "anthropic"  # or "openai"
+ANALYSIS_PROVIDER = "anthropic"  # or "openai", or "simulator" (offline, for load tests)
+OPENAI_MODEL = "gpt-4o-mini"  # model for the OpenAI provider
+
+# Provider endpoints for analysis calls (analysis.router). Requests are spread
+# across endpoints by weight and health. None: one endpoint per configured key,
+# ANALYSIS_PROVIDER taking all traffic and the other kept for hedging/failover.
+# Example:
+# ANALYSIS_ENDPOINTS = [
+#     {"provider": "anthropic", "model": "claude-3-haiku-20240307", "api_key_env": "ANTHROPIC_API_KEY", "weight": 2},
+#     {"provider": "anthropic", "model": "claude-3-haiku-20240307", "api_key_env": "ANTHROPIC_API_KEY_2", "weight": 2},
+#     {"provider": "openai", "model": "gpt-4o-mini", "api_key_env": "OPENAI_API_KEY", "weight": 1},
+# ]
+ANALYSIS_ENDPOINTS = None
+ANALYSIS_HEDGE_AFTER = 8.0  # seconds before a hedged request goes to a second endpoint; None disables
+ANALYSIS_ENDPOINT_COOLDOWN = 30  # seconds an endpoint is skipped after a server error
+
+# Offline simulator provider (analysis.providers): deterministic answers from the
+# post text, with injected latency and faults. Latency is lognormal (median,
+# sigma in seconds); rate_limit/server_error/malformed are shares of requests
+# answered with a 429, a 500 or truncated JSON; requests in flight above
+# max_concurrency get a 429. Simulator endpoints in ANALYSIS_ENDPOINTS take
+# {"provider": "simulator", "options": {"profile": "flaky"}}.
+SIMULATOR_MODEL = "simulator"
+SIMULATOR_PROFILES = {
+    "clean": {"latency_median": 0.05, "latency_sigma": 0.3, "rate_limit": 0.0,
+              "server_error": 0.0, "malformed": 0.0, "retry_after": 1.0, "max_concurrency": None},
+    "slow_tail": {"latency_median": 0.05, "latency_sigma": 1.2},
+    "rate_limited": {"rate_limit": 0.05, "max_concurrency": 16, "retry_after": 0.5},
+    "flaky": {"server_error": 0.05, "malformed": 0.05},
+}
+SIMULATOR_PROFILE = "clean"
+SIMULATOR_SEED = 0
+
+# Longer post bodies are compacted to their highest-signal sentences (analysis.compact)
+ANALYSIS_BODY_TOKEN_BUDGET = 400
+ANALYSIS_MIN_CONTENT_CHARS = 50  # shorter posts (title + body) are never queued for analysis
+
+# Concurrent analysis (analysis.concurrent): AIMD limits on in-flight requests
+ANALYSIS_INITIAL_CONCURRENCY = 4
+ANALYSIS_MAX_CONCURRENCY = 32
+ANALYSIS_MAX_ATTEMPTS = 5  # per post, counting rate-limited retries
+
+# Failed analyses are retried with exponential backoff, then dead-lettered
+ANALYSIS_FAILURE_LIMIT = 4  # failed runs before a post is dead-lettered
+ANALYSIS_RETRY_BASE_MINUTES = 30  # doubles after every failure
+ANALYSIS_RETRY_MAX_MINUTES = 24 * 60
+
+# Batched analysis (analysis.batched): several posts per request
+ANALYSIS_BATCH_TOKEN_BUDGET = 6000  # estimated input tokens per request
+ANALYSIS_BATCH_MAX_POSTS = 20
+ANALYSIS_BATCH_OUTPUT_TOKENS_PER_POST = 200
+
+# Offline batch analysis (analyze --batch): 'anthropic', 'openai' or 'local'.
+# None picks the provider used for interactive analysis.
+ANALYSIS_BATCH_BACKEND = None
+LOCAL_BATCH_DIR = BASE_DIR / "db" / "local_batches"  # job files for the 'local' backend
+
+# Analysis queue order (analysis.priority): weights of the 0-1 prior components
+PRIOR_WEIGHTS = {
+    "yield": 0.35,  # high-fit rate of the post's subreddit / HN search term
+    "engagement": 0.2,
+    "keywords": 0.3,  # problem-signal phrases and category terms
+    "thread": 0.15,  # best fit already found in the same thread
+}
+PRIOR_YIELD_SMOOTHING = 20  # pseudo-posts at the overall rate added to each channel
+PRIOR_MAX_AGE_HOURS = 24  # priors are recomputed after this, as channel yields drift
+
+# Daily analysis spend caps (UTC day, from llm_calls); None for no cap
+ANALYSIS_DAILY_TOKEN_BUDGET = None
+ANALYSIS_DAILY_COST_BUDGET = None  # USD
+ANALYSIS_BUDGET_RESERVE = 0.2  # last share of the budget kept for high-prior posts
+ANALYSIS_BUDGET_RESERVE_MIN_PRIOR = 0.5
+
+# USD per million tokens, for cost in llm_calls (analysis.telemetry).
+# input is uncached input; cache_read/cache_write are prompt-cache tokens.
+MODEL_PRICING = {
+    "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25, "cache_read": 0.03, "cache_write": 0.30},
+    "claude-3-5-haiku-20241022": {"input": 0.80, "output": 4.00, "cache_read": 0.08, "cache_write": 1.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "cache_read": 0.075, "cache_write": 0.0},
+}
+BATCH_API_DISCOUNT = 0.5  # price multiplier for provider batch API calls
+
+# Shortest request prefix (tool definition + system prompt, in tokens) each model will
+# cache, by model name prefix ("" for any other model). Anthropic ignores cache_control
+# below it, so shorter prefixes are sent without it and billed as plain input. The
+# single-post prefix is ~1.4k tokens, so prompt caching only applies to models with a
+# 1024-token minimum; with the default claude-3-haiku it is off (`gtm prompt-cache --offline`).
+PROMPT_CACHE_MIN_TOKENS = {"claude-3-haiku": 2048, "claude-3-5-haiku": 2048, "": 1024}
+
+# Persistent LLM response cache (analysis.cache), evicted least recently used first
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 200_000
+LLM_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Local pre-filter (analysis.gate) deciding which posts are worth an LLM call.
+# Trained from existing analysis labels with `./gtm train-gate`; inactive until then.
+GATE_ENABLED = True
+GATE_MODEL_PATH = BASE_DIR / "db" / "gate_model.npz"
+GATE_POSITIVE_FIT = 5  # LLM fit_score that counts as relevant
+GATE_TARGET_RECALL = 0.95  # share of relevant posts the threshold must let through
+GATE_SAMPLE_RATE = 0.05  # share of rejected posts still sent to the LLM to watch for drift
+GATE_MIN_LABELS = 200
+
+# Local vector index (analysis.embeddings) behind `./gtm similar` and `query --like`.
+# Vectors are hashed bags of words, so changing EMBEDDING_DIM needs `./gtm embed --rebuild`.
+EMBEDDING_DIM = 256
+EMBEDDINGS_PATH = BASE_DIR / "db" / "embeddings.f32"  # float32 matrix, memory-mapped
+EMBEDDING_IVF_PATH = BASE_DIR / "db" / "embeddings_ivf.npz"  # optional, `./gtm embed --ivf`
+EMBEDDING_IVF_NPROBE = 8  # clusters searched per query
+EMBEDDING_CHUNK_ROWS = 65_536  # rows scored per block when scanning the matrix
+EMBEDDING_SUMMARY_WEIGHT = 0.5  # weight of the problem summary next to the post text
+
+# Incremental clustering (analysis.clusters) into categories/post_categories, seeded with
+# PROBLEM_CATEGORIES. A post further from every centroid than the novelty threshold is a
+# candidate for a new cluster. Hashed bag-of-words similarities are low and depend on the
+# corpus, so by default the threshold is the CLUSTER_NOVELTY_PERCENTILE of the posts' own
+# nearest-centroid similarities, measured on a sample as the centroids move. A cluster
+# starts once CLUSTER_SPAWN_MIN_POSTS candidates are as close to each other as the closest
+# CLUSTER_AGREEMENT_PERCENTILE of post pairs; it's listed as emerging at CLUSTER_MIN_POSTS.
+CLUSTER_NOVELTY_THRESHOLD = None  # fixed cosine threshold instead of calibrating
+CLUSTER_NOVELTY_PERCENTILE = 5
+CLUSTER_AGREEMENT_PERCENTILE = 99
+CLUSTER_SPAWN_MIN_POSTS = 3
+CLUSTER_CALIBRATION_SAMPLE = 5000  # posts sampled to calibrate the thresholds
+CLUSTER_CANDIDATES_MAX = 2000  # newest candidates kept waiting for company
+CLUSTER_MIN_POSTS = 5
+CLUSTER_MAX = 500  # past this, novel posts join the nearest cluster instead
+CLUSTER_SEED_WEIGHT = 20  # posts' worth of pull the seed descriptions keep on their centroids
+
+# `gtm serve`: resident process answering read commands over a Unix socket.
+# The CLI uses it automatically while the socket is live.
+SERVE_SOCKET_PATH = BASE_DIR / "db" / "gtm.sock"
+SERVE_CACHE_MB = 64  # SQLite page cache per pooled connection
+
+# Cached results of get_stats/get_category_trends/get_opportunities (db.cache), dropped on
+# any write to the tables behind them. QUERY_CACHE_DISK shares them between CLI runs.
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_TTL = 300  # seconds; bounds staleness of "last N days" windows
+QUERY_CACHE_MAX_ENTRIES = 256  # per process
+QUERY_CACHE_DISK = False
+QUERY_CACHE_PATH = BASE_DIR / "db" / "query_cache.db"
+
+# `gtm follow`: seconds between PRAGMA data_version checks for new analyses
+FOLLOW_POLL_SECONDS = 1.0
+
+# Curated competitor, pain point and buying-signal keywords, tagged at ingest (crawlers.tagger)
+KEYWORDS_PATH = BASE_DIR / "market-analysis" / "keywords.json"
 
 # Telegram for digests
 TELEGRAM_USER_ID = "775397536"
@@ -59,6 +205,14 @@ HN_SEARCH_TERMS = [
     "process terabytes",
 ]
 
+# Lead ranking: rank_score = weighted blend of 0-10 components x recency decay
+RANK_WEIGHTS = {
+    "fit": 0.6,
+    "urgency": 0.25,
+    "engagement": 0.15,
+}
+RANK_ENGAGEMENT_CAP = 500  # points/score + comments at which engagement maxes out
+
 # Problem categories (initial taxonomy)
 PROBLEM_CATEGORIES = {
     "ml_inference": "ML model deployment and inference at scale or edge",
@@ -73,6 +227,22 @@ PROBLEM_CATEGORIES = {
     "workflow_orchestration": "Job scheduling and orchestration pain",
 }
 
+# Alternative product/positioning profiles (see market-analysis/positioning-recommendations.md),
+# scored in the same call as the main analysis: fit/urgency/use_case per profile,
+# stored in profile_scores. Each profile adds a few output tokens per post; {} turns it off.
+PRODUCT_PROFILES = {
+    "warehouse_cost": (
+        "Snowflake/Databricks customers with cost pain: consumption bills growing, storing and "
+        "processing data they don't need. Expanso filters, aggregates and masks data at the "
+        "source, before it reaches the warehouse."
+    ),
+    "log_cost": (
+        "Elastic/Splunk/Datadog users with observability cost pain: log and metric volume "
+        "driving the bill. Expanso filters and reduces logs where they are produced "
+        "(Cribl-like, but broader)."
+    ),
+}
+
 # Expanso/Bacalhau context for AI analysis
 EXPANSO_CONTEXT = """
 Expanso (Bacalhau) is a distributed compute platform that:
@@ -6,6 +6,8 @@ import time
 
 from config.settings import HN_API_BASE, HN_SEARCH_TERMS
 from db import insert_post
+from .normalize import normalize_title, normalize_body
+from .tagger import tag_post
 
 def search_hn(query: str, tags: str = "(story,comment)", 
               created_after: datetime = None) -> Generator[dict, None, None]:
@@ -63,8 +65,9 @@ def crawl_hn(days_back: int = 1) -> dict:
                 # Determine if it's a story or comment
                 is_story = hit.get("story_id") is None
                 
-                title = hit.get("title") or hit.get("story_title")
-                body = hit.get("comment_text") or hit.get("story_text") or ""
+                title = normalize_title(hit.get("title") or hit.get("story_title"))
+                body = normalize_body(hit.get("comment_text") or hit.get("story_text") or "",
+                                      is_html=True)
                 
                 # Build URL
                 if is_story:
@@ -73,6 +76,12 @@ def crawl_hn(days_back: int = 1) -> dict:
                     url = f"https://news.ycombinator.com/item?id={source_id}"
                 
                 created_at = datetime.fromtimestamp(hit.get("created_at_i", 0))
+                metadata = {
+                    "points": hit.get("points"),
+                    "num_comments": hit.get("num_comments"),
+                    "story_id": hit.get("story_id"),
+                    "search_term": term,
+                }
                 
                 result = insert_post(
                     source="hn",
@@ -82,12 +91,8 @@ def crawl_hn(days_back: int = 1) -> dict:
                     url=url,
                     author=hit.get("author"),
                     created_at=created_at,
-                    metadata={
-                        "points": hit.get("points"),
-                        "num_comments": hit.get("num_comments"),
-                        "story_id": hit.get("story_id"),
-                        "search_term": term,
-                    }
+                    metadata=metadata,
+                    tags=tag_post(title, body, metadata),
                 )
                 
                 if result:
@@ -0,0 +1,135 @@
+"""Ingest-time text normalization
+
+HN ``comment_text``/``story_text`` arrive as HTML (``<p>``, ``<a>``,
+``<pre><code>``, entities) and Reddit text as escaped markdown. Posts are
+normalized once, before they're stored, so analysis and search never pay
+for markup:
+- tags are stripped and entities decoded; links keep their text
+- code blocks (fenced, or indented after a blank line and outside a
+  list) collapse to a one-line placeholder
+- quoted replies (``> ...``) collapse to a short excerpt of the quote
+- whitespace is collapsed, paragraphs kept
+"""
+import html
+import re
+
+# Characters of a quoted block kept as context for the reply
+QUOTE_EXCERPT = 80
+
+_PRE_RE = re.compile(r"<pre>\s*(?:<code>)?(.*?)(?:</code>)?\s*</pre>", re.DOTALL | re.IGNORECASE)
+_LINK_RE = re.compile(r"<a\s[^>]*?href=\"([^\"]*)\"[^>]*>(.*?)</a>", re.DOTALL | re.IGNORECASE)
+_PARAGRAPH_RE = re.compile(r"<\s*(?:p|br|/p|div|/div|li)\s*/?>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_FENCE_RE = re.compile(r"^```.*?^```[^\n]*$", re.DOTALL | re.MULTILINE)
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+_MD_LINK_RE = re.compile(r"\[([^\]]+)\]\((?:[^()\s]|\([^)]*\))+\)")
+
+def code_placeholder(code: str) -> str:
+    lines = [line for line in code.strip().splitlines() if line.strip()]
+    return f"[code: {len(lines)} lines]"
+
+def strip_html(text: str) -> str:
+    """HTML fragment -> plain text with paragraphs as blank lines"""
+    text = _PRE_RE.sub(lambda m: "\n\n" + code_placeholder(html.unescape(m.group(1))) + "\n\n", text)
+    # HN shortens long link text with "..."; the href is more useful then
+    text = _LINK_RE.sub(
+        lambda m: m.group(1) if m.group(2).endswith("...") else m.group(2), text
+    )
+    text = _PARAGRAPH_RE.sub("\n\n", text)
+    return _TAG_RE.sub("", text)
+
+def collapse_code(text: str) -> str:
+    """Replace markdown fenced and indented code blocks with a placeholder
+
+    As in markdown, an indented block is code only when it follows a blank
+    line (or starts the text) and doesn't continue a list: indented lines
+    under a list item are nested items or continuation paragraphs.
+    """
+    # Fence lines (and the language tag) aren't code
+    text = _FENCE_RE.sub(lambda m: code_placeholder("\n".join(m.group(0).split("\n")[1:-1])), text)
+
+    out, block = [], []
+    after_blank, in_list = True, False
+    for line in text.split("\n"):
+        indented = line.startswith(("    ", "\t")) and line.strip()
+        if indented and (block or (after_blank and not in_list)):
+            block.append(line)
+            continue
+        if block:
+            out.append(code_placeholder("\n".join(block)))
+            block = []
+        out.append(line)
+        after_blank = not line.strip()
+        if line.strip() and not indented:
+            in_list = bool(_LIST_ITEM_RE.match(line))
+    if block:
+        out.append(code_placeholder("\n".join(block)))
+    return "\n".join(out)
+
+def collapse_quotes(text: str) -> str:
+    """Replace runs of quoted lines with a short excerpt"""
+    out, quote = [], []
+    for line in text.split("\n") + [""]:
+        stripped = line.lstrip()
+        if stripped.startswith(">"):
+            quote.append(stripped.lstrip("> ").strip())
+            continue
+        if quote:
+            excerpt = " ".join(q for q in quote if q)
+            if len(excerpt) > QUOTE_EXCERPT:
+                excerpt = excerpt[:QUOTE_EXCERPT].rsplit(" ", 1)[0] + "..."
+            out.append(f"[quote: {excerpt}]")
+            quote = []
+        out.append(line)
+    return "\n".join(out[:-1])
+
+def collapse_whitespace(text: str) -> str:
+    paragraphs = re.split(r"\n\s*\n", text)
+    paragraphs = [re.sub(r"\s+", " ", p).strip() for p in paragraphs]
+    return "\n\n".join(p for p in paragraphs if p)
+
+def normalize_title(title: str) -> str:
+    if not title:
+        return title
+    return collapse_whitespace(html.unescape(_TAG_RE.sub("", title)))
+
+def normalize_body(body: str, is_html: bool = False) -> str:
+    """Plain, compact text for a post body"""
+    if not body:
+        return body
+    if is_html:
+        body = strip_html(body)
+    else:
+        body = _MD_LINK_RE.sub(r"\1", body)
+        body = collapse_code(body)
+    body = html.unescape(body)
+    body = collapse_quotes(body)
+    return collapse_whitespace(body)
+
+def normalize_stored_posts(batch_size: int = 1000) -> int:
+    """Normalize posts crawled before normalization existed, return how many changed"""
+    from db import get_connection
+
+    changed = 0
+    last_id = ""
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT id, source, title, body FROM posts
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return changed
+            for row in rows:
+                title = normalize_title(row["title"])
+                body = normalize_body(row["body"], is_html=row["source"] == "hn")
+                if (title, body) != (row["title"], row["body"]):
+                    conn.execute("UPDATE posts SET title = ?, body = ? WHERE id = ?",
+                                 (title, body, row["id"]))
+                    changed += 1
+        last_id = rows[-1]["id"]
+
+if __name__ == "__main__":
+    from db import init_db
+    init_db()
+    print(f"Normalized {normalize_stored_posts()} stored posts")
@@ -6,6 +6,8 @@ import time
 
 from config.settings import REDDIT_SUBREDDITS, REDDIT_USER_AGENT
 from db import insert_post
+from .normalize import normalize_title, normalize_body
+from .tagger import tag_post
 
 def get_subreddit_posts(subreddit: str, sort: str = "new", 
                         limit: int = 100) -> Generator[dict, None, None]:
@@ -97,8 +99,8 @@ def crawl_reddit(days_back: int = 1, include_comments: bool = True) -> dict:
                     continue
                 
                 source_id = post.get("id")
-                title = post.get("title", "")
-                body = post.get("selftext", "")
+                title = normalize_title(post.get("title", ""))
+                body = normalize_body(post.get("selftext", ""))
                 url = f"https://reddit.com{post.get('permalink', '')}"
                 
                 result = insert_post(
@@ -115,7 +117,8 @@ def crawl_reddit(days_back: int = 1, include_comments: bool = True) -> dict:
                         "num_comments": post.get("num_comments"),
                         "upvote_ratio": post.get("upvote_ratio"),
                         "type": "post",
-                    }
+                    },
+                    tags=tag_post(title, body),
                 )
                 
                 if result:
@@ -133,20 +136,23 @@ def crawl_reddit(days_back: int = 1, include_comments: bool = True) -> dict:
                             if comment_created < since_ts:
                                 continue
                             
+                            comment_body = normalize_body(comment.get("body", ""))
+                            comment_metadata = {
+                                "subreddit": subreddit,
+                                "score": comment.get("score"),
+                                "parent_id": source_id,
+                                "type": "comment",
+                            }
                             comment_result = insert_post(
                                 source="reddit",
                                 source_id=comment.get("id"),
                                 title=title,  # Parent post title
-                                body=comment.get("body", ""),
+                                body=comment_body,
                                 url=f"https://reddit.com{comment.get('permalink', '')}",
                                 author=comment.get("author"),
                                 created_at=datetime.fromtimestamp(comment_created),
-                                metadata={
-                                    "subreddit": subreddit,
-                                    "score": comment.get("score"),
-                                    "parent_id": source_id,
-                                    "type": "comment",
-                                }
+                                metadata=comment_metadata,
+                                tags=tag_post(title, comment_body, comment_metadata),
                             )
                             
                             if comment_result:
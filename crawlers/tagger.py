@@ -0,0 +1,185 @@
+"""Ingest-time keyword tagging from market-analysis/keywords.json
+
+Every keyword list in the file (competitor brands, pain points, buying
+signals, ...) is compiled once into an Aho-Corasick automaton, so a post is
+tagged in a single pass over its text however many keywords there are.
+Matching is case-insensitive on whole words: text and keywords are reduced
+to lowercase words separated by single spaces, and each keyword is matched
+with a space on both sides.
+
+Tags are stored in ``post_tags`` as (category, tag, keyword), e.g.
+("competitor_brands", "observability", "Splunk"), so competitor and
+buying-signal filters are index lookups. ``post_tag_versions`` records
+which version of the keyword file tagged each post; ``tag_posts`` re-tags
+posts after the file changes.
+"""
+import hashlib
+import json
+import re
+from collections import deque
+
+from config.settings import KEYWORDS_PATH
+from db import get_connection, replace_post_tags
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+# Part of the tagger version: bump when what gets tagged changes, so tag_posts re-tags
+TAG_RULES_REVISION = b"2"  # comments are tagged on their body only
+
+# Keys of keywords.json that aren't keyword categories
+SKIP_SECTIONS = ("metadata", "tracking_priority")
+
+# Posts re-tagged per transaction
+TAG_CHUNK = 2000
+
+def words(text: str) -> str:
+    """Lowercase words joined by single spaces, padded with a space each side"""
+    return " " + " ".join(WORD_RE.findall((text or "").lower())) + " "
+
+def load_keywords(path=KEYWORDS_PATH) -> list:
+    """(category, tag, keyword) for every keyword in the file
+
+    A plain ``keywords`` list is tagged with its category's name.
+    """
+    with open(path) as f:
+        sections = json.load(f)
+    entries = []
+    for category, groups in sections.items():
+        if category in SKIP_SECTIONS or not isinstance(groups, dict):
+            continue
+        for group, keywords in groups.items():
+            if isinstance(keywords, list):
+                tag = category if group == "keywords" else group
+                entries += [(category, tag, keyword) for keyword in keywords]
+    return entries
+
+class Tagger:
+    """Aho-Corasick automaton over the padded keyword strings"""
+
+    def __init__(self, entries: list, version: str = None):
+        self.version = version
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for entry in entries:
+            self._add(words(entry[2]), entry)
+        self._link()
+
+    def _add(self, pattern: str, entry: tuple):
+        state = 0
+        for ch in pattern:
+            if ch not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][ch] = len(self.goto) - 1
+            state = self.goto[state][ch]
+        self.out[state].append(entry)
+
+    def _link(self):
+        """Breadth-first failure links; each state also emits its suffixes' matches"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and ch not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def tag(self, *texts) -> list:
+        """Distinct (category, tag, keyword) matched in any of ``texts``"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        for text in texts:
+            state = 0
+            for ch in words(text):
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                if out[state]:
+                    found.update(out[state])
+        return sorted(found)
+
+_tagger = None
+_tagger_mtime = None
+
+def get_tagger() -> Tagger:
+    """Shared tagger for ``KEYWORDS_PATH``, rebuilt when the file changes"""
+    global _tagger, _tagger_mtime
+    mtime = KEYWORDS_PATH.stat().st_mtime_ns
+    if _tagger is None or mtime != _tagger_mtime:
+        with open(KEYWORDS_PATH, "rb") as f:
+            version = hashlib.sha256(f.read() + TAG_RULES_REVISION).hexdigest()[:12]
+        _tagger, _tagger_mtime = Tagger(load_keywords(), version), mtime
+    return _tagger
+
+def post_texts(title: str, body: str, metadata=None) -> tuple:
+    """The texts of a post to tag
+
+    Comments are stored with their parent's title (Reddit ``type: comment``,
+    HN ``story_id``), which isn't what the comment says, so only their body
+    is tagged.
+    """
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    metadata = metadata or {}
+    if metadata.get("type") == "comment" or metadata.get("story_id") is not None:
+        return (body,)
+    return (title, body)
+
+def tag_post(title: str, body: str, metadata: dict = None) -> tuple:
+    """(tagger version, tags) for ``insert_post``"""
+    tagger = get_tagger()
+    return tagger.version, tagger.tag(*post_texts(title, body, metadata))
+
+def tag_posts(retag: bool = False) -> int:
+    """Tag posts not yet tagged with the current keyword file (all with ``retag``)"""
+    tagger = get_tagger()
+    if retag:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM post_tag_versions")
+    tagged = 0
+    while True:
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT p.id, p.title, p.body, p.metadata FROM posts p
+                LEFT JOIN post_tag_versions v ON v.post_id = p.id
+                WHERE v.version IS NULL OR v.version != ?
+                LIMIT ?
+            """, (tagger.version, TAG_CHUNK)).fetchall()
+        if not rows:
+            return tagged
+        replace_post_tags([(row["id"], tagger.version,
+                            tagger.tag(*post_texts(row["title"], row["body"], row["metadata"])))
+                           for row in rows])
+        tagged += len(rows)
+
+def get_tag_counts(category: str = "competitor_brands", days: int = 30) -> list:
+    """Posts and high-fit posts per keyword of ``category`` in the last ``days``"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT t.keyword, t.tag, COUNT(*) AS posts,
+                   COALESCE(SUM(a.fit_score >= 7), 0) AS high_fit, AVG(a.fit_score) AS avg_fit
+            FROM post_tags t
+            JOIN posts p ON p.id = t.post_id
+            LEFT JOIN analysis a ON a.post_id = t.post_id
+            WHERE t.category = ? AND p.created_at >= datetime('now', ?)
+            GROUP BY t.keyword, t.tag
+            ORDER BY posts DESC
+        """, (category, f'-{days} days')).fetchall()
+        return [dict(row) for row in rows]
+
+if __name__ == "__main__":
+    import time
+    from db import init_db
+    init_db()
+    start = time.monotonic()
+    tagger = get_tagger()
+    print(f"Built tagger {tagger.version}: {len(tagger.goto):,} states "
+          f"in {(time.monotonic() - start) * 1000:.1f} ms")
+    print(tagger.tag("Cribl alternative?", "Our Splunk costs exploded, looking at Apache Kafka + Fluent Bit"))
+    print(f"Tagged {tag_posts()} posts")
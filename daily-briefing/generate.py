@@ -24,6 +24,11 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from db import init_db, get_opportunities, get_daily_post_counts, get_recent_unanalyzed
+from db.records import Signal
+from analysis import telemetry
+
 # Paths
 SEMANTIC_GTM_DIR = Path("/home/daaronch/semantic-gtm")
 GTM_SYSTEM_DIR = Path("/home/daaronch/.openclaw/workspace/gtm-system")
@@ -33,79 +38,62 @@ BRIEFINGS_ARCHIVE = BRIEFING_DIR / "archive"
 # Ensure directories exist
 BRIEFINGS_ARCHIVE.mkdir(parents=True, exist_ok=True)
 
-def get_decay_weight(days_ago: int) -> float:
-    """Return importance weight based on recency"""
-    if days_ago == 0:
-        return 1.0
+PERIODS = ("today", "yesterday", "this_week", "last_week", "older")
+
+def get_period(created_at, today) -> str:
+    """Briefing period of a post created at ``created_at``"""
+    created = datetime.fromisoformat(str(created_at).replace('Z', '+00:00')).date()
+    days_ago = (today - created).days
+    if days_ago <= 0:
+        return "today"
     elif days_ago == 1:
-        return 0.8
-    elif days_ago <= 3:
-        return 0.5
+        return "yesterday"
     elif days_ago <= 7:
-        return 0.3
+        return "this_week"
     elif days_ago <= 14:
-        return 0.1
-    else:
-        return 0.05
+        return "last_week"
+    return "older"
 
-def get_signals_by_period(db_path: Path, days: int = 14) -> dict:
-    """Get signals grouped by time period with decay weighting"""
-    if not db_path.exists():
-        return {"today": [], "yesterday": [], "this_week": [], "last_week": []}
-    
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def get_signals_by_period(days: int = 14, limit: int = 500) -> dict:
+    """Analyzed signals from the last ``days``, best lead rank first, grouped by age
+
+    Order and weight come from the precomputed ``analysis.rank_score`` (fit,
+    urgency, engagement and recency decay, see db.ranking), read from the
+    shared database by walking its index. Only the top ``limit`` are listed;
+    use ``get_signal_counts`` for how many there are.
+    """
+    periods = {period: [] for period in PERIODS}
     
+    init_db()
     today = datetime.now().date()
+    for opportunity in get_opportunities(min_fit=0, days=days, limit=limit, sort="rank"):
+        signal = Signal(opportunity.title, opportunity.url, opportunity.source,
+                        opportunity.fit_score or 0, opportunity.urgency_score or 0,
+                        opportunity.use_case, opportunity.reasoning,
+                        weight=opportunity.rank_score)
+        periods[get_period(opportunity.created_at, today)].append(signal)
     
-    periods = {
-        "today": [],
-        "yesterday": [],
-        "this_week": [],
-        "last_week": [],
-        "older": []
-    }
+    return periods
+
+def get_signal_counts(days: int = 14) -> dict:
+    """Posts, analyzed posts and high-fit leads per period, counted in SQL"""
+    counts = {period: {"posts": 0, "analyzed": 0, "high_fit": 0} for period in PERIODS}
     
-    try:
-        cursor.execute("""
-            SELECT p.*, a.fit_score, a.urgency_score, a.use_case, a.reasoning
-            FROM posts p
-            LEFT JOIN analysis a ON p.id = a.post_id
-            WHERE p.created_at > datetime('now', '-14 days')
-            ORDER BY COALESCE(a.fit_score, 0) DESC, p.created_at DESC
-        """)
-        
-        for row in cursor.fetchall():
-            created = datetime.fromisoformat(row['created_at'].replace('Z', '+00:00')).date()
-            days_ago = (today - created).days
-            
-            signal = {
-                "title": row['title'],
-                "url": row['url'],
-                "source": row['source'],
-                "fit_score": row['fit_score'] or 0,
-                "urgency_score": row['urgency_score'] or 0,
-                "use_case": row['use_case'],
-                "reasoning": row['reasoning'],
-                "weight": get_decay_weight(days_ago)
-            }
-            
-            if days_ago == 0:
-                periods["today"].append(signal)
-            elif days_ago == 1:
-                periods["yesterday"].append(signal)
-            elif days_ago <= 7:
-                periods["this_week"].append(signal)
-            elif days_ago <= 14:
-                periods["last_week"].append(signal)
-            else:
-                periods["older"].append(signal)
-    except sqlite3.OperationalError:
-        pass  # Table doesn't exist yet
+    init_db()
+    today = datetime.now().date()
+    for row in get_daily_post_counts(days):
+        period = counts[get_period(row["day"], today)]
+        for key in period:
+            period[key] += row[key]
     
-    conn.close()
-    return periods
+    return counts
+
+def get_unanalyzed_signals(days: int = 14, limit: int = 20) -> list:
+    """Newest posts from the last ``days`` that haven't been scored yet"""
+    init_db()
+    return [{"title": post.title, "url": post.url, "source": post.source,
+             "created_at": str(post.created_at)}
+            for post in get_recent_unanalyzed(days, limit)]
 
 def get_follow_ups(db_path: Path) -> list:
     """Get pending follow-ups from GTM system"""
@@ -190,15 +178,22 @@ def generate_briefing_with_ai(context: dict) -> str:
         # Fallback to template-based briefing
         return generate_template_briefing(context)
     
+    counts = context['signal_counts']
+    unanalyzed = sum(c['posts'] - c['analyzed'] for c in counts.values())
+    
     prompt = f"""Generate a concise daily GTM briefing for Expanso based on this context:
 
 ## Signals Found
-Today: {len(context['signals']['today'])} new signals
-Yesterday: {len(context['signals']['yesterday'])} signals
-This Week: {len(context['signals']['this_week'])} signals
+Today: {counts['today']['posts']} new posts, {counts['today']['analyzed']} analyzed, {counts['today']['high_fit']} high fit
+Yesterday: {counts['yesterday']['posts']} posts, {counts['yesterday']['analyzed']} analyzed, {counts['yesterday']['high_fit']} high fit
+This Week: {counts['this_week']['posts']} posts, {counts['this_week']['analyzed']} analyzed, {counts['this_week']['high_fit']} high fit
+
+Top signals (by lead rank):
+{json.dumps([s.to_dict() for s in context['signals']['today'][:5]], indent=2)}
 
-Top signals (by fit score):
-{json.dumps(context['signals']['today'][:5], indent=2)}
+## Not Yet Analyzed
+{unanalyzed} posts from the last 14 days haven't been scored yet. Newest:
+{json.dumps(context['unanalyzed'][:5], indent=2)}
 
 ## Follow-ups Due
 {json.dumps(context['follow_ups'][:5], indent=2)}
@@ -235,8 +230,9 @@ def call_anthropic(prompt: str) -> str:
     
     api_key = os.environ.get("ANTHROPIC_API_KEY")
     
+    model = "claude-3-haiku-20240307"
     data = json.dumps({
-        "model": "claude-3-haiku-20240307",
+        "model": model,
         "max_tokens": 1024,
         "messages": [{"role": "user", "content": prompt}]
     }).encode()
@@ -252,9 +248,17 @@ def call_anthropic(prompt: str) -> str:
     )
     
     try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            result = json.loads(resp.read().decode())
-            return result["content"][0]["text"]
+        with telemetry.track("anthropic", model, purpose="briefing") as call:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                result = json.loads(resp.read().decode())
+            usage = result.get("usage") or {}
+            call.usage = {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+                "cache_read_tokens": usage.get("cache_read_input_tokens", 0) or 0,
+                "cache_write_tokens": usage.get("cache_creation_input_tokens", 0) or 0,
+            }
+        return result["content"][0]["text"]
     except Exception as e:
         return f"Error generating AI briefing: {e}"
 
@@ -264,8 +268,9 @@ def call_openai(prompt: str) -> str:
     
     api_key = os.environ.get("OPENAI_API_KEY")
     
+    model = "gpt-4o-mini"
     data = json.dumps({
-        "model": "gpt-4o-mini",
+        "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "max_tokens": 1024
     }).encode()
@@ -280,9 +285,17 @@ def call_openai(prompt: str) -> str:
     )
     
     try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            result = json.loads(resp.read().decode())
-            return result["choices"][0]["message"]["content"]
+        with telemetry.track("openai", model, purpose="briefing") as call:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                result = json.loads(resp.read().decode())
+            usage = result.get("usage") or {}
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+            call.usage = {
+                "input_tokens": usage.get("prompt_tokens", 0) - cached,
+                "output_tokens": usage.get("completion_tokens", 0),
+                "cache_read_tokens": cached,
+            }
+        return result["choices"][0]["message"]["content"]
     except Exception as e:
         return f"Error generating AI briefing: {e}"
 
@@ -291,6 +304,7 @@ def generate_template_briefing(context: dict) -> str:
     today = datetime.now().strftime("%B %d, %Y")
     
     signals = context['signals']
+    counts = context['signal_counts']
     top_today = signals['today'][:3]
     
     briefing = f"""# Daily GTM Briefing
@@ -298,7 +312,7 @@ def generate_template_briefing(context: dict) -> str:
 
 ## 🎯 Top Priorities Today
 
-1. **Review {len(signals['today'])} new signals** from overnight crawl
+1. **Review {counts['today']['posts']} new signals** from overnight crawl
 2. **Follow up** on {len(context['follow_ups'])} pending items
 3. **Post in r/dataengineering** about Snowflake cost reduction
 
@@ -312,6 +326,12 @@ def generate_template_briefing(context: dict) -> str:
         briefing += f"   - Use case: {signal.get('use_case', 'Unknown')}\n"
         briefing += f"   - URL: {signal.get('url', 'N/A')}\n\n"
     
+    if context['unanalyzed']:
+        briefing += "## ⏳ Not Yet Analyzed\n\n"
+        for post in context['unanalyzed'][:5]:
+            briefing += f"- {(post['title'] or 'Untitled')[:60]} ({post['source']}) {post['url'] or ''}\n"
+        briefing += "\n"
+    
     if context['follow_ups']:
         briefing += "## 🔄 Follow-ups Due\n\n"
         for fu in context['follow_ups'][:3]:
@@ -327,7 +347,7 @@ def generate_template_briefing(context: dict) -> str:
 
 ## 📈 Metric to Watch
 
-Total signals with fit score > 7: {len([s for s in signals['today'] + signals['yesterday'] if s.get('fit_score', 0) >= 7])}
+Total signals with fit score > 7: {counts['today']['high_fit'] + counts['yesterday']['high_fit']}
 
 ---
 *Generated by semantic-gtm daily briefing system*
@@ -358,7 +378,9 @@ def main():
     
     # Gather context
     context = {
-        "signals": get_signals_by_period(SEMANTIC_GTM_DIR / "data" / "gtm.db"),
+        "signals": get_signals_by_period(),
+        "signal_counts": get_signal_counts(),
+        "unanalyzed": get_unanalyzed_signals(),
         "follow_ups": get_follow_ups(GTM_SYSTEM_DIR / "data" / "gtm.db"),
         "pipeline": get_pipeline_status(GTM_SYSTEM_DIR / "data" / "gtm.db"),
         "previous_briefings": get_previous_briefings(7)
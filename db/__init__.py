@@ -1,30 +1,99 @@
 """Database module for GTM Semantic Crawler"""
 import sqlite3
+import hashlib
 import json
+import queue
+import zlib
 from pathlib import Path
 from datetime import datetime
 from contextlib import contextmanager
 
-from config.settings import DB_PATH
+from config.settings import (
+    DB_PATH, ANALYSIS_FAILURE_LIMIT, ANALYSIS_RETRY_BASE_MINUTES, ANALYSIS_RETRY_MAX_MINUTES,
+    ANALYSIS_MIN_CONTENT_CHARS,
+)
+from .records import Post, Analysis, Opportunity
+from .ranking import ENGAGEMENT_KEYS, compute_rank_score, refresh_rank_scores
+from .cache import QueryCache, bump_generation
+
+# Columns added after a table was first created. CREATE TABLE IF NOT EXISTS
+# won't add them to an existing database, so init_db() does.
+COLUMN_MIGRATIONS = [
+    ("analysis", "rank_score", "REAL NOT NULL DEFAULT 0"),
+    ("analysis", "prompt_version", "TEXT"),
+    ("categories", "last_seen", "TIMESTAMP"),
+    ("categories", "centroid", "BLOB"),
+    ("categories", "weight", "REAL DEFAULT 0"),
+    ("post_categories", "similarity", "REAL"),
+    ("digests", "uid", "TEXT"),
+    ("sync_peers", "acked_seq", "INTEGER NOT NULL DEFAULT 0"),
+    ("analysis_batches", "idempotency_key", "TEXT"),
+]
+
+def _migrate_columns(conn):
+    """Add missing columns to tables that already exist"""
+    for table, column, ddl in COLUMN_MIGRATIONS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if existing and column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+def _content_hash(text: str) -> str:
+    """Short SHA-256 of a text, registered for schema.sql's legacy digest uids"""
+    return hashlib.sha256((text or "").encode()).hexdigest()[:16]
+
+def schema_version(schema: str) -> int:
+    """Checksum of schema.sql and COLUMN_MIGRATIONS, kept in PRAGMA user_version"""
+    return zlib.crc32(f"{schema}\n{COLUMN_MIGRATIONS!r}".encode()) & 0x7FFFFFFF
 
 def init_db():
-    """Initialize database with schema"""
+    """Initialize database with schema
+    
+    Every command calls this, so the schema script only runs when
+    ``PRAGMA user_version`` doesn't match the current schema version.
+    """
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     
     schema_path = Path(__file__).parent / "schema.sql"
     with open(schema_path) as f:
         schema = f.read()
+    version = schema_version(schema)
     
     with get_connection() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == version:
+            return DB_PATH
+        # Before the script, so its indexes can reference new columns
+        _migrate_columns(conn)
+        conn.create_function("content_hash", 1, _content_hash, deterministic=True)
         conn.executescript(schema)
+        conn.execute(f"PRAGMA user_version = {version}")
     
     return DB_PATH
 
+# (database path, idle connections) once enable_connection_pool() is called
+_pool = None
+
+def enable_connection_pool(cache_mb: int = 64):
+    """Reuse connections instead of opening one per call
+    
+    For long-running processes (``gtm serve``): a pooled connection keeps its
+    prepared statements and a ``cache_mb`` page cache warm between calls.
+    """
+    global _pool
+    _pool = (DB_PATH, queue.LifoQueue(), cache_mb)
+
 @contextmanager
 def get_connection():
     """Context manager for database connections"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    pool = _pool if _pool is not None and _pool[0] == DB_PATH else None
+    try:
+        conn = pool[1].get_nowait() if pool else None
+    except queue.Empty:
+        conn = None
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=pool is None)
+        conn.row_factory = sqlite3.Row
+        if pool:
+            conn.execute(f"PRAGMA cache_size = -{pool[2] * 1024}")
     try:
         yield conn
         conn.commit()
@@ -32,12 +101,22 @@ def get_connection():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        if pool:
+            pool[1].put(conn)
+        else:
+            conn.close()
+
+# Results of the read queries below, until the next write (db.cache)
+query_cache = QueryCache(get_connection, lambda: DB_PATH)
 
 def insert_post(source: str, source_id: str, title: str = None, body: str = None,
                 url: str = None, author: str = None, created_at: datetime = None,
-                metadata: dict = None) -> str:
-    """Insert a post, return its ID. Skips if already exists."""
+                metadata: dict = None, tags: tuple = None) -> str:
+    """Insert a post, return its ID. Skips if already exists.
+    
+    ``tags`` is (tagger version, [(category, tag, keyword), ...]) from
+    crawlers.tagger, stored in the same transaction.
+    """
     post_id = f"{source}_{source_id}"
     
     with get_connection() as conn:
@@ -49,65 +128,416 @@ def insert_post(source: str, source_id: str, title: str = None, body: str = None
                 post_id, source, source_id, title, body, url, author,
                 created_at, json.dumps(metadata) if metadata else None
             ))
+            if tags is not None:
+                _insert_post_tags(conn, post_id, *tags)
             return post_id
         except sqlite3.IntegrityError:
-            # Already exists
+            # Already exists - refresh engagement so the lead ranking sees it
+            if metadata:
+                _update_engagement(conn, post_id, metadata)
             return None
 
+def _insert_post_tags(conn, post_id: str, version: str, tags: list):
+    conn.execute("DELETE FROM post_tags WHERE post_id = ?", (post_id,))
+    conn.executemany("""
+        INSERT OR IGNORE INTO post_tags (post_id, category, tag, keyword) VALUES (?, ?, ?, ?)
+    """, [(post_id, *tag) for tag in tags])
+    conn.execute("""
+        INSERT OR REPLACE INTO post_tag_versions (post_id, version) VALUES (?, ?)
+    """, (post_id, version))
+
+def replace_post_tags(items: list) -> int:
+    """Store (post_id, tagger version, tags) for existing posts in one transaction"""
+    with get_connection() as conn:
+        for post_id, version, tags in items:
+            _insert_post_tags(conn, post_id, version, tags)
+        bump_generation(conn)
+    return len(items)
+
+def _update_engagement(conn, post_id: str, metadata: dict):
+    """Merge fresh engagement counts into a stored post and re-rank it"""
+    row = conn.execute("SELECT metadata FROM posts WHERE id = ?", (post_id,)).fetchone()
+    if row is None:
+        return
+    
+    stored = json.loads(row[0]) if row[0] else {}
+    fresh = {k: metadata[k] for k in ENGAGEMENT_KEYS if metadata.get(k) is not None}
+    if all(stored.get(k) == v for k, v in fresh.items()):
+        return
+    
+    stored.update(fresh)
+    conn.execute("UPDATE posts SET metadata = ? WHERE id = ?", (json.dumps(stored), post_id))
+    refresh_rank_scores(conn, post_ids=[post_id])
+
 def insert_analysis(post_id: str, fit_score: int, urgency_score: int,
                     use_case: str, reasoning: str, problem_summary: str,
-                    model_used: str) -> int:
-    """Insert analysis results for a post"""
+                    model_used: str, profiles: dict = None, prompt_version: str = None) -> int:
+    """Insert analysis results for a post
+    
+    ``profiles`` maps positioning profile names to their fit/urgency/use_case
+    scores (``profile_scores``). ``prompt_version`` identifies the prompt
+    templates that produced the scores.
+    """
     with get_connection() as conn:
         try:
-            cursor = conn.execute("""
-                INSERT INTO analysis (post_id, fit_score, urgency_score, use_case, 
-                                      reasoning, problem_summary, model_used)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (post_id, fit_score, urgency_score, use_case, reasoning, 
-                  problem_summary, model_used))
-            return cursor.lastrowid
+            return _insert_analysis_row(conn, post_id, fit_score, urgency_score, use_case,
+                                        reasoning, problem_summary, model_used, profiles,
+                                        prompt_version)
         except sqlite3.IntegrityError:
             return None
 
+def insert_analyses(rows: list) -> int:
+    """Insert many analysis results in one transaction, return how many were new
+    
+    Each row is a dict with the keyword arguments of ``insert_analysis``.
+    Rows for posts that already have an analysis are skipped.
+    """
+    with get_connection() as conn:
+        return _insert_analyses(conn, rows)
+
+def _insert_analyses(conn, rows: list) -> int:
+    inserted = 0
+    for row in rows:
+        try:
+            _insert_analysis_row(conn, **row)
+            inserted += 1
+        except sqlite3.IntegrityError:
+            pass
+    return inserted
+
+def _rank_score(conn, post_id: str, fit_score: int, urgency_score: int) -> float:
+    post = conn.execute(
+        "SELECT metadata, created_at FROM posts WHERE id = ?", (post_id,)
+    ).fetchone()
+    return compute_rank_score(
+        fit_score, urgency_score,
+        post["metadata"] if post else None,
+        post["created_at"] if post else None,
+    )
+
+def _insert_profile_scores(conn, post_id: str, profiles: dict):
+    if profiles:
+        conn.executemany("""
+            INSERT OR REPLACE INTO profile_scores (post_id, profile, fit_score, urgency_score, use_case)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(post_id, name, s["fit_score"], s["urgency_score"], s["use_case"])
+              for name, s in profiles.items()])
+
+def _insert_analysis_row(conn, post_id: str, fit_score: int, urgency_score: int,
+                         use_case: str, reasoning: str, problem_summary: str,
+                         model_used: str, profiles: dict = None, prompt_version: str = None) -> int:
+    rank_score = _rank_score(conn, post_id, fit_score, urgency_score)
+    cursor = conn.execute("""
+        INSERT INTO analysis (post_id, fit_score, urgency_score, use_case, 
+                              reasoning, problem_summary, model_used, rank_score, prompt_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (post_id, fit_score, urgency_score, use_case, reasoning, 
+          problem_summary, model_used, rank_score, prompt_version))
+    _insert_profile_scores(conn, post_id, profiles)
+    conn.execute("DELETE FROM analysis_failures WHERE post_id = ?", (post_id,))
+    return cursor.lastrowid
+
+def replace_analyses(rows: list) -> int:
+    """Store new analyses for posts, keeping any previous one in ``analysis_history``
+    
+    Rows are ``insert_analysis`` keyword arguments. The ``analysis`` row is
+    updated in place, so it stays the post's current analysis. Returns how
+    many earlier analyses were superseded.
+    """
+    superseded = 0
+    with get_connection() as conn:
+        for row in rows:
+            archived = conn.execute("""
+                INSERT INTO analysis_history (post_id, fit_score, urgency_score, use_case, reasoning,
+                                              problem_summary, model_used, prompt_version, analyzed_at)
+                SELECT post_id, fit_score, urgency_score, use_case, reasoning,
+                       problem_summary, model_used, prompt_version, analyzed_at
+                FROM analysis WHERE post_id = ?
+            """, (row["post_id"],)).rowcount
+            if not archived:
+                _insert_analysis_row(conn, **row)
+                continue
+            superseded += 1
+            conn.execute("""
+                UPDATE analysis
+                SET fit_score = ?, urgency_score = ?, use_case = ?, reasoning = ?,
+                    problem_summary = ?, model_used = ?, prompt_version = ?, rank_score = ?,
+                    analyzed_at = CURRENT_TIMESTAMP
+                WHERE post_id = ?
+            """, (row["fit_score"], row["urgency_score"], row["use_case"], row["reasoning"],
+                  row["problem_summary"], row["model_used"], row.get("prompt_version"),
+                  _rank_score(conn, row["post_id"], row["fit_score"], row["urgency_score"]),
+                  row["post_id"]))
+            conn.execute("DELETE FROM profile_scores WHERE post_id = ?", (row["post_id"],))
+            _insert_profile_scores(conn, row["post_id"], row.get("profiles"))
+    return superseded
+
+def get_analysis_versions() -> list:
+    """Current analyses grouped by model and prompt version, most recent first"""
+    with get_connection() as conn:
+        return [dict(row) for row in conn.execute("""
+            SELECT model_used, prompt_version, COUNT(*) AS analyzed,
+                   SUM(fit_score >= 7) AS high_fit, AVG(fit_score) AS avg_fit,
+                   MIN(analyzed_at) AS first_analyzed, MAX(analyzed_at) AS last_analyzed
+            FROM analysis
+            GROUP BY model_used, prompt_version
+            ORDER BY last_analyzed DESC
+        """).fetchall()]
+
+def record_analysis_failures(failures: list) -> int:
+    """Record failed analyses as (post_id, error) pairs, return how many are now dead
+    
+    Each failure pushes the next retry back exponentially; after
+    ANALYSIS_FAILURE_LIMIT failures the post is dead-lettered.
+    """
+    with get_connection() as conn:
+        return _record_failures(conn, failures)
+
+def _record_failures(conn, failures: list) -> int:
+    dead = 0
+    for post_id, error in failures:
+        row = conn.execute(
+            "SELECT attempts FROM analysis_failures WHERE post_id = ?", (post_id,)
+        ).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        status = "dead" if attempts >= ANALYSIS_FAILURE_LIMIT else "retrying"
+        backoff = min(ANALYSIS_RETRY_BASE_MINUTES * 2 ** (attempts - 1), ANALYSIS_RETRY_MAX_MINUTES)
+        conn.execute("""
+            INSERT INTO analysis_failures (post_id, attempts, status, last_error, next_retry_at)
+            VALUES (?, ?, ?, ?, datetime('now', ?))
+            ON CONFLICT(post_id) DO UPDATE SET
+                attempts = excluded.attempts,
+                status = excluded.status,
+                last_error = excluded.last_error,
+                last_failed_at = CURRENT_TIMESTAMP,
+                next_retry_at = excluded.next_retry_at
+        """, (post_id, attempts, status, error, f"+{backoff} minutes"))
+        dead += status == "dead"
+    return dead
+
+def complete_batch(batch_id: int, rows: list, failures: list) -> int:
+    """Insert a finished batch job's analyses and failures and mark it ingested
+
+    All in one transaction, so a crash part way leaves the job to be
+    ingested again from scratch rather than counting its failures twice.
+    Returns how many analyses were new.
+    """
+    with get_connection() as conn:
+        inserted = _insert_analyses(conn, rows)
+        _record_failures(conn, failures)
+        conn.execute("""
+            UPDATE analysis_batches SET status = 'ingested', completed_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (batch_id,))
+    return inserted
+
+def record_analysis_failure(post_id: str, error: str) -> bool:
+    """Record one failed analysis, return True if the post is now dead-lettered"""
+    return record_analysis_failures([(post_id, error)]) > 0
+
+def get_analysis_failures(status: str = None, limit: int = 50) -> list:
+    """Failed analyses, most recent first"""
+    query = """
+        SELECT f.post_id, p.source, p.title, p.url, f.attempts, f.status, f.last_error,
+               f.first_failed_at, f.last_failed_at, f.next_retry_at
+        FROM analysis_failures f
+        LEFT JOIN posts p ON p.id = f.post_id
+    """
+    params = []
+    if status:
+        query += " WHERE f.status = ?"
+        params.append(status)
+    query += " ORDER BY f.last_failed_at DESC LIMIT ?"
+    params.append(limit)
+    
+    with get_connection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+def retry_analysis_failures(post_ids: list = None) -> int:
+    """Clear failure records so posts are analyzed again (all dead ones by default)"""
+    with get_connection() as conn:
+        if post_ids:
+            placeholders = ",".join("?" * len(post_ids))
+            return conn.execute(
+                f"DELETE FROM analysis_failures WHERE post_id IN ({placeholders})", post_ids
+            ).rowcount
+        return conn.execute("DELETE FROM analysis_failures WHERE status = 'dead'").rowcount
+
+def refresh_rankings(full: bool = False) -> int:
+    """Recompute time-decayed lead rank scores (run daily)"""
+    with get_connection() as conn:
+        return refresh_rank_scores(conn, full=full)
+
+def fetch_records(conn, record_type, query: str, params=()) -> list:
+    """Run a query and build ``record_type`` instances straight from the cursor"""
+    cursor = conn.execute(query, params)
+    cursor.row_factory = record_type.row_factory
+    return cursor.fetchall()
+
 def get_unanalyzed_posts(limit: int = 100) -> list:
-    """Get posts that haven't been analyzed yet"""
+    """Get posts that haven't been analyzed yet, highest prior score first
+    
+    The prior (``post_priors``, see analysis.priority) puts likely leads
+    ahead of the rest; posts without one come last, newest first. Posts
+    waiting in an open provider batch job are left out so they aren't paid
+    for twice, and so are posts too short to analyze (see
+    analysis.has_enough_content), posts the local pre-filter rejected, posts
+    whose last failed analysis is still backing off and dead-lettered posts.
+    """
     with get_connection() as conn:
-        rows = conn.execute("""
-            SELECT p.* FROM posts p
+        return fetch_records(conn, Post, f"""
+            SELECT {Post.columns("p")} FROM posts p
             LEFT JOIN analysis a ON p.id = a.post_id
+            LEFT JOIN post_priors pp ON pp.post_id = p.id
             WHERE a.id IS NULL
-            ORDER BY p.created_at DESC
+            AND LENGTH(TRIM(COALESCE(p.title, '') || ' ' || COALESCE(p.body, ''),
+                            ' ' || char(9, 10, 13))) >= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM analysis_batch_items bi
+                JOIN analysis_batches b ON b.id = bi.batch_id
+                WHERE bi.post_id = p.id AND b.status IN ('submitting', 'submitted')
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM gate_decisions g
+                WHERE g.post_id = p.id AND g.passed = 0 AND g.sampled = 0
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM analysis_failures f
+                WHERE f.post_id = p.id
+                AND (f.status = 'dead' OR f.next_retry_at > datetime('now'))
+            )
+            ORDER BY pp.score IS NULL, pp.score DESC, p.created_at DESC, p.id
             LIMIT ?
-        """, (limit,)).fetchall()
-        return [dict(row) for row in rows]
+        """, (ANALYSIS_MIN_CONTENT_CHARS, limit))
+
+def get_analysis(post_id: str):
+    """Get the analysis record for a post, or None"""
+    with get_connection() as conn:
+        rows = fetch_records(conn, Analysis, f"""
+            SELECT {Analysis.columns()} FROM analysis WHERE post_id = ?
+        """, (post_id,))
+        return rows[0] if rows else None
 
+@query_cache.cached(Opportunity)
 def get_opportunities(min_fit: int = 5, min_urgency: int = 0, 
                       use_case: str = None, days: int = 7,
-                      limit: int = 50) -> list:
-    """Query opportunities with filters"""
-    query = """
-        SELECT p.*, a.fit_score, a.urgency_score, a.use_case, 
-               a.reasoning, a.problem_summary, a.analyzed_at
-        FROM posts p
-        JOIN analysis a ON p.id = a.post_id
-        WHERE a.fit_score >= ?
-        AND a.urgency_score >= ?
+                      limit: int = 50, sort: str = "fit", profile: str = None,
+                      post_ids: list = None, competitor: str = None,
+                      signal: str = None) -> list:
+    """Query opportunities with filters
+    
+    ``sort="rank"`` orders by the precomputed rank_score (fit, urgency,
+    engagement and recency), walking its index and stopping at ``limit``.
+    With ``profile``, fit, urgency and use case are that positioning
+    profile's scores (``profile_scores``) and ``sort="rank"`` isn't used.
+    ``post_ids`` restricts the results to those posts. ``competitor`` and
+    ``signal`` keep posts tagged (``post_tags``) with that competitor brand or
+    buying signal, given as a keyword ("Splunk") or its group ("observability").
+    """
+    if profile:
+        query = f"""
+            SELECT {Post.columns("p")}, s.fit_score, s.urgency_score, s.use_case,
+                   {Opportunity.columns("a", ("reasoning", "problem_summary", "analyzed_at", "rank_score"))}
+            FROM profile_scores s
+            JOIN posts p ON p.id = s.post_id
+            JOIN analysis a ON a.post_id = s.post_id
+            WHERE s.profile = ?
+            AND s.fit_score >= ?
+        """
+        params = [profile, min_fit]
+        scores = "s"
+    else:
+        # Pin the rank index: the planner would otherwise pick a filter index
+        # and sort every match
+        analysis_table = "analysis a INDEXED BY idx_analysis_rank" if sort == "rank" else "analysis a"
+        query = f"""
+            SELECT {Opportunity.select()}
+            FROM posts p
+            JOIN {analysis_table} ON p.id = a.post_id
+            WHERE a.fit_score >= ?
+        """
+        params = [min_fit]
+        scores = "a"
+    query += f"""
+        AND {scores}.urgency_score >= ?
         AND p.created_at >= datetime('now', ?)
     """
-    params = [min_fit, min_urgency, f'-{days} days']
+    params += [min_urgency, f'-{days} days']
     
     if use_case:
-        query += " AND a.use_case = ?"
+        query += f" AND {scores}.use_case = ?"
         params.append(use_case)
+
+    for category, value in (("competitor_brands", competitor), ("buying_signals", signal)):
+        if value:
+            query += """
+                AND p.id IN (SELECT post_id FROM post_tags WHERE category = ? AND keyword = ?
+                             UNION SELECT post_id FROM post_tags WHERE category = ? AND tag = ?)
+            """
+            params += [category, value, category, value]
+
+    if post_ids is not None:
+        query += f" AND p.id IN ({','.join('?' * len(post_ids))})"
+        params += list(post_ids)
     
-    query += " ORDER BY a.fit_score DESC, a.urgency_score DESC LIMIT ?"
+    if sort == "rank" and not profile:
+        query += " ORDER BY a.rank_score DESC LIMIT ?"
+    else:
+        query += f" ORDER BY {scores}.fit_score DESC, {scores}.urgency_score DESC LIMIT ?"
     params.append(limit)
     
     with get_connection() as conn:
-        rows = conn.execute(query, params).fetchall()
+        return fetch_records(conn, Opportunity, query, params)
+
+def get_new_opportunities(conn, after_id: int, min_fit: int = 5, min_urgency: int = 0,
+                          use_case: str = None, competitor: str = None,
+                          signal: str = None) -> tuple:
+    """(watermark, matching opportunities analyzed after ``after_id``) for ``gtm follow``
+    
+    ``after_id`` is an ``analysis.id`` watermark; pass the returned one to
+    the next call. Only new analyses count: a re-score updates its row in
+    place and isn't reported again. Runs on the caller's connection, which
+    stays open between calls.
+    """
+    watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM analysis").fetchone()[0]
+    if watermark <= after_id:
+        return after_id, []
+    query = f"""
+        SELECT {Opportunity.select()}
+        FROM analysis a
+        JOIN posts p ON p.id = a.post_id
+        WHERE a.id > ? AND a.id <= ?
+        AND a.fit_score >= ? AND a.urgency_score >= ?
+    """
+    params = [after_id, watermark, min_fit, min_urgency]
+    if use_case:
+        query += " AND a.use_case = ?"
+        params.append(use_case)
+    for category, value in (("competitor_brands", competitor), ("buying_signals", signal)):
+        if value:
+            query += """
+                AND p.id IN (SELECT post_id FROM post_tags WHERE category = ? AND keyword = ?
+                             UNION SELECT post_id FROM post_tags WHERE category = ? AND tag = ?)
+            """
+            params += [category, value, category, value]
+    query += " ORDER BY a.id"
+    return watermark, fetch_records(conn, Opportunity, query, params)
+
+def get_profile_summary(days: int = 30) -> list:
+    """Analyzed posts, high-fit count and mean fit per positioning profile"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT 'main' AS profile, COUNT(*) AS analyzed,
+                   COALESCE(SUM(fit_score >= 7), 0) AS high_fit, AVG(fit_score) AS avg_fit
+            FROM analysis WHERE analyzed_at >= datetime('now', ?)
+            UNION ALL
+            SELECT profile, COUNT(*), COALESCE(SUM(fit_score >= 7), 0), AVG(fit_score)
+            FROM profile_scores WHERE analyzed_at >= datetime('now', ?)
+            GROUP BY profile
+        """, (f'-{days} days', f'-{days} days')).fetchall()
         return [dict(row) for row in rows]
 
+@query_cache.cached()
 def get_category_trends(days: int = 30) -> list:
     """Get category trends over time"""
     with get_connection() as conn:
@@ -122,6 +552,35 @@ def get_category_trends(days: int = 30) -> list:
         """, (f'-{days} days',)).fetchall()
         return [dict(row) for row in rows]
 
+@query_cache.cached()
+def get_daily_post_counts(days: int = 14) -> list:
+    """Posts, analyzed posts and high-fit leads per day created, newest day first"""
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT date(p.created_at) AS day, COUNT(*) AS posts,
+                   COUNT(a.post_id) AS analyzed,
+                   COALESCE(SUM(a.fit_score >= 7), 0) AS high_fit
+            FROM posts p
+            LEFT JOIN analysis a ON a.post_id = p.id
+            WHERE p.created_at >= datetime('now', ?)
+            GROUP BY day
+            ORDER BY day DESC
+        """, (f'-{days} days',)).fetchall()
+        return [dict(row) for row in rows]
+
+@query_cache.cached(Post)
+def get_recent_unanalyzed(days: int = 14, limit: int = 20) -> list:
+    """Newest posts from the last ``days`` that have no analysis yet"""
+    with get_connection() as conn:
+        return fetch_records(conn, Post, f"""
+            SELECT {Post.columns("p")} FROM posts p
+            WHERE p.created_at >= datetime('now', ?)
+            AND NOT EXISTS (SELECT 1 FROM analysis a WHERE a.post_id = p.id)
+            ORDER BY p.created_at DESC
+            LIMIT ?
+        """, (f'-{days} days', limit))
+
+@query_cache.cached()
 def get_stats() -> dict:
     """Get overall statistics"""
     with get_connection() as conn:
@@ -0,0 +1,176 @@
+"""Query result cache invalidated by writes
+
+``get_stats``, ``get_category_trends`` and ``get_opportunities`` re-run the
+same aggregates for the same arguments many times between crawls: the
+digest, the CLI, the briefing, ``gtm serve`` clients. Their results are
+cached per function and arguments, together with the database's write
+generation at the time:
+
+- the newest ``changes.seq`` (every post, analysis and digest write is
+  logged there by triggers)
+- ``write_generation.value``, bumped by writes the changelog skips on
+  purpose (rank refreshes, re-tagging)
+
+A cached result is used only while the generation is unchanged and it is
+younger than ``QUERY_CACHE_TTL`` (the queries have "last N days" windows
+that move without any write). Results are kept in process, LRU-bounded,
+and with ``QUERY_CACHE_DISK`` also in a side database, so one-shot CLI
+runs share them. They're stored as JSON, never pickled: the side database
+is a shared file, and loading it must not be able to run code.
+"""
+import functools
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config.settings import (
+    QUERY_CACHE_ENABLED, QUERY_CACHE_TTL, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_DISK,
+    QUERY_CACHE_PATH,
+)
+
+def bump_generation(conn):
+    """Invalidate cached results after a write that isn't in the changes log"""
+    conn.execute("UPDATE write_generation SET value = value + 1 WHERE id = 1")
+
+def current_generation(conn) -> str:
+    row = conn.execute("""
+        SELECT (SELECT COALESCE(MAX(seq), 0) FROM changes),
+               (SELECT COALESCE(MAX(value), 0) FROM write_generation)
+    """).fetchone()
+    return f"{row[0]}.{row[1]}"
+
+def encode(result) -> str:
+    """JSON text of a query result (records become dicts)"""
+    if isinstance(result, list):
+        result = [r.to_dict() if hasattr(r, "to_dict") else r for r in result]
+    return json.dumps(result, default=str)
+
+def decode(value: str, record_type=None):
+    """Inverse of ``encode``"""
+    result = json.loads(value)
+    if record_type is not None:
+        return [record_type(**row) for row in result]
+    return result
+
+class QueryCache:
+    """Results of decorated read functions, keyed by arguments and write generation"""
+
+    def __init__(self, connect, db_path: callable):
+        self.connect = connect
+        self.db_path = db_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _count(self, name: str, outcome: str):
+        counts = self.metrics.setdefault(name, {"hits": 0, "disk_hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def _disk(self):
+        conn = sqlite3.connect(QUERY_CACHE_PATH, timeout=1)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_results (
+                key TEXT PRIMARY KEY, generation TEXT, stored_at REAL, value TEXT
+            )
+        """)
+        return conn
+
+    def _load(self, key: str, generation: str, now: float):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == generation and now - entry[1] < QUERY_CACHE_TTL:
+                self.entries.move_to_end(key)
+                return entry[2], "hits"
+        if QUERY_CACHE_DISK:
+            try:
+                with self._disk() as disk:
+                    row = disk.execute("""
+                        SELECT stored_at, value FROM query_results
+                        WHERE key = ? AND generation = ? AND stored_at > ?
+                    """, (key, generation, now - QUERY_CACHE_TTL)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row:
+                self._remember(key, generation, row[0], row[1])
+                return row[1], "disk_hits"
+        return None, "misses"
+
+    def _remember(self, key: str, generation: str, stored_at: float, value: str):
+        with self.lock:
+            self.entries[key] = (generation, stored_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > QUERY_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def _store(self, key: str, generation: str, now: float, value: str):
+        self._remember(key, generation, now, value)
+        if QUERY_CACHE_DISK:
+            try:
+                with self._disk() as disk:
+                    # Anything from an older generation can't be used again
+                    disk.execute("DELETE FROM query_results WHERE generation != ? OR stored_at <= ?",
+                                 (generation, now - QUERY_CACHE_TTL))
+                    disk.execute("INSERT OR REPLACE INTO query_results VALUES (?, ?, ?, ?)",
+                                 (key, generation, now, value))
+            except sqlite3.Error:
+                pass  # the disk copy is best effort; another process may hold the lock
+
+    def cached(self, record_type=None):
+        """Decorator; each call gets its own copy of the result
+        
+        Results must be JSON-ready (rows, dicts, numbers) or, with
+        ``record_type``, a list of those records.
+        """
+        def decorate(function):
+            name = function.__name__
+            signature = inspect.signature(function)
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not QUERY_CACHE_ENABLED:
+                    return function(*args, **kwargs)
+                # Same key however the arguments were passed
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = f"{self.db_path()}:{name}:{sorted(bound.arguments.items())!r}"
+                now = time.time()
+                with self.connect() as conn:
+                    generation = current_generation(conn)
+                value, outcome = self._load(key, generation, now)
+                if value is not None:
+                    try:
+                        result = decode(value, record_type)
+                    except (ValueError, TypeError):
+                        value, outcome = None, "misses"  # written by an older version
+                self._count(name, outcome)
+                if value is not None:
+                    return result
+                result = function(*args, **kwargs)
+                self._store(key, generation, now, encode(result))
+                return result
+
+            wrapper.uncached = function
+            return wrapper
+        return decorate
+
+    def clear(self) -> int:
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        if QUERY_CACHE_DISK and QUERY_CACHE_PATH.exists():
+            with self._disk() as disk:
+                count += disk.execute("DELETE FROM query_results").rowcount
+        return count
+
+    def stats(self) -> dict:
+        """Per-function hit/miss counts of this process and the entries held"""
+        with self.lock:
+            functions = {name: dict(counts) for name, counts in self.metrics.items()}
+            entries = len(self.entries)
+        for counts in functions.values():
+            total = sum(counts.values())
+            counts["hit_rate"] = round((counts["hits"] + counts["disk_hits"]) / total, 3) if total else None
+        return {"entries": entries, "disk": QUERY_CACHE_DISK, "functions": functions}
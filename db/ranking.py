@@ -0,0 +1,105 @@
+"""Composite lead ranking score stored in ``analysis.rank_score``
+
+The score blends fit, urgency and engagement (0-10 each) and multiplies by
+the same recency decay the daily briefing uses. It's written when an
+analysis is inserted or a post's engagement changes, and
+``refresh_rank_scores`` recomputes decay for recent posts once a day, so
+"top N leads right now" is a read of ``idx_analysis_rank``.
+"""
+import json
+import math
+from datetime import datetime, date
+
+from config.settings import RANK_WEIGHTS, RANK_ENGAGEMENT_CAP
+from .cache import bump_generation
+
+# Metadata fields that change as a post gets votes and replies
+ENGAGEMENT_KEYS = ("points", "score", "num_comments", "upvote_ratio")
+
+# Decay is a step function that stops changing after this many days
+DECAY_WINDOW_DAYS = 15
+
+def get_decay_weight(days_ago: int) -> float:
+    """Return importance weight based on recency"""
+    if days_ago == 0:
+        return 1.0
+    elif days_ago == 1:
+        return 0.8
+    elif days_ago <= 3:
+        return 0.5
+    elif days_ago <= 7:
+        return 0.3
+    elif days_ago <= 14:
+        return 0.1
+    else:
+        return 0.05
+
+def engagement_score(metadata) -> float:
+    """0-10 engagement from HN points / Reddit score plus comment count"""
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            metadata = None
+    if not metadata:
+        return 0.0
+    
+    votes = metadata.get("points") or metadata.get("score") or 0
+    comments = metadata.get("num_comments") or 0
+    total = max(votes, 0) + max(comments, 0)
+    return 10 * min(1.0, math.log1p(total) / math.log1p(RANK_ENGAGEMENT_CAP))
+
+def _days_ago(created_at, today: date) -> int:
+    if not created_at:
+        return DECAY_WINDOW_DAYS
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        except ValueError:
+            return DECAY_WINDOW_DAYS
+    return max(0, (today - created_at.date()).days)
+
+def compute_rank_score(fit_score: int, urgency_score: int, metadata=None,
+                       created_at=None, today: date = None) -> float:
+    """Blend fit, urgency and engagement, then apply recency decay"""
+    today = today or datetime.now().date()
+    base = (
+        RANK_WEIGHTS["fit"] * (fit_score or 0) +
+        RANK_WEIGHTS["urgency"] * (urgency_score or 0) +
+        RANK_WEIGHTS["engagement"] * engagement_score(metadata)
+    )
+    return round(base * get_decay_weight(_days_ago(created_at, today)), 4)
+
+def refresh_rank_scores(conn, post_ids: list = None, full: bool = False) -> int:
+    """Recompute rank_score, return the number of rows that changed
+
+    With no ``post_ids`` only posts inside the decay window are touched
+    (older ones already sit at the floor weight) unless ``full`` is set.
+    """
+    query = """
+        SELECT a.post_id, a.fit_score, a.urgency_score, p.metadata,
+               p.created_at, a.rank_score
+        FROM analysis a
+        JOIN posts p ON p.id = a.post_id
+    """
+    params = []
+    if post_ids:
+        query += f" WHERE a.post_id IN ({', '.join('?' * len(post_ids))})"
+        params = list(post_ids)
+    elif not full:
+        # +1 day so posts crossing into the floor bucket get their last update
+        query += " WHERE p.created_at >= datetime('now', ?)"
+        params = [f'-{DECAY_WINDOW_DAYS + 1} days']
+    
+    today = datetime.now().date()
+    updates = []
+    for post_id, fit, urgency, metadata, created_at, current in conn.execute(query, params):
+        score = compute_rank_score(fit, urgency, metadata, created_at, today)
+        if score != current:
+            updates.append((score, post_id))
+    
+    conn.executemany("UPDATE analysis SET rank_score = ? WHERE post_id = ?", updates)
+    if updates:
+        # Rank-only updates aren't in the changes log
+        bump_generation(conn)
+    return len(updates)
@@ -0,0 +1,168 @@
+"""Compact record types for rows passed between crawlers, db, analysis and digest
+
+Rows used to travel as ``dict(sqlite3.Row)``, which costs a hash table per
+row. These classes use ``__slots__`` so a row is a fixed-size object, and
+they're built directly by a cursor row factory so no intermediate dict is
+ever created. They keep a small dict-like surface (``get``, ``[]``,
+``keys``, ``items``) so existing call sites keep working.
+
+Run ``python -m db.records`` for a memory comparison on a synthetic batch; it
+exits non-zero if records lose their advantage over dict rows.
+"""
+
+
+class Record:
+    """Base class for slotted row records"""
+    __slots__ = ()
+    _fields: tuple = ()
+
+    def __init__(self, *values, **kwargs):
+        for name, value in zip(self._fields, values):
+            object.__setattr__(self, name, value)
+        for name in self._fields[len(values):]:
+            object.__setattr__(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError(f"Unknown fields for {type(self).__name__}: {', '.join(kwargs)}")
+
+    @classmethod
+    def columns(cls, alias: str = None, fields: tuple = None) -> str:
+        """SQL column list in field order, e.g. ``p.id, p.source, ...``"""
+        prefix = f"{alias}." if alias else ""
+        return ", ".join(prefix + f for f in (fields or cls._fields))
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        """sqlite3 row factory; the SELECT must list columns in field order"""
+        return cls(*row)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def keys(self) -> tuple:
+        return self._fields
+
+    def items(self):
+        return ((f, getattr(self, f)) for f in self._fields)
+
+    def to_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self._fields}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __repr__(self):
+        inner = ", ".join(f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({inner})"
+
+
+class Post(Record):
+    """A row of the ``posts`` table"""
+    __slots__ = ("id", "source", "source_id", "title", "body", "url", "author",
+                 "created_at", "crawled_at", "metadata")
+    _fields = __slots__
+
+
+class Analysis(Record):
+    """A row of the ``analysis`` table"""
+    __slots__ = ("id", "post_id", "fit_score", "urgency_score", "use_case",
+                 "reasoning", "problem_summary", "analyzed_at", "model_used",
+                 "rank_score", "prompt_version")
+    _fields = __slots__
+
+
+class Opportunity(Post):
+    """A post joined with its analysis scores (``get_opportunities``)"""
+    __slots__ = ("fit_score", "urgency_score", "use_case", "reasoning",
+                 "problem_summary", "analyzed_at", "rank_score")
+    _fields = Post._fields + __slots__
+    analysis_fields = __slots__
+
+    @classmethod
+    def select(cls, post_alias: str = "p", analysis_alias: str = "a") -> str:
+        """Column list for a posts/analysis join in field order"""
+        return (Post.columns(post_alias) + ", " +
+                cls.columns(analysis_alias, cls.analysis_fields))
+
+
+class Signal(Record):
+    """A scored signal in the daily briefing"""
+    __slots__ = ("title", "url", "source", "fit_score", "urgency_score",
+                 "use_case", "reasoning", "weight")
+    _fields = __slots__
+
+
+# Most a batch of records may peak at, as a share of the same rows as dicts
+# (about 0.7 on a 200k-row batch)
+MAX_PEAK_RATIO = 0.8
+
+
+def _memory_benchmark(n: int = 200_000):
+    """Compare peak memory of dict rows vs slotted records
+
+    Exits non-zero if a record isn't a fixed-size slotted object, or if
+    the batch of records doesn't peak at most ``MAX_PEAK_RATIO`` of the
+    dicts.
+    """
+    import sqlite3
+    import sys
+    import tracemalloc
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE posts ({Post.columns()})")
+    conn.executemany(
+        f"INSERT INTO posts VALUES ({', '.join('?' * len(Post._fields))})",
+        ((f"hn_{i}", "hn", str(i), f"Title {i}", f"Body text for post {i}",
+          f"https://news.ycombinator.com/item?id={i}", f"user{i % 997}",
+          "2026-01-01 00:00:00", "2026-01-01 00:00:00", '{"points": 3}')
+         for i in range(n))
+    )
+    sql = f"SELECT {Post.columns()} FROM posts"
+
+    def measure(build):
+        tracemalloc.start()
+        rows = build()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(rows) == n
+        return peak
+
+    def as_dicts():
+        conn.row_factory = sqlite3.Row
+        rows = [dict(r) for r in conn.execute(sql).fetchall()]
+        conn.row_factory = None
+        return rows
+
+    def as_records():
+        cursor = conn.execute(sql)
+        cursor.row_factory = Post.row_factory
+        return cursor.fetchall()
+
+    dict_peak = measure(as_dicts)
+    record_peak = measure(as_records)
+    print(f"{n} rows")
+    print(f"  dict(sqlite3.Row): {dict_peak / 1e6:8.1f} MB peak")
+    print(f"  Post records:      {record_peak / 1e6:8.1f} MB peak")
+    print(f"  reduction:         {(1 - record_peak / dict_peak) * 100:8.1f}%")
+
+    record = as_records()[0]
+    # One pointer per field on top of a bare object, and no per-instance __dict__
+    size_bound = sys.getsizeof(Record()) + 8 * len(Post._fields)
+    if hasattr(record, "__dict__") or sys.getsizeof(record) > size_bound:
+        raise SystemExit(f"Post record is {sys.getsizeof(record)} bytes, expected at most {size_bound}")
+    if record_peak > dict_peak * MAX_PEAK_RATIO:
+        raise SystemExit(f"Records peaked at {record_peak / dict_peak:.0%} of dict rows, "
+                         f"expected at most {MAX_PEAK_RATIO:.0%}")
+
+
+if __name__ == "__main__":
+    _memory_benchmark()
@@ -26,25 +26,80 @@ CREATE TABLE IF NOT EXISTS analysis (
     problem_summary TEXT,
     analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     model_used TEXT,
+    rank_score REAL NOT NULL DEFAULT 0,  -- fit/urgency/engagement blend with recency decay
+    prompt_version TEXT,  -- hash of the prompt templates (analysis.PROMPT_VERSION etc.)
     UNIQUE(post_id)
 );
 
--- Problem taxonomy categories
+-- Earlier analyses of a post, superseded by a re-score (analysis.rescore)
+CREATE TABLE IF NOT EXISTS analysis_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id TEXT NOT NULL REFERENCES posts(id),
+    fit_score INTEGER,
+    urgency_score INTEGER,
+    use_case TEXT,
+    reasoning TEXT,
+    problem_summary TEXT,
+    model_used TEXT,
+    prompt_version TEXT,
+    analyzed_at TIMESTAMP,
+    superseded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keyword tags from market-analysis/keywords.json (crawlers.tagger)
+CREATE TABLE IF NOT EXISTS post_tags (
+    post_id TEXT NOT NULL REFERENCES posts(id),
+    category TEXT NOT NULL,  -- e.g. 'competitor_brands', 'buying_signals'
+    tag TEXT NOT NULL COLLATE NOCASE,  -- group within the category, e.g. 'observability'
+    keyword TEXT NOT NULL COLLATE NOCASE,  -- as written in keywords.json, e.g. 'Splunk'
+    PRIMARY KEY (post_id, category, keyword)
+);
+CREATE INDEX IF NOT EXISTS idx_post_tags_keyword ON post_tags(category, keyword);
+CREATE INDEX IF NOT EXISTS idx_post_tags_tag ON post_tags(category, tag);
+
+-- Version (hash) of keywords.json each post was last tagged with
+CREATE TABLE IF NOT EXISTS post_tag_versions (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    version TEXT NOT NULL
+);
+
+-- Problem taxonomy categories: the PROBLEM_CATEGORIES seeds plus clusters
+-- discovered by analysis.clusters
 CREATE TABLE IF NOT EXISTS categories (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT UNIQUE NOT NULL,
     description TEXT,
     parent_category TEXT,
     first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    post_count INTEGER DEFAULT 0
+    post_count INTEGER DEFAULT 0,
+    last_seen TIMESTAMP,
+    centroid BLOB,  -- float32 unit vector in the embedding space
+    weight REAL DEFAULT 0  -- posts behind the centroid (seeds start above 0)
 );
 
 -- Many-to-many: posts to categories
 CREATE TABLE IF NOT EXISTS post_categories (
     post_id TEXT REFERENCES posts(id),
     category_id INTEGER REFERENCES categories(id),
+    similarity REAL,  -- cosine to the centroid when assigned; NULL once re-embedded
     PRIMARY KEY(post_id, category_id)
 );
+CREATE INDEX IF NOT EXISTS idx_post_categories_category ON post_categories(category_id);
+
+-- Mini-batches of the incremental clustering; the latest last_row is where the next run starts
+CREATE TABLE IF NOT EXISTS cluster_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    last_row INTEGER NOT NULL,
+    assigned INTEGER DEFAULT 0,
+    spawned INTEGER DEFAULT 0,
+    run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Novel posts waiting for enough similar ones to start a cluster together
+CREATE TABLE IF NOT EXISTS cluster_candidates (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Pattern tracking over time
 CREATE TABLE IF NOT EXISTS patterns (
@@ -63,7 +118,152 @@ CREATE TABLE IF NOT EXISTS digests (
     digest_date DATE,
     content TEXT,
     opportunities_count INTEGER,
-    new_patterns TEXT
+    new_patterns TEXT,
+    uid TEXT  -- replication key; id is local to each machine
+);
+
+-- Worst-case cost of LLM requests in flight (analysis.budget). Dropped once the call's
+-- llm_calls row is written; provider batch jobs keep theirs, settled to the actual cost.
+CREATE TABLE IF NOT EXISTS budget_holds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    purpose TEXT NOT NULL,
+    model TEXT,
+    batch_id INTEGER REFERENCES analysis_batches(id),
+    tokens INTEGER NOT NULL,
+    cost REAL NOT NULL DEFAULT 0,
+    settled INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_budget_holds_created ON budget_holds(created_at);
+CREATE INDEX IF NOT EXISTS idx_budget_holds_batch ON budget_holds(batch_id);
+
+-- Provider batch jobs for offline analysis (analyze --batch)
+CREATE TABLE IF NOT EXISTS analysis_batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    backend TEXT NOT NULL,  -- 'anthropic', 'openai', 'local'
+    remote_id TEXT,  -- provider batch id, NULL until submitted
+    status TEXT NOT NULL DEFAULT 'submitting',  -- 'submitting', 'submitted', 'ingested', 'failed'
+    model TEXT,
+    request_count INTEGER DEFAULT 0,
+    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    error TEXT,
+    idempotency_key TEXT  -- sent with the job (custom_id prefix / metadata) to find it after a crash
+);
+
+-- Posts included in each batch job
+CREATE TABLE IF NOT EXISTS analysis_batch_items (
+    batch_id INTEGER NOT NULL REFERENCES analysis_batches(id),
+    post_id TEXT NOT NULL REFERENCES posts(id),
+    PRIMARY KEY(batch_id, post_id)
+);
+
+-- LLM responses keyed by normalized post text, prompt version and model
+CREATE TABLE IF NOT EXISTS llm_cache (
+    text_hash TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,  -- parsed result as JSON
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used REAL NOT NULL,  -- unix time, for LRU eviction
+    PRIMARY KEY(text_hash, prompt_version, model)
+);
+
+-- Pre-filter decisions; rejected posts that weren't sampled never reach the LLM
+CREATE TABLE IF NOT EXISTS gate_decisions (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    score REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    sampled INTEGER NOT NULL DEFAULT 0,  -- rejected but sent anyway for drift monitoring
+    model_version TEXT,
+    decided_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Posts whose analysis failed: retried with backoff, 'dead' after too many attempts
+CREATE TABLE IF NOT EXISTS analysis_failures (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    attempts INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'retrying',  -- 'retrying' or 'dead'
+    last_error TEXT,
+    first_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    next_retry_at TIMESTAMP
+);
+
+-- Thread-level summaries from thread analysis mode (analysis.threads)
+CREATE TABLE IF NOT EXISTS thread_summaries (
+    thread_id TEXT PRIMARY KEY,  -- id of the post that started the thread
+    root_post_id TEXT REFERENCES posts(id),  -- NULL if the original post wasn't crawled
+    post_count INTEGER DEFAULT 0,  -- posts scored in thread requests
+    summary TEXT,
+    fit_score INTEGER,
+    model_used TEXT,
+    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fixed labeled set for offline evaluation of candidate models/prompts (analysis.evaluate)
+CREATE TABLE IF NOT EXISTS eval_set (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    fit_score INTEGER,
+    urgency_score INTEGER,
+    use_case TEXT,
+    label_model TEXT,
+    label_prompt_version TEXT,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS eval_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT,
+    model TEXT,
+    prompt_version TEXT,
+    metrics JSON,  -- agreement, cost and latency (analysis.evaluate.evaluate)
+    run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Row of each post's vector in the embedding matrix (analysis.embeddings)
+CREATE TABLE IF NOT EXISTS embeddings (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    row INTEGER NOT NULL UNIQUE,
+    with_summary INTEGER DEFAULT 0,  -- problem summary blended in
+    embedded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-profile scores from the same call as the main analysis (PRODUCT_PROFILES)
+CREATE TABLE IF NOT EXISTS profile_scores (
+    post_id TEXT NOT NULL REFERENCES posts(id),
+    profile TEXT NOT NULL,
+    fit_score INTEGER,
+    urgency_score INTEGER,
+    use_case TEXT,
+    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY(post_id, profile)
+);
+
+-- Prior value of pending posts, orders the analysis queue (analysis.priority)
+CREATE TABLE IF NOT EXISTS post_priors (
+    post_id TEXT PRIMARY KEY REFERENCES posts(id),
+    score REAL NOT NULL,  -- 0-1
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per LLM API call (analysis.telemetry)
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    called_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    purpose TEXT NOT NULL,  -- 'analysis', 'batch', 'briefing'
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    outcome TEXT NOT NULL,  -- 'ok', 'error', 'overloaded', 'cancelled'
+    latency_ms INTEGER,  -- NULL for batch API results
+    input_tokens INTEGER NOT NULL DEFAULT 0,  -- uncached input
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL,  -- NULL if the model has no MODEL_PRICING entry
+    error TEXT
 );
 
 -- Indexes for performance
@@ -72,3 +272,101 @@ CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_at);
 CREATE INDEX IF NOT EXISTS idx_analysis_fit ON analysis(fit_score DESC);
 CREATE INDEX IF NOT EXISTS idx_analysis_urgency ON analysis(urgency_score DESC);
 CREATE INDEX IF NOT EXISTS idx_analysis_usecase ON analysis(use_case);
+CREATE INDEX IF NOT EXISTS idx_analysis_rank ON analysis(rank_score DESC);
+CREATE INDEX IF NOT EXISTS idx_batch_items_post ON analysis_batch_items(post_id);
+CREATE INDEX IF NOT EXISTS idx_batches_status ON analysis_batches(status);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_used ON llm_cache(last_used);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_called ON llm_calls(called_at);
+CREATE INDEX IF NOT EXISTS idx_profile_scores_fit ON profile_scores(profile, fit_score DESC);
+CREATE INDEX IF NOT EXISTS idx_analysis_history_post ON analysis_history(post_id);
+
+-- Row-level changelog for incremental replication between machines
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    op TEXT NOT NULL,  -- 'upsert', 'delete'
+    origin TEXT,  -- NULL for local writes, peer name for applied changes
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bumped by writes the changes log leaves out (rank refreshes, re-tagging), so
+-- db.cache can tell a cached query result is stale
+CREATE TABLE IF NOT EXISTS write_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO write_generation (id, value) VALUES (1, 0);
+
+-- Highest change seq deleted by db.sync.prune_changes; incremental exports
+-- from before it fall back to a full snapshot
+CREATE TABLE IF NOT EXISTS changes_pruned (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    through_seq INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO changes_pruned (id, through_seq) VALUES (1, 0);
+
+-- Replication watermarks per peer: last_seq is how far we've applied the
+-- peer's changes, acked_seq how far the peer has applied ours
+CREATE TABLE IF NOT EXISTS sync_peers (
+    peer TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    acked_seq INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS posts_log_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('posts', NEW.id, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS posts_log_update AFTER UPDATE ON posts BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('posts', NEW.id, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS posts_log_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('posts', OLD.id, 'delete');
+END;
+
+CREATE TRIGGER IF NOT EXISTS analysis_log_insert AFTER INSERT ON analysis BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('analysis', NEW.post_id, 'upsert');
+END;
+-- rank_score is derived and recomputed locally, so rank-only updates aren't logged.
+-- Recreated: it used to miss prompt_version.
+DROP TRIGGER IF EXISTS analysis_log_update;
+CREATE TRIGGER analysis_log_update
+AFTER UPDATE OF post_id, fit_score, urgency_score, use_case, reasoning,
+                problem_summary, analyzed_at, model_used, prompt_version ON analysis BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('analysis', NEW.post_id, 'upsert');
+END;
+CREATE TRIGGER IF NOT EXISTS analysis_log_delete AFTER DELETE ON analysis BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('analysis', OLD.post_id, 'delete');
+END;
+
+-- Digests replicate by uid. Rows inserted without one get a random uid,
+-- which the update trigger then logs.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_digests_uid ON digests(uid);
+CREATE TRIGGER IF NOT EXISTS digests_assign_uid AFTER INSERT ON digests
+WHEN NEW.uid IS NULL BEGIN
+    UPDATE digests SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id;
+END;
+-- Recreated: they used to log the local id
+DROP TRIGGER IF EXISTS digests_log_insert;
+DROP TRIGGER IF EXISTS digests_log_update;
+DROP TRIGGER IF EXISTS digests_log_delete;
+CREATE TRIGGER digests_log_insert AFTER INSERT ON digests WHEN NEW.uid IS NOT NULL BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('digests', NEW.uid, 'upsert');
+END;
+CREATE TRIGGER digests_log_update AFTER UPDATE ON digests WHEN NEW.uid IS NOT NULL BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('digests', NEW.uid, 'upsert');
+END;
+CREATE TRIGGER digests_log_delete AFTER DELETE ON digests WHEN OLD.uid IS NOT NULL BEGIN
+    INSERT INTO changes (table_name, row_key, op) VALUES ('digests', OLD.uid, 'delete');
+END;
+-- Digests from before uids: derived from their content alone (content_hash is
+-- registered by init_db), so every machine gives the same digest the same uid.
+-- Earlier legacy uids used the local id; copies they kept apart are merged.
+DELETE FROM digests
+WHERE (uid IS NULL OR uid LIKE 'legacy-%')
+  AND id NOT IN (SELECT MIN(id) FROM digests WHERE uid IS NULL OR uid LIKE 'legacy-%'
+                 GROUP BY sent_at, content_hash(content));
+UPDATE digests SET uid = 'legacy-' || sent_at || '-' || content_hash(content)
+WHERE (uid IS NULL OR uid LIKE 'legacy-%')
+  AND uid IS NOT 'legacy-' || sent_at || '-' || content_hash(content);
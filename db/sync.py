@@ -0,0 +1,232 @@
+"""Incremental replication of the crawler database between machines
+
+Triggers in schema.sql append every insert/update/delete on ``posts``,
+``analysis`` and ``digests`` to the ``changes`` table. ``export_changes``
+writes the rows changed after a sequence number as JSON lines and
+``apply_changes`` upserts them on another machine, so a laptop or a second
+crawler node only moves new rows instead of the whole SQLite file.
+
+Conflicts are resolved by primary key: an incoming row replaces the local
+row with the same key. ``analysis`` is keyed by ``post_id`` and ``digests``
+by ``uid``, because their integer ``id`` is a local surrogate that differs
+between machines. An analysis carries its ``profile_scores`` rows, which
+come from the same LLM answer and can't be recomputed. Data derived
+locally is rebuilt as rows are applied: posts are tagged (``post_tags``)
+with this machine's keyword file and analyses re-ranked. Embeddings are
+left to ``embed_pending``, which picks up any post without one.
+
+An export for a named peer ``--since N`` tells us that peer has applied our
+changes up to N (``sync_peers.acked_seq``). Changes every such peer has
+applied are then pruned. An incremental export from before the pruned
+point can't be answered from the log, so it becomes a full snapshot.
+"""
+import json
+from typing import Iterable, TextIO
+
+from db import get_connection, refresh_rank_scores, _insert_post_tags, _insert_profile_scores
+
+# Replicated tables and the column rows are matched on
+SYNC_TABLES = {
+    "posts": "id",
+    "analysis": "post_id",
+    "digests": "uid",
+}
+
+# Columns that are local to one database and never copied
+LOCAL_COLUMNS = {
+    "analysis": {"id"},
+    "digests": {"id"},
+}
+
+def _row_payload(conn, table: str, key) -> dict:
+    """Current contents of a replicated row, or None if it's gone"""
+    key_column = SYNC_TABLES[table]
+    row = conn.execute(
+        f"SELECT * FROM {table} WHERE {key_column} = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    skip = LOCAL_COLUMNS.get(table, set())
+    payload = {k: row[k] for k in row.keys() if k not in skip}
+    if table == "analysis":
+        payload["profiles"] = {
+            s["profile"]: {"fit_score": s["fit_score"], "urgency_score": s["urgency_score"],
+                           "use_case": s["use_case"]}
+            for s in conn.execute("SELECT * FROM profile_scores WHERE post_id = ?", (key,))
+        }
+    return payload
+
+def prune_changes(conn) -> int:
+    """Delete changes every acknowledging peer has applied, return how many"""
+    floor = conn.execute("SELECT MIN(acked_seq) FROM sync_peers WHERE acked_seq > 0").fetchone()[0]
+    if not floor:
+        return 0
+    pruned = conn.execute("DELETE FROM changes WHERE seq <= ?", (floor,)).rowcount
+    conn.execute("UPDATE changes_pruned SET through_seq = MAX(through_seq, ?) WHERE id = 1", (floor,))
+    return pruned
+
+def export_changes(out: TextIO, since: int = 0, skip_origin: str = None, peer: str = None) -> dict:
+    """Write changes after ``since`` as JSON lines, return export stats
+
+    ``since=0`` exports a full snapshot of the replicated tables, which also
+    covers rows written before the changelog existed. Only the latest
+    change per row is exported. ``skip_origin`` leaves out rows that were
+    applied from that peer so they aren't echoed back to it. ``peer`` names
+    the machine the export is for: it has applied everything up to
+    ``since``, and changes all peers have applied are pruned afterwards.
+    """
+    stats = {"since": since, "until": since, "upserts": 0, "deletes": 0, "snapshot": since <= 0,
+             "pruned": 0}
+
+    with get_connection() as conn:
+        if peer and since > 0:
+            conn.execute("""
+                INSERT INTO sync_peers (peer, acked_seq) VALUES (?, ?)
+                ON CONFLICT(peer) DO UPDATE SET acked_seq = MAX(acked_seq, excluded.acked_seq)
+            """, (peer, since))
+            stats["pruned"] = prune_changes(conn)
+        pruned_through = conn.execute("SELECT through_seq FROM changes_pruned").fetchone()[0]
+        if 0 < since < pruned_through:
+            # Changes the peer is missing were pruned; only the tables have them now
+            since = 0
+            stats["snapshot"] = True
+
+        until = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        stats["until"] = max(until, since, pruned_through)
+        out.write(json.dumps({"type": "header", "since": since, "until": stats["until"]}) + "\n")
+
+        if since <= 0:
+            for table, key_column in SYNC_TABLES.items():
+                for (key,) in conn.execute(f"SELECT {key_column} FROM {table}").fetchall():
+                    row = _row_payload(conn, table, key)
+                    out.write(json.dumps({
+                        "type": "change", "seq": stats["until"], "table": table,
+                        "op": "upsert", "key": key, "row": row,
+                    }, default=str) + "\n")
+                    stats["upserts"] += 1
+            return stats
+
+        params = [since]
+        origin_filter = ""
+        if skip_origin:
+            origin_filter = "AND (c.origin IS NULL OR c.origin != ?)"
+            params.append(skip_origin)
+
+        rows = conn.execute(f"""
+            SELECT c.seq, c.table_name, c.row_key, c.op
+            FROM changes c
+            JOIN (
+                SELECT table_name, row_key, MAX(seq) AS seq
+                FROM changes WHERE seq > ?
+                GROUP BY table_name, row_key
+            ) latest ON c.seq = latest.seq
+            WHERE 1 = 1 {origin_filter}
+            ORDER BY c.seq
+        """, params).fetchall()
+
+        for seq, table, key, op in rows:
+            if table not in SYNC_TABLES:
+                continue
+            row = _row_payload(conn, table, key) if op == "upsert" else None
+            if row is None:
+                op = "delete"
+            out.write(json.dumps({
+                "type": "change", "seq": seq, "table": table,
+                "op": op, "key": key, "row": row,
+            }, default=str) + "\n")
+            stats["upserts" if op == "upsert" else "deletes"] += 1
+
+    return stats
+
+def _upsert(conn, table: str, row: dict):
+    key_column = SYNC_TABLES[table]
+    skip = LOCAL_COLUMNS.get(table, set()) | {"profiles"}
+    columns = [c for c in row if c not in skip]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key_column)
+    conn.execute(f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT({key_column}) DO UPDATE SET {updates}
+    """, [row[c] for c in columns])
+    # Exports from before profiles were carried leave the local ones alone
+    if table == "analysis" and "profiles" in row:
+        conn.execute("DELETE FROM profile_scores WHERE post_id = ?", (row["post_id"],))
+        _insert_profile_scores(conn, row["post_id"], row["profiles"])
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def apply_changes(lines: Iterable[str], peer: str = None) -> dict:
+    """Apply an export from ``export_changes`` in one transaction
+
+    Changes logged by the applied rows are tagged with ``peer`` as their
+    origin, and the export's upper sequence number is stored as that peer's
+    watermark for the next ``--since``. Applied posts are tagged and
+    applied analyses re-ranked in the same transaction.
+    """
+    from crawlers.tagger import get_tagger, post_texts
+
+    tagger = get_tagger()
+    stats = {"upserts": 0, "deletes": 0, "until": None}
+    ranked = set()
+
+    with get_connection() as conn:
+        before = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            change = json.loads(line)
+
+            if change.get("type") == "header":
+                stats["until"] = change.get("until")
+                continue
+
+            table = change["table"]
+            if table not in SYNC_TABLES:
+                continue
+
+            if change["op"] == "delete":
+                conn.execute(
+                    f"DELETE FROM {table} WHERE {SYNC_TABLES[table]} = ?", (change["key"],)
+                )
+                stats["deletes"] += 1
+            else:
+                row = change["row"]
+                _upsert(conn, table, row)
+                stats["upserts"] += 1
+                if table == "posts":
+                    _insert_post_tags(conn, row["id"], tagger.version,
+                                      tagger.tag(*post_texts(row.get("title"), row.get("body"),
+                                                             row.get("metadata"))))
+                    ranked.add(row["id"])
+                elif table == "analysis":
+                    ranked.add(row["post_id"])
+
+        # Engagement and decay feed the rank, so re-rank analysed posts either way
+        for post_ids in _chunks(sorted(ranked), 500):
+            refresh_rank_scores(conn, post_ids=post_ids)
+
+        if peer:
+            conn.execute(
+                "UPDATE changes SET origin = ? WHERE seq > ?", (peer, before)
+            )
+            if stats["until"] is not None:
+                conn.execute("""
+                    INSERT INTO sync_peers (peer, last_seq, synced_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(peer) DO UPDATE SET
+                        last_seq = excluded.last_seq, synced_at = excluded.synced_at
+                """, (peer, stats["until"]))
+
+    return stats
+
+def get_peer_watermark(peer: str) -> int:
+    """Last sequence number applied from a peer (0 if never synced)"""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT last_seq FROM sync_peers WHERE peer = ?", (peer,)
+        ).fetchone()
+        return row[0] if row else 0
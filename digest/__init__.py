@@ -38,12 +38,12 @@ def generate_digest(days: int = 1) -> Tuple[str, dict]:
     if top_opps:
         lines.append("🔥 **Top Opportunities**\n")
         for i, opp in enumerate(top_opps[:10], 1):
-            fit = opp.get('fit_score', 0)
-            urgency = opp.get('urgency_score', 0)
-            use_case = opp.get('use_case', 'other')
-            summary = (opp.get('problem_summary') or '')[:100]
-            url = opp.get('url', '')
-            source = opp.get('source', 'unknown')
+            fit = opp.fit_score or 0
+            urgency = opp.urgency_score or 0
+            use_case = opp.use_case or 'other'
+            summary = (opp.problem_summary or '')[:100]
+            url = opp.url or ''
+            source = opp.source or 'unknown'
             
             lines.append(f"**{i}. [{source.upper()}] {use_case}** (fit:{fit}/urg:{urgency})")
             lines.append(f"   {summary}")
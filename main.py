@@ -3,9 +3,12 @@
 
 Usage:
     python main.py crawl      # Crawl all sources
-    python main.py analyze    # Run AI analysis
+    python main.py analyze    # Run AI analysis (--async: concurrent, --batched: many posts per call,
+                              #   --threads: one call per discussion thread,
+                              #   --batch [--backend=local]: provider batch API, run again to ingest)
     python main.py digest     # Generate and send daily digest
-    python main.py full       # Full pipeline: crawl + analyze + digest
+    python main.py rerank     # Recompute time-decayed lead rank scores
+    python main.py full       # Full pipeline: crawl + analyze + rerank + cluster + digest
     python main.py query ...  # Query opportunities (pass to CLI)
 """
 import sys
@@ -16,7 +19,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from datetime import datetime
-from db import init_db, get_stats
+from db import init_db, get_stats, refresh_rankings
 from config.settings import TELEGRAM_USER_ID
 
 def run_crawl(days_back: int = 1):
@@ -35,12 +38,15 @@ def run_crawl(days_back: int = 1):
     
     return {"hn": hn_stats, "reddit": reddit_stats}
 
-def run_analysis(batch_size: int = 100):
+def run_analysis(batch_size: int = 100, concurrent: bool = False, batched: bool = False,
+                 threads: bool = False):
     """Run AI analysis on unanalyzed posts"""
     from analysis import run_analysis as analyze
     
-    print(f"[{datetime.now()}] Running analysis (batch_size={batch_size})")
-    stats = analyze(batch_size=batch_size)
+    print(f"[{datetime.now()}] Running analysis (batch_size={batch_size}, "
+          f"concurrent={concurrent}, batched={batched}, threads={threads})")
+    stats = analyze(batch_size=batch_size, concurrent=concurrent, batched=batched,
+                    threads=threads)
     print(f"  Analysis: {stats}")
     return stats
 
@@ -79,6 +85,14 @@ def run_full_pipeline(days_back: int = 1, batch_size: int = 100, send_telegram:
     # Analyze
     analysis_stats = run_analysis(batch_size=batch_size)
     
+    # Re-rank for time decay
+    reranked = refresh_rankings()
+    print(f"[{datetime.now()}] Re-ranked {reranked} leads")
+    
+    # Embed new posts (gtm similar) and assign them to problem categories
+    from analysis.clusters import cluster_pending
+    print(f"[{datetime.now()}] Clustering: {cluster_pending()}")
+    
     # Digest
     digest = run_digest(send_telegram=send_telegram)
     
@@ -102,6 +116,8 @@ def main():
         sys.exit(1)
     
     command = sys.argv[1]
+    args = [a for a in sys.argv[2:] if not a.startswith("--")]
+    flags = [a for a in sys.argv[2:] if a.startswith("--")]
     
     # Initialize DB for all commands
     init_db()
@@ -110,9 +126,20 @@ def main():
         days = int(sys.argv[2]) if len(sys.argv) > 2 else 1
         run_crawl(days_back=days)
     
+    elif command == "analyze" and "--batch" in flags:
+        from analysis.batch_jobs import run_batch_analysis
+        batch = int(args[0]) if args else 1000
+        backend = next((f.split("=", 1)[1] for f in flags if f.startswith("--backend=")), None)
+        print(f"[{datetime.now()}] Batch analysis: {run_batch_analysis(batch_size=batch, backend=backend)}")
+    
     elif command == "analyze":
-        batch = int(sys.argv[2]) if len(sys.argv) > 2 else 100
-        run_analysis(batch_size=batch)
+        batch = int(args[0]) if args else 100
+        run_analysis(batch_size=batch, concurrent="--async" in flags,
+                     batched="--batched" in flags, threads="--threads" in flags)
+    
+    elif command == "rerank":
+        full = "--full" in flags
+        print(f"Re-ranked {refresh_rankings(full=full)} leads")
     
     elif command == "digest":
         run_digest(send_telegram=True)